@@ -11,9 +11,9 @@ from django.contrib import admin
 # === Importing Models ===
 from .models import (
     Client, Sample, ParameterGroup, Parameter, TestAssignment, TestResult,
-    QCMetrics, Reagent, ReagentUsage, ReagentIssue, Expense
+    QCMetrics, Reagent, ReagentUsage, ReagentIssue, Expense, ReportSchedule, ReportDispatchJob
 )
-from .models.equipment import Equipment, CalibrationRecord
+from .models.equipment import Equipment, CalibrationRecord, InstrumentImportProfile
 from .models.ai import LabAIHistory
 
 
@@ -127,6 +127,15 @@ class EquipmentAdmin(admin.ModelAdmin):
     search_fields = ('name', 'serial_number', 'model')
 
 
+@admin.register(InstrumentImportProfile)
+class InstrumentImportProfileAdmin(admin.ModelAdmin):
+    """
+    Column mapping used to import each instrument's exported result files.
+    """
+    list_display = ('equipment', 'sample_code_column', 'value_column', 'header_row', 'delimiter')
+    search_fields = ('equipment__name', 'equipment__serial_number')
+
+
 @admin.register(CalibrationRecord)
 class CalibrationAdmin(admin.ModelAdmin):
     """
@@ -179,3 +188,26 @@ class ExpenseAdmin(admin.ModelAdmin):
     list_filter = ("category", "date")
     search_fields = ("description", "note")
     date_hierarchy = "date"
+
+
+# ------------------------------------------------------------------------------------------------
+# Manager Report Delivery Admin
+# ------------------------------------------------------------------------------------------------
+@admin.register(ReportSchedule)
+class ReportScheduleAdmin(admin.ModelAdmin):
+    """
+    Recurring manager report emails (daily/weekly/monthly) and their recipients.
+    """
+    list_display = ("name", "frequency", "range_type", "recipients", "is_active", "last_sent_on")
+    list_filter = ("frequency", "is_active")
+    readonly_fields = ("last_sent_on", "created_at")
+
+
+@admin.register(ReportDispatchJob)
+class ReportDispatchJobAdmin(admin.ModelAdmin):
+    """
+    Read-only log of manager report emails sent in the background.
+    """
+    list_display = ("created_at", "range_type", "recipients", "status", "attempts", "schedule", "requested_by")
+    list_filter = ("status", "range_type")
+    readonly_fields = [f.name for f in ReportDispatchJob._meta.fields]
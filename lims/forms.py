@@ -6,6 +6,8 @@ custom forms for dynamic parameter selection and result entry.
 
 """
 
+import os
+
 from django import forms
 from decimal import Decimal, ROUND_HALF_UP
 from itertools import groupby
@@ -20,6 +22,7 @@ from lims.models import QCMetrics, Reagent, ReagentUsage, ReagentRequest, Reagen
 from .models.reagents import InventoryAudit, ReagentRequestItem
 from .models.coa import COAInterpretation
 from .models import Equipment, CalibrationRecord
+from .utils.instrument_import import SUPPORTED_EXTENSIONS
 
 # ------------------------------------------------------------------------------------------------
 # Expense Form
@@ -380,6 +383,37 @@ class TestEnvironmentForm(forms.ModelForm):
         return cleaned
 
 
+# ------------------------------------------------------------------------------------------------
+# Instrument Import Form
+# ------------------------------------------------------------------------------------------------
+class InstrumentImportForm(forms.Form):
+    """
+    Upload of an instrument's exported results (CSV, TSV or XLSX) for a batch.
+    Only active instruments with an import profile that support the batch's
+    parameter can be chosen.
+    """
+    file = forms.FileField(label="Instrument export")
+    instrument = forms.ModelChoiceField(queryset=Equipment.objects.none(), label="Instrument")
+    temperature = forms.DecimalField(max_digits=5, decimal_places=2, label="Temperature (°C)")
+    humidity = forms.DecimalField(max_digits=5, decimal_places=2, label="Humidity (%)")
+
+    def __init__(self, *args, parameter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        instruments = Equipment.objects.filter(is_active=True, import_profile__isnull=False)
+        if parameter is not None:
+            instruments = instruments.filter(parameters_supported=parameter)
+        self.fields["instrument"].queryset = instruments.select_related("import_profile")
+
+    def clean_file(self):
+        upload = self.cleaned_data["file"]
+        extension = os.path.splitext(upload.name)[1].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise forms.ValidationError(
+                f"Unsupported file type. Use one of: {', '.join(sorted(SUPPORTED_EXTENSIONS))}."
+            )
+        return upload
+
+
 # ------------------------------------------------------------------------------------------------
 # COA Forms
 # ------------------------------------------------------------------------------------------------
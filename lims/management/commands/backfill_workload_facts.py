@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.db.models.functions import TruncDate
+
+from lims.models import TestAssignment
+from lims.utils.workload_facts import rebuild_expenses, rebuild_facts
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyWorkloadFact and DailyExpenseTotal tables behind the manager report"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD); defaults to the first assignment")
+        parser.add_argument("--end", help="Last day to rebuild (YYYY-MM-DD); defaults to the last assignment")
+        parser.add_argument("--days", type=int, default=31, help="Days rebuilt per transaction")
+
+    def _parse(self, value):
+        try:
+            return date.fromisoformat(value) if value else None
+        except ValueError:
+            raise CommandError(f"Invalid date {value!r}; expected YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        bounds = (
+            TestAssignment.objects.filter(is_control=False)
+            .annotate(day=TruncDate("assigned_date"))
+            .aggregate(first=Min("day"), last=Max("day"))
+        )
+        start = self._parse(options["start"]) or bounds["first"]
+        end = self._parse(options["end"]) or bounds["last"]
+
+        expense_days = rebuild_expenses(self._parse(options["start"]), self._parse(options["end"]))
+        self.stdout.write(f"Expense totals rebuilt: {expense_days} day(s)")
+
+        if not start or not end:
+            self.stdout.write("No test assignments to aggregate.")
+            return
+
+        step = timedelta(days=max(1, options["days"]))
+        written = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + step - timedelta(days=1), end)
+            written += rebuild_facts(chunk_start, chunk_end)
+            self.stdout.write(f"  {chunk_start} – {chunk_end}: {written} fact row(s) so far")
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"Workload facts rebuilt for {start} – {end}: {written} row(s) ✅"))
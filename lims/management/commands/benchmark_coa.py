@@ -0,0 +1,177 @@
+import json
+import platform
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from lims.models import (
+    Client, Parameter, ParameterGroup, Sample, SampleStatus, TestAssignment, TestEnvironment, TestResult,
+)
+from lims.utils import pdf_assets
+from lims.utils.coa_dataset import CoaDataset
+from lims.utils.coa_render import coa_pdf_context
+from lims.utils.coa_utils import split_samples_by_accreditation
+
+User = get_user_model()
+
+PROXIMATE = [
+    ("Moisture", "%", "Oven (AOAC 930.15 2000)", (8, 13)),
+    ("Ash", "%", "Furnace (AOAC 942.05, 2000)", (2, 8)),
+    ("Crude Fibre", "%", "AOAC 978.10, 2000", (2, 7)),
+    ("Crude Fat", "%", "Soxhlet Extraction (AOAC 920.39)", (2, 9)),
+    ("Protein", "%", "Kjeldahl (AOAC 942.05 2000)", (10, 35)),
+]
+# Two parameters in every other accredited group plus a few unaccredited ones
+OTHER_GROUPS = [
+    "Gross Energy", "Vitamins & Contaminants", "Aflatoxin", "Fiber", "Fiber Fractions",
+    "Oil Analysis", "Minerals", "Microbiology",
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark COA preparation and rendering on synthetic clients and write a JSON report"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,100,500", help="Comma-separated sample counts, one synthetic client each")
+        parser.add_argument("--output", default="coa_benchmark.json", help="Where to write the JSON report")
+        parser.add_argument("--skip-pdf", action="store_true", help="Skip the write_pdf stage")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for result values")
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options["sizes"].split(",") if s.strip()]
+        random.seed(options["seed"])
+
+        report = {
+            "generated_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "sizes": {},
+        }
+
+        # Everything is seeded inside one transaction that is rolled back
+        try:
+            with transaction.atomic():
+                parameters = self._seed_parameters()
+                analyst = User.objects.create(username=f"coa-bench-{random.randint(0, 10**9)}")
+                for size in sizes:
+                    client = self._seed_client(size, parameters, analyst)
+                    self.stdout.write(f"Benchmarking {size} samples…")
+                    report["sizes"][str(size)] = self._run(client, skip_pdf=options["skip_pdf"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        with open(options["output"], "w") as fh:
+            json.dump(report, fh, indent=2)
+
+        for size, stages in report["sizes"].items():
+            line = "  ".join(f"{stage} {m['ms']:.1f}ms/{m['queries']}q/{m['peak_kb']:.0f}KB" for stage, m in stages.items())
+            self.stdout.write(f"{size:>5} samples: {line}")
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']} ✅"))
+
+    # ------------------------------------------------------------------ seeding
+
+    def _seed_parameters(self):
+        parameters = []
+        proximate = ParameterGroup.objects.create(name="Proximate")
+        for name, unit, method, bounds in PROXIMATE:
+            parameters.append((Parameter(
+                group=proximate, name=name, unit=unit, method=method, ref_limit="-", default_price=Decimal("4000"),
+            ), bounds))
+        for group_name in OTHER_GROUPS:
+            group = ParameterGroup.objects.create(name=group_name)
+            for i in range(2):
+                parameters.append((Parameter(
+                    group=group, name=f"{group_name} {i + 1}", unit="mg/kg", method="In-house method",
+                    ref_limit="-", default_price=Decimal("3000"),
+                ), (0, 100)))
+        Parameter.objects.bulk_create([p for p, _ in parameters])
+        return parameters
+
+    def _seed_client(self, size, parameters, analyst):
+        suffix = f"{size}-{random.randint(0, 10**6)}"
+        client = Client.objects.create(
+            client_id=f"BENCH-{suffix}"[:20], token=f"BENCH-{suffix}"[:20], name=f"Benchmark {size}",
+            organization="Benchmark Feeds Ltd", email="bench@example.com", phone="0000", address="1 Test Road",
+        )
+        samples = Sample.objects.bulk_create([
+            Sample(
+                client=client, sample_code=f"{client.client_id}-{i:04d}", sample_type="Feed",
+                weight=Decimal(random.randint(50, 500)), status=SampleStatus.APPROVED,
+            )
+            for i in range(size)
+        ], batch_size=1000)
+        assignments = TestAssignment.objects.bulk_create([
+            TestAssignment(sample=sample, parameter=parameter, analyst=analyst, status="completed")
+            for sample in samples
+            for parameter, _ in parameters
+        ], batch_size=1000)
+        bounds = {parameter.pk: b for parameter, b in parameters}
+        TestResult.objects.bulk_create([
+            TestResult(test_assignment=ta, value=round(random.uniform(*bounds[ta.parameter_id]), 2), recorded_by=analyst)
+            for ta in assignments
+        ], batch_size=1000)
+        TestEnvironment.objects.bulk_create([
+            TestEnvironment(test_assignment=ta, temperature=Decimal("25.00"), humidity=Decimal("50.00"), recorded_by=analyst)
+            for ta in assignments
+        ], batch_size=1000)
+        return client
+
+    # ------------------------------------------------------------------ stages
+
+    def _measure(self, fn):
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = fn()
+            elapsed = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, {"ms": round(elapsed, 2), "queries": len(queries), "peak_kb": round(peak / 1024, 1)}
+
+    def _run(self, client, skip_pdf=False):
+        stages = {}
+
+        def legacy_split():
+            samples = list(
+                Sample.objects
+                .filter(client=client)
+                .prefetch_related(
+                    "testassignment_set__parameter__group",
+                    "testassignment_set__testresult",
+                    "testassignment_set__testenvironment",
+                )
+            )
+            return split_samples_by_accreditation(samples)
+
+        _, stages["split_samples_by_accreditation"] = self._measure(legacy_split)
+        dataset, stages["dataset_build"] = self._measure(lambda: CoaDataset.for_client(client))
+
+        def render_templates():
+            return [
+                render_to_string("lims/coa/coa_template.html", coa_pdf_context(client, dataset.section(acc), "Benchmark.", acc))
+                for acc in (True, False) if dataset.section(acc)
+            ]
+
+        documents, stages["template_render"] = self._measure(render_templates)
+
+        if not skip_pdf:
+            pdf_assets.warm()
+            _, stages["write_pdf"] = self._measure(lambda: [
+                pdf_assets.write_pdf(html, stylesheets=[pdf_assets.COA_STYLESHEET]) for html in documents
+            ])
+        return stages
@@ -0,0 +1,82 @@
+import datetime
+import statistics
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from weasyprint import HTML
+
+from lims.utils import pdf_assets
+from lims.utils.coa_dataset import CoaDataset
+from lims.utils.coa_render import coa_pdf_context
+
+
+class Command(BaseCommand):
+    help = "Time per-document COA rendering with and without the cached WeasyPrint assets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=20, help="Samples on the synthetic COA")
+        parser.add_argument("--runs", type=int, default=10, help="Documents rendered per mode")
+
+    def _dataset(self, n_samples):
+        client = SimpleNamespace(
+            client_id="BENCH-0001", name="Benchmark Client", organization="Benchmark Feeds Ltd",
+            address="1 Test Road", email="bench@example.com", phone="0000",
+        )
+        parameters = [
+            ("Moisture", "%", "Oven (AOAC 930.15 2000)", "Proximate"),
+            ("Ash", "%", "Furnace (AOAC 942.05, 2000)", "Proximate"),
+            ("Crude Fibre", "%", "AOAC 978.10, 2000", "Proximate"),
+            ("Crude Fat", "%", "Soxhlet Extraction (AOAC 920.39)", "Proximate"),
+            ("Protein", "%", "Kjeldahl (AOAC 942.05 2000)", "Proximate"),
+        ]
+        rows = []
+        for i in range(n_samples):
+            for j, (name, unit, method, group) in enumerate(parameters):
+                rows.append((
+                    i, f"BENCH-{i:04d}", "Feed", Decimal("100.00"), datetime.date.today(),
+                    name, unit, method, group, Decimal(5 + j + (i % 7) / 10), 25, 50,
+                ))
+        return client, CoaDataset(client, rows)
+
+    def _time(self, fn, runs):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def handle(self, *args, **options):
+        client, dataset = self._dataset(options["samples"])
+        context = coa_pdf_context(client, dataset.accredited, "Benchmark summary.", True)
+
+        def uncached():
+            # What every view did before: inline CSS, disk/HTTP fetches, fresh fonts
+            html = render_to_string("lims/coa/coa_template.html", {**context, "inline_css": True})
+            HTML(string=html).write_pdf()
+
+        html = render_to_string("lims/coa/coa_template.html", context)
+
+        def cached():
+            pdf_assets.write_pdf(html, stylesheets=[pdf_assets.COA_STYLESHEET])
+
+        pdf_assets.warm()
+        results = {
+            "uncached": self._time(uncached, options["runs"]),
+            "cached": self._time(cached, options["runs"]),
+        }
+
+        self.stdout.write(f"COA with {options['samples']} samples, {options['runs']} runs per mode")
+        for mode, timings in results.items():
+            self.stdout.write(
+                f"  {mode:<9} median {statistics.median(timings):8.1f} ms   "
+                f"mean {statistics.mean(timings):8.1f} ms   max {max(timings):8.1f} ms"
+            )
+
+        before = statistics.median(results["uncached"])
+        after = statistics.median(results["cached"])
+        if after:
+            self.stdout.write(self.style.SUCCESS(f"Cached assets render {before / after:.2f}x faster per document ✅"))
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from lims.utils.workload_facts import expense_drift, rebuild_days, rebuild_expense_days, workload_drift
+
+
+class Command(BaseCommand):
+    help = "Compare the manager report rollups with a full recompute and optionally repair drifted days"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to check (YYYY-MM-DD); defaults to --days ago")
+        parser.add_argument("--end", help="Last day to check (YYYY-MM-DD); defaults to today")
+        parser.add_argument("--days", type=int, default=30, help="Days to check when --start is not given")
+        parser.add_argument("--repair", action="store_true", help="Rebuild every day that has drifted")
+
+    def _parse(self, value):
+        try:
+            return date.fromisoformat(value) if value else None
+        except ValueError:
+            raise CommandError(f"Invalid date {value!r}; expected YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        end = self._parse(options["end"]) or timezone.localdate()
+        start = self._parse(options["start"]) or end - timedelta(days=max(0, options["days"] - 1))
+        if start > end:
+            raise CommandError("--start is after --end")
+
+        drift = {
+            "workload": (workload_drift(start, end), rebuild_days),
+            "expenses": (expense_drift(start, end), rebuild_expense_days),
+        }
+
+        drifted = 0
+        for kind, (days, rebuild) in drift.items():
+            if not days:
+                self.stdout.write(f"  {kind:<9} consistent")
+                continue
+            drifted += len(days)
+            self.stdout.write(self.style.WARNING(
+                f"  {kind:<9} {len(days)} day(s) drifted: {', '.join(str(d) for d in days)}"
+            ))
+            if options["repair"]:
+                rebuild(days)
+                self.stdout.write(f"  {kind:<9} repaired")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(f"Rollups match the source tables for {start} – {end} ✅"))
+        elif options["repair"]:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {drifted} day(s) for {start} – {end} ✅"))
+        else:
+            self.stdout.write(self.style.ERROR(f"{drifted} day(s) drifted for {start} – {end}; rerun with --repair"))
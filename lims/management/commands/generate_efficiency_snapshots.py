@@ -1,45 +1,44 @@
-from django.core.management.base import BaseCommand
-from django.utils.timezone import now
-from django.db.models import F, ExpressionWrapper, DurationField, Avg, Count
-from datetime import timedelta
-from lims.models import *
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lims.utils.efficiency_snapshots import WEEKS_PER_BATCH, generate_snapshots, write_nudges
+
 
 class Command(BaseCommand):
-    help = "Generate weekly efficiency snapshots for each analyst"
-
-    def handle(self, *args, **kwargs):
-        today = now().date()
-        last_monday = today - timedelta(days=today.weekday())
-        previous_monday = last_monday - timedelta(days=7)
-
-        results = TestResult.objects.filter(
-            started_at__isnull=False,
-            recorded_at__isnull=False,
-            recorded_at__date__gte=previous_monday,
-            recorded_at__date__lt=last_monday
-        ).annotate(
-            duration=ExpressionWrapper(
-                F("recorded_at") - F("started_at"),
-                output_field=DurationField()
-            )
-        )
+    help = "Generate weekly efficiency snapshots for each analyst, backfilling any missing weeks"
 
-        stats = results.values(
-            "test_assignment__analyst"
-        ).annotate(
-            avg_duration=Avg("duration"),
-            test_count=Count("id")
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Start from the week containing this date (YYYY-MM-DD); defaults to the first timed result")
+        parser.add_argument("--until", help="Stop at the week containing this date; defaults to last week")
+        parser.add_argument("--rebuild", action="store_true", help="Recompute weeks that were already processed")
+        parser.add_argument("--batch-weeks", type=int, default=WEEKS_PER_BATCH, help="Weeks computed per grouped query")
+        parser.add_argument("--skip-nudges", action="store_true", help="Do not generate last week's dashboard nudges")
+
+    def _parse(self, value):
+        try:
+            return date.fromisoformat(value) if value else None
+        except ValueError:
+            raise CommandError(f"Invalid date {value!r}; expected YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        batches = generate_snapshots(
+            since=self._parse(options["since"]),
+            until=self._parse(options["until"]),
+            rebuild=options["rebuild"],
+            batch_size=max(1, options["batch_weeks"]),
         )
 
-        for stat in stats:
-            EfficiencySnapshot.objects.update_or_create(
-                analyst_id=stat["test_assignment__analyst"],
-                week_start=previous_monday,
-                week_end=last_monday - timedelta(days=1),
-                defaults={
-                    "average_duration": stat["avg_duration"],
-                    "total_tests": stat["test_count"]
-                }
-            )
-
-        self.stdout.write(self.style.SUCCESS("Efficiency snapshots created ✅"))
+        weeks_done = rows = 0
+        for weeks, written in batches:
+            weeks_done += len(weeks)
+            rows += written
+            self.stdout.write(f"  {weeks[0]} – {weeks[-1]}: {written} snapshot(s)")
+
+        if not weeks_done:
+            self.stdout.write("Efficiency snapshots are up to date.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Efficiency snapshots created for {weeks_done} week(s), {rows} row(s) ✅"))
+
+        if not options["skip_nudges"]:
+            self.stdout.write(f"Nudges written: {write_nudges()}")
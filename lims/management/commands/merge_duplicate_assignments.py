@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from lims.models import QCMetrics, TestAssignment, TestEnvironment, TestResult
+
+# Records hanging off an assignment (one each); a duplicate's record moves to the kept row when that has none
+ATTACHED = (TestResult, TestEnvironment, QCMetrics)
+
+
+def _rank(assignment, attached):
+    """Keep the row with the most recorded work, then the most recent one."""
+    return (
+        (TestResult, assignment.id) in attached,
+        assignment.status == "completed",
+        sum((model, assignment.id) in attached for model in ATTACHED),
+        assignment.assigned_date,
+        assignment.id,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge duplicate test assignments (same sample and parameter) into one row each. "
+        "Run before applying the unique_sample_parameter_assignment constraint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report the duplicates without changing anything")
+
+    def handle(self, *args, **options):
+        groups = list(
+            TestAssignment.objects.values_list("sample_id", "parameter_id")
+            .annotate(rows=Count("id"))
+            .filter(rows__gt=1)
+            .order_by("sample_id", "parameter_id")
+        )
+        if not groups:
+            self.stdout.write(self.style.SUCCESS("No duplicate assignments ✅"))
+            return
+
+        removed = moved = 0
+        for sample_id, parameter_id, rows in groups:
+            with transaction.atomic():
+                assignments = list(
+                    TestAssignment.objects.select_for_update()
+                    .filter(sample_id=sample_id, parameter_id=parameter_id)
+                    .order_by("id")
+                )
+                ids = [a.id for a in assignments]
+                attached = {
+                    (model, assignment_id): record_id
+                    for model in ATTACHED
+                    for record_id, assignment_id in model.objects.filter(test_assignment_id__in=ids)
+                    .values_list("id", "test_assignment_id")
+                }
+                keep = max(assignments, key=lambda a: _rank(a, attached))
+                duplicates = [a for a in assignments if a.id != keep.id]
+                self.stdout.write(
+                    f"  sample {sample_id}, parameter {parameter_id}: keeping #{keep.id}, "
+                    f"merging {', '.join(f'#{a.id}' for a in duplicates)}"
+                )
+                if options["dry_run"]:
+                    continue
+
+                for duplicate in duplicates:
+                    for model in ATTACHED:
+                        record_id = attached.get((model, duplicate.id))
+                        if record_id and (model, keep.id) not in attached:
+                            record = model.objects.get(pk=record_id)
+                            record.test_assignment = keep
+                            record.save(update_fields=["test_assignment"])
+                            attached[(model, keep.id)] = record_id
+                            moved += 1
+                    keep.is_control = keep.is_control or duplicate.is_control
+                    keep.is_reference = keep.is_reference or duplicate.is_reference
+                    keep.analyst_id = keep.analyst_id or duplicate.analyst_id
+                    keep.equipment_used_id = keep.equipment_used_id or duplicate.equipment_used_id
+                    keep.manager_comment = keep.manager_comment or duplicate.manager_comment
+
+                # Delete first: the records left on the duplicates go with them
+                TestAssignment.objects.filter(id__in=[a.id for a in duplicates]).delete()
+                keep.save()
+                removed += len(duplicates)
+
+        verb = "would be merged" if options["dry_run"] else "merged"
+        summary = f"{len(groups)} duplicate group(s) {verb}"
+        if not options["dry_run"]:
+            summary += f": {removed} row(s) removed, {moved} record(s) moved to the kept row"
+        self.stdout.write(self.style.SUCCESS(summary + " ✅"))
@@ -0,0 +1,123 @@
+import csv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from lims.models.coa import ReleaseJobStatus
+from lims.tasks import claim_release_job, run_release, set_job_status
+from lims.utils.coa_render import build_release_attachments, releasable_clients, release_summary_text
+
+REPORT_FIELDS = ["client_id", "name", "status", "attachments", "pdf_bytes", "seconds", "error"]
+
+
+class Command(BaseCommand):
+    help = "Release COAs for every client whose samples are all approved and whose summary is confirmed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Clients processed in parallel (one SMTP connection each)")
+        parser.add_argument("--client", action="append", dest="clients", default=[], help="Only release this client ID (repeatable)")
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many clients")
+        parser.add_argument("--report", default="", help="Write a per-client CSV report to this path")
+        parser.add_argument("--dry-run", action="store_true", help="Render only and report render times; nothing is emailed or marked released")
+
+    def handle(self, *args, **options):
+        clients = releasable_clients()
+        if options["clients"]:
+            clients = clients.filter(client_id__in=options["clients"])
+        clients = list(clients)
+        if options["limit"]:
+            clients = clients[:options["limit"]]
+
+        if not clients:
+            self.stdout.write("No clients are ready for release.")
+            return
+
+        mode = "dry run" if options["dry_run"] else "release"
+        self.stdout.write(f"{len(clients)} client(s) ready — {mode} with {options['workers']} worker(s)")
+
+        self._local = threading.local()
+        self._smtp = []
+        self._smtp_lock = threading.Lock()
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+                rows = list(pool.map(lambda c: self._process(c, options["dry_run"]), clients))
+        finally:
+            for connection in self._smtp:
+                connection.close()
+        elapsed = time.perf_counter() - started
+
+        for row in rows:
+            line = f"  {row['client_id']:<12} {row['status']:<9} {row['seconds']:>7}s  {row['attachments']} PDF(s)"
+            if row["error"]:
+                line += f"  {row['error']}"
+            self.stdout.write(line)
+
+        if options["report"]:
+            with open(options["report"], "w", newline="") as fh:
+                writer = csv.DictWriter(fh, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+            self.stdout.write(f"Report written to {options['report']}")
+
+        failed = sum(1 for row in rows if row["status"] == "failed")
+        summary = f"{len(rows) - failed}/{len(rows)} client(s) {'rendered' if options['dry_run'] else 'released'} in {elapsed:.1f}s"
+        self.stdout.write((self.style.ERROR if failed else self.style.SUCCESS)(summary + (" ✅" if not failed else "")))
+
+    def _connection(self):
+        """This worker thread's SMTP connection, opened on first use."""
+        connection = getattr(self._local, "smtp", None)
+        if connection is None:
+            connection = self._local.smtp = get_connection()
+            connection.open()
+            with self._smtp_lock:
+                self._smtp.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, "smtp", None)
+        if connection is not None:
+            self._local.smtp = None
+            connection.close()
+
+    def _process(self, client, dry_run):
+        row = dict.fromkeys(REPORT_FIELDS, "")
+        row.update(client_id=client.client_id, name=client.name, attachments=0)
+        started = time.perf_counter()
+        job = None
+        try:
+            if dry_run:
+                attachments = build_release_attachments(client, release_summary_text(client))
+                row.update(status="dry-run", attachments=len(attachments),
+                           pdf_bytes=sum(len(pdf) for _, pdf in attachments))
+                return row
+
+            claimed, created = claim_release_job(client)
+            if not created:
+                row["status"] = "skipped"
+                row["error"] = "a release job is already in progress"
+                return row
+
+            job = claimed
+            attachments = run_release(job, connection=self._connection())
+            if attachments is None:
+                row.update(status="failed", error=job.last_error)
+            else:
+                row.update(status="released", attachments=len(attachments),
+                           pdf_bytes=sum(len(pdf) for _, pdf in attachments))
+        except Exception as exc:
+            row.update(status="failed", error=str(exc))
+            # The SMTP session may be unusable after an error; reconnect for the next client
+            self._drop_connection()
+            if job is not None:
+                set_job_status(job, ReleaseJobStatus.FAILED, last_error=str(exc), finished_at=timezone.now())
+        finally:
+            row["seconds"] = f"{time.perf_counter() - started:.2f}"
+            connections.close_all()
+        return row
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from lims_project.celery import app
+
+
+class Command(BaseCommand):
+    help = "Run a Celery worker for background jobs (COA release, report emails) in this process"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="Number of concurrent jobs")
+        parser.add_argument(
+            "--pool", default="threads",
+            help="Celery execution pool. Threads by default: PDF rendering runs in "
+                 "lims.utils.pdf_pool processes, which daemonic prefork children cannot start.",
+        )
+        parser.add_argument("--loglevel", default="INFO", help="Celery log level")
+        parser.add_argument("--queues", default="", help="Comma-separated queues to consume (default: all)")
+        parser.add_argument("--beat", action="store_true", help="Also run the periodic scheduler (scheduled manager reports)")
+
+    def handle(self, *args, **options):
+        argv = [
+            "worker",
+            f"--loglevel={options['loglevel']}",
+            f"--concurrency={options['concurrency']}",
+            f"--pool={options['pool']}",
+        ]
+        if options["queues"]:
+            argv.append(f"--queues={options['queues']}")
+        if options["beat"]:
+            argv.append("--beat")
+
+        self.stdout.write(self.style.SUCCESS(f"Starting worker ({options['pool']} pool, concurrency {options['concurrency']}) ✅"))
+        app.worker_main(argv)
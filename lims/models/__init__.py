@@ -5,6 +5,9 @@ from .test_assignment import *
 from .test_environment import TestEnvironment
 from .qc import QCMetrics
 from .qc_control import ControlSpec
-from .equipment import Equipment, CalibrationRecord
+from .equipment import Equipment, CalibrationRecord, InstrumentImportProfile
 from .reagents import *
 from .expense import *
+from .reporting import (
+    DailyExpenseTotal, DailyWorkloadFact, ReportDispatchJob, ReportDispatchStatus, ReportSchedule,
+)
@@ -19,6 +19,12 @@ class EfficiencySnapshot(models.Model):
     week_end = models.DateField()
     average_duration = models.DurationField()
     total_tests = models.PositiveIntegerField()
+    # Share of that week's analysts with a slower average (0-100), and the counts behind it
+    percentile_rank = models.PositiveSmallIntegerField(null=True, blank=True)
+    faster_than = models.PositiveIntegerField(null=True, blank=True)
+    cohort_size = models.PositiveIntegerField(null=True, blank=True)
+    # Written once by the snapshot job; the analyst dashboard only reads it
+    nudge_text = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -26,3 +32,19 @@ class EfficiencySnapshot(models.Model):
 
     def __str__(self):
         return f"{self.analyst.username}: {self.average_duration} ({self.total_tests} tests)"
+
+
+class EfficiencySnapshotWeek(models.Model):
+    """
+    A week generate_efficiency_snapshots has processed, including weeks with
+    no timed results, so the next run only has to fill the gaps.
+    """
+    week_start = models.DateField(unique=True)
+    analyst_count = models.PositiveIntegerField(default=0)
+    processed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-week_start"]
+
+    def __str__(self):
+        return f"Week of {self.week_start} ({self.analyst_count} analysts)"
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from simple_history.models import HistoricalRecords
 
@@ -9,3 +10,68 @@ class COAInterpretation(models.Model):
     history = HistoricalRecords()
     def __str__(self):
         return f"Interpretation for {self.client.client_id}"
+
+
+class ReleaseJobStatus(models.TextChoices):
+    QUEUED = 'queued', 'Queued'
+    RENDERING = 'rendering', 'Rendering'
+    SENDING = 'sending', 'Sending'
+    RETRYING = 'retrying', 'Retrying'
+    DONE = 'done', 'Released'
+    FAILED = 'failed', 'Failed'
+
+
+class COAReleaseJob(models.Model):
+    """
+    One background render-and-send of a client's COA(s).
+    Created by release_client_coa and advanced by lims.tasks.release_client_coa_task.
+    """
+    ACTIVE_STATUSES = (
+        ReleaseJobStatus.QUEUED,
+        ReleaseJobStatus.RENDERING,
+        ReleaseJobStatus.SENDING,
+        ReleaseJobStatus.RETRYING,
+    )
+
+    client = models.ForeignKey("Client", on_delete=models.CASCADE, related_name="coa_release_jobs")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField(max_length=20, choices=ReleaseJobStatus.choices, default=ReleaseJobStatus.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    emailed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["client"],
+                condition=models.Q(status__in=[
+                    ReleaseJobStatus.QUEUED,
+                    ReleaseJobStatus.RENDERING,
+                    ReleaseJobStatus.SENDING,
+                    ReleaseJobStatus.RETRYING,
+                ]),
+                name="one_active_coa_release_per_client",
+            ),
+        ]
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "client_id": self.client.client_id,
+            "status": self.status,
+            "status_label": self.get_status_display(),
+            "attempts": self.attempts,
+            "error": self.last_error,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __str__(self):
+        return f"COA release for {self.client.client_id} ({self.status})"
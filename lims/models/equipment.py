@@ -122,3 +122,49 @@ class CalibrationRecord(models.Model):
         String representation of the calibration record.
         """
         return f"{self.equipment.name} calibrated {self.calibration_date}"
+
+
+# --------------------------------------------------------------------------------------
+# Instrument Import Profile
+# --------------------------------------------------------------------------------------
+class InstrumentImportProfile(models.Model):
+    """
+    Describes an instrument's exported results file (CSV, TSV or XLSX) so
+    analysts can import a batch instead of typing every value: which columns
+    hold the sample code and the result, and where the header row is.
+    """
+
+    DELIMITER_CHOICES = [
+        (",", "Comma"),
+        (";", "Semicolon"),
+        ("\t", "Tab"),
+    ]
+
+    equipment = models.OneToOneField(
+        Equipment,
+        on_delete=models.CASCADE,
+        related_name="import_profile",
+        help_text="Instrument whose exports this profile reads."
+    )
+    sample_code_column = models.CharField(
+        max_length=100, help_text="Header of the column holding the sample code."
+    )
+    value_column = models.CharField(
+        max_length=100, help_text="Header of the column holding the result value."
+    )
+    header_row = models.PositiveSmallIntegerField(
+        default=1, help_text="Row number (starting at 1) of the column headers."
+    )
+    delimiter = models.CharField(
+        max_length=1, choices=DELIMITER_CHOICES, default=",",
+        help_text="Field separator for CSV exports (.tsv files always use tabs)."
+    )
+    sheet_name = models.CharField(
+        max_length=100, blank=True, help_text="Worksheet to read in XLSX exports (default: the first)."
+    )
+    decimal_comma = models.BooleanField(
+        default=False, help_text="Result values use a comma as the decimal separator."
+    )
+
+    def __str__(self):
+        return f"Import profile for {self.equipment.name}"
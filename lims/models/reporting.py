@@ -0,0 +1,164 @@
+"""
+Module: reporting.py
+Description: Pre-aggregated tables behind the manager report.
+"""
+
+from django.conf import settings
+from django.db import models
+
+
+class DailyWorkloadFact(models.Model):
+    """
+    Non-control test assignments rolled up per assignment day, client,
+    parameter group, parameter and analyst. Rebuilt by
+    lims.utils.workload_facts (see the backfill_workload_facts command).
+
+    Distinct sample counts do not add up across rows, so each sample is
+    credited to exactly one row per (day, client, group) in
+    group_sample_count and per (day, analyst) in analyst_sample_count;
+    summing those columns gives distinct samples at that level.
+    """
+
+    day = models.DateField(db_index=True)
+    client = models.ForeignKey("Client", on_delete=models.CASCADE, related_name="+")
+    group = models.ForeignKey("ParameterGroup", on_delete=models.CASCADE, related_name="+")
+    parameter = models.ForeignKey("Parameter", on_delete=models.CASCADE, related_name="+")
+    analyst = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+
+    test_count = models.PositiveIntegerField(default=0)
+    sample_count = models.PositiveIntegerField(default=0, help_text="Distinct samples in this row.")
+    group_sample_count = models.PositiveIntegerField(default=0)
+    analyst_sample_count = models.PositiveIntegerField(default=0)
+    income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "client", "group", "parameter", "analyst"],
+                name="unique_daily_workload_fact",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.parameter_id}/{self.analyst_id}: {self.test_count} tests"
+
+
+class DailyExpenseTotal(models.Model):
+    """Expense amounts per day, maintained alongside DailyWorkloadFact."""
+
+    day = models.DateField(unique=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    entry_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["day"]
+
+    def __str__(self):
+        return f"{self.day}: ₦{self.amount} ({self.entry_count} entries)"
+
+
+REPORT_RANGES = [
+    ("day", "Today"),
+    ("week", "This week"),
+    ("month", "This month"),
+    ("last_month", "Last month"),
+    ("all_time", "All time"),
+]
+
+
+class ReportSchedule(models.Model):
+    """
+    Recurring delivery of the manager report. lims.tasks.dispatch_due_report_schedules
+    queues a ReportDispatchJob for every schedule that is due.
+    """
+
+    FREQUENCY_CHOICES = [
+        ("daily", "Daily"),
+        ("weekly", "Weekly (Mondays)"),
+        ("monthly", "Monthly (1st of the month)"),
+    ]
+
+    name = models.CharField(max_length=100)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default="weekly")
+    range_type = models.CharField(max_length=20, choices=REPORT_RANGES, default="week")
+    recipients = models.TextField(help_text="Comma-separated email addresses.")
+    is_active = models.BooleanField(default=True)
+    last_sent_on = models.DateField(null=True, blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def recipient_list(self):
+        return [email.strip() for email in self.recipients.replace(";", ",").split(",") if email.strip()]
+
+    def is_due(self, today):
+        """Whether the report should go out on `today` (and has not already)."""
+        if not self.is_active or self.last_sent_on == today:
+            return False
+        if self.frequency == "weekly" and today.weekday() != 0:
+            return False
+        if self.frequency == "monthly" and today.day != 1:
+            return False
+        return True
+
+    def __str__(self):
+        return f"{self.name} ({self.get_frequency_display()})"
+
+
+class ReportDispatchStatus(models.TextChoices):
+    QUEUED = 'queued', 'Queued'
+    RENDERING = 'rendering', 'Rendering'
+    SENDING = 'sending', 'Sending'
+    RETRYING = 'retrying', 'Retrying'
+    DONE = 'done', 'Sent'
+    FAILED = 'failed', 'Failed'
+
+
+class ReportDispatchJob(models.Model):
+    """
+    One background render-and-email of the manager report, requested from the
+    dashboard or created by a ReportSchedule. Advanced by
+    lims.tasks.send_manager_report_task.
+    """
+
+    schedule = models.ForeignKey(ReportSchedule, null=True, blank=True, on_delete=models.SET_NULL, related_name="jobs")
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    range_type = models.CharField(max_length=20, choices=REPORT_RANGES, default="month")
+    recipients = models.TextField()
+    base_url = models.CharField(max_length=255, blank=True, help_text="Absolute URL the report's images resolve against.")
+    status = models.CharField(max_length=20, choices=ReportDispatchStatus.choices, default=ReportDispatchStatus.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def recipient_list(self):
+        return [email.strip() for email in self.recipients.split(",") if email.strip()]
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "status_label": self.get_status_display(),
+            "range_type": self.range_type,
+            "recipients": self.recipient_list(),
+            "attempts": self.attempts,
+            "error": self.last_error,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __str__(self):
+        return f"Manager report ({self.range_type}) to {self.recipients} ({self.status})"
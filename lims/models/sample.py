@@ -28,3 +28,22 @@ class Sample(models.Model):
     def __str__(self):
         tag = " [QC]" if self.sample_type == "QC" else ""
         return f"{self.sample_code}{tag}"
+
+
+class SampleCodeSequence(models.Model):
+    """
+    Last number handed out for a generated sample-code prefix of a client
+    (e.g. QC-JGLSP1-PRO, REF-JGLSP1-PRO). Codes are allocated by incrementing
+    the row under a lock, so no probing for free codes is needed.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name="+")
+    prefix = models.CharField(max_length=50)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["client", "prefix"], name="unique_sample_code_sequence"),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix} #{self.last_value}"
@@ -25,6 +25,12 @@ class TestAssignment(models.Model):
     manager_comment = models.TextField(null=True, blank=True)
     history = HistoricalRecords()
 
+    class Meta:
+        # Merge rows created before this existed with `manage.py merge_duplicate_assignments` first
+        constraints = [
+            models.UniqueConstraint(fields=["sample", "parameter"], name="unique_sample_parameter_assignment"),
+        ]
+
     def __str__(self):
         return f"{self.parameter.name} - {self.sample.sample_code}"
 
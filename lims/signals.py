@@ -1,14 +1,21 @@
 """
 Module: signals.py
 Description: Handles Django signals for automatically promoting samples to review
-once all required test assignments for a parameter are completed.
+once all required test assignments for a parameter are completed, and for
+dropping stored COA PDFs when the data behind them changes, and for keeping
+the manager report rollups current.
 
 """
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
-from lims.models import TestAssignment
-from lims.utils.result_to_review import promote_samples_for_parameter_if_ready
+from lims.models import CalibrationRecord, Equipment, Expense, Sample, TestAssignment, TestResult
+from lims.models.coa import COAInterpretation
+from lims.utils.coa_cache import mark_coas_stale
+from lims.utils.promotion import mark_for_promotion
+from lims.utils.report_cache import bump_report_version
+from lims.utils.rollups import local_day, mark_dirty
 
 
 @receiver(post_save, sender=TestAssignment)
@@ -17,8 +24,9 @@ def auto_promote_samples(sender, instance, **kwargs):
     Signal handler for post_save event on TestAssignment.
 
     This function is triggered whenever a TestAssignment is saved.
-    If the status of the assignment is 'completed', it checks whether all 
-    related samples for the parameter are ready and promotes them for review.
+    If the status of the assignment is 'completed', it queues the client and
+    parameter for a promotion check once the current request or transaction
+    commits (see lims.utils.promotion).
 
     Args:
         sender (Model): The model class (TestAssignment) that sent the signal.
@@ -27,8 +35,75 @@ def auto_promote_samples(sender, instance, **kwargs):
     """
     # Only promote samples when the test assignment status is marked as completed
     if instance.status == "completed":
-        parameter = instance.parameter
-        client = instance.sample.client
+        mark_for_promotion(instance.sample.client_id, instance.parameter_id)
 
-        # Promote samples for review if all assignments for this parameter are ready
-        promote_samples_for_parameter_if_ready(parameter, client)
+
+@receiver(post_save, sender=TestResult)
+@receiver(post_delete, sender=TestResult)
+def invalidate_coa_on_result_change(sender, instance, **kwargs):
+    """
+    A changed or removed result alters the COA table for that client.
+    """
+    mark_coas_stale("assignment", instance.test_assignment_id)
+
+
+@receiver(post_save, sender=TestAssignment)
+@receiver(post_delete, sender=TestAssignment)
+def invalidate_coa_on_assignment_change(sender, instance, **kwargs):
+    """
+    Assignments decide which parameters (and which COA kind) a sample shows.
+    """
+    mark_coas_stale("sample", instance.sample_id)
+
+
+@receiver(post_save, sender=COAInterpretation)
+@receiver(post_delete, sender=COAInterpretation)
+def invalidate_coa_on_interpretation_change(sender, instance, **kwargs):
+    """
+    The summary interpretation is printed on the last COA page.
+    """
+    mark_coas_stale("client", instance.client_id)
+
+
+@receiver(post_save, sender=TestAssignment)
+@receiver(post_delete, sender=TestAssignment)
+def update_workload_rollup(sender, instance, **kwargs):
+    """
+    Recompute the assignment's day in the workload facts after commit.
+    Results do not feed the facts, so TestResult writes need no rollup.
+    """
+    mark_dirty("workload", local_day(instance.assigned_date))
+
+
+@receiver(post_init, sender=Expense)
+def remember_expense_day(sender, instance, **kwargs):
+    instance._rollup_day = instance.date
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def update_expense_rollup(sender, instance, **kwargs):
+    """
+    Recompute the expense's day, and its previous day when the date was edited.
+    """
+    mark_dirty("expenses", instance.date)
+    if instance._rollup_day != instance.date:
+        mark_dirty("expenses", instance._rollup_day)
+    instance._rollup_day = instance.date
+
+
+@receiver(post_save, sender=Sample)
+@receiver(post_delete, sender=Sample)
+@receiver(post_save, sender=TestResult)
+@receiver(post_delete, sender=TestResult)
+@receiver(post_save, sender=Equipment)
+@receiver(post_delete, sender=Equipment)
+@receiver(post_save, sender=CalibrationRecord)
+@receiver(post_delete, sender=CalibrationRecord)
+def expire_manager_report_cache(sender, instance, **kwargs):
+    """
+    Sample, equipment and calibration counts are part of the cached manager
+    report and results drive the cached productivity figures; assignment and
+    expense writes expire both through the rollup rebuild.
+    """
+    transaction.on_commit(bump_report_version)
@@ -0,0 +1,292 @@
+"""
+Module: tasks.py
+Description: Celery tasks for work that must not run inside a web request
+(COA rendering, client emails, manager report delivery and the weekly
+efficiency snapshots).
+"""
+
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from lims.models import Client
+from lims.models.coa import COAInterpretation, COAReleaseJob, ReleaseJobStatus
+from lims.models.reporting import ReportDispatchJob, ReportDispatchStatus, ReportSchedule
+from lims.utils.coa_render import build_release_attachments, release_samples, release_summary_text
+from lims.utils.coa_summary_ai import (
+    FAILED_PREFIX, generate_dynamic_summary, summary_cache, summary_cache_key,
+)
+from lims.utils.efficiency_snapshots import generate_snapshots, write_nudges
+from lims.utils.manager_report import build_manager_report_email
+from lims.utils.notifications import notify_client_on_coa_release
+
+logger = logging.getLogger(__name__)
+
+
+def set_job_status(job, status, **fields):
+    fields["status"] = status
+    fields["updated_at"] = timezone.now()
+    type(job).objects.filter(pk=job.pk).update(**fields)
+    for name, value in fields.items():
+        if not hasattr(value, "resolve_expression"):
+            setattr(job, name, value)
+
+
+def release_backoff(retries):
+    """Seconds to wait before retry number `retries + 1` (capped at one hour)."""
+    base = getattr(settings, "COA_RELEASE_RETRY_BACKOFF", 30)
+    return min(base * (2 ** retries), 3600)
+
+
+def release_stale_after():
+    """
+    How long an active release job may go without progress before it is
+    treated as lost: one render timeout plus the longest retry backoff.
+    """
+    return timedelta(seconds=getattr(settings, "PDF_RENDER_TIMEOUT", 120) + release_backoff(
+        getattr(settings, "COA_RELEASE_MAX_RETRIES", 5)
+    ))
+
+
+def run_release(job, connection=None):
+    """
+    Render, email and mark released for one job. Raises on failure and
+    leaves retry/failure bookkeeping to the caller. Returns the emailed
+    (filename, pdf_bytes) attachments, or None when the client has nothing
+    to release.
+    """
+    client = job.client
+    set_job_status(job, ReleaseJobStatus.RENDERING, attempts=F("attempts") + 1)
+
+    summary_text = release_summary_text(client)
+    attachments = []
+
+    # A previous attempt may have emailed successfully and failed afterwards
+    if job.emailed_at is None:
+        attachments = build_release_attachments(client, summary_text)
+        if not attachments:
+            set_job_status(
+                job, ReleaseJobStatus.FAILED,
+                last_error="No accredited or unaccredited samples found.",
+                finished_at=timezone.now(),
+            )
+            return None
+
+        set_job_status(job, ReleaseJobStatus.SENDING)
+        notify_client_on_coa_release(
+            client=client, summary_text=summary_text, attachments=attachments, connection=connection,
+        )
+        set_job_status(job, ReleaseJobStatus.SENDING, emailed_at=timezone.now())
+
+    with transaction.atomic():
+        release_samples(client).update(coa_released=True)
+        client.coa_released = True
+        client.save(update_fields=["coa_released"])
+        set_job_status(job, ReleaseJobStatus.DONE, last_error="", finished_at=timezone.now())
+    return attachments
+
+
+@shared_task(bind=True, max_retries=getattr(settings, "COA_RELEASE_MAX_RETRIES", 5))
+def release_client_coa_task(self, job_id):
+    """
+    Render the client's COA(s), email them and mark the client released.
+    SMTP/render failures are retried with exponential backoff; the job row
+    records progress so the COA dashboard can poll it.
+    """
+    job = COAReleaseJob.objects.select_related("client").get(pk=job_id)
+    # DONE, or FAILED after being replaced as stale
+    if not job.is_active:
+        return
+
+    try:
+        run_release(job)
+    except Exception as exc:
+        logger.exception("COA release failed for %s (attempt %s)", job.client.client_id, self.request.retries + 1)
+        if self.request.retries >= self.max_retries:
+            set_job_status(job, ReleaseJobStatus.FAILED, last_error=str(exc), finished_at=timezone.now())
+            raise
+        set_job_status(job, ReleaseJobStatus.RETRYING, last_error=str(exc))
+        raise self.retry(exc=exc, countdown=release_backoff(self.request.retries))
+
+
+def claim_release_job(client, requested_by=None):
+    """
+    Create the client's release job unless one is already in flight. An
+    active job with no progress for release_stale_after() (its task was
+    lost, or never published) is marked failed and replaced. Returns
+    (job, created); the caller runs or publishes a created job.
+    """
+    with transaction.atomic():
+        # One claimant per client at a time; the partial unique constraint backs this up
+        Client.objects.select_for_update().filter(pk=client.pk).first()
+        job = (
+            COAReleaseJob.objects
+            .filter(client=client, status__in=COAReleaseJob.ACTIVE_STATUSES)
+            .first()
+        )
+        if job:
+            if job.updated_at > timezone.now() - release_stale_after():
+                return job, False
+            logger.warning("Replacing stale COA release job %s for %s", job.pk, client.client_id)
+            set_job_status(
+                job, ReleaseJobStatus.FAILED,
+                last_error=f"No progress since {job.updated_at:%Y-%m-%d %H:%M}; replaced by a new release.",
+                finished_at=timezone.now(),
+            )
+        try:
+            with transaction.atomic():
+                job = COAReleaseJob.objects.create(client=client, requested_by=requested_by)
+        except IntegrityError:
+            job = COAReleaseJob.objects.get(client=client, status__in=COAReleaseJob.ACTIVE_STATUSES)
+            return job, False
+    return job, True
+
+
+def publish_release(job):
+    """Send the job to the worker; a job that cannot be published is marked failed."""
+    try:
+        release_client_coa_task.delay(job.id)
+    except Exception as exc:
+        logger.exception("Could not queue COA release job %s", job.pk)
+        set_job_status(
+            job, ReleaseJobStatus.FAILED,
+            last_error=f"Could not queue the release: {exc}", finished_at=timezone.now(),
+        )
+
+
+def enqueue_coa_release(client, requested_by=None):
+    """
+    Queue a release job for a client, reusing one that is already in flight.
+    The task is only published once the surrounding transaction commits.
+    """
+    job, created = claim_release_job(client, requested_by=requested_by)
+    if created:
+        transaction.on_commit(lambda: publish_release(job))
+    return job, created
+
+
+@shared_task
+def generate_coa_summary_task(client_id, payload, fallback_text):
+    """
+    Generate the AI interpretation for a client's COA and store it, unless
+    someone has written a summary in the meantime. Falls back to the plain
+    averages text when the provider fails.
+    """
+    try:
+        text = generate_dynamic_summary(payload)
+        if not text or text.startswith(FAILED_PREFIX):
+            text = fallback_text
+
+        interpretation, _ = COAInterpretation.objects.get_or_create(client_id=client_id)
+        if not interpretation.summary_text:
+            interpretation.summary_text = text.strip()
+            interpretation.save()
+    finally:
+        summary_cache().delete(_summary_pending_key(client_id, payload))
+
+
+def _summary_pending_key(client_id, payload):
+    return f"{summary_cache_key(payload)}:pending:{client_id}"
+
+
+def enqueue_coa_summary(client, payload, fallback_text):
+    """
+    Queue summary generation for a client's preview. A payload already in
+    flight for this client is not queued twice. Returns True when queued.
+    """
+    if not summary_cache().add(_summary_pending_key(client.pk, payload), client.pk, timeout=300):
+        return False
+    transaction.on_commit(lambda: generate_coa_summary_task.delay(client.pk, payload, fallback_text))
+    return True
+
+
+@shared_task(bind=True, max_retries=getattr(settings, "COA_RELEASE_MAX_RETRIES", 5))
+def send_manager_report_task(self, job_id):
+    """
+    Render the manager report (HTML body plus in-memory PDF) for the job's
+    range and email it. SMTP/render failures are retried with backoff.
+    """
+    job = ReportDispatchJob.objects.get(pk=job_id)
+    if job.status == ReportDispatchStatus.DONE:
+        return
+
+    try:
+        set_job_status(job, ReportDispatchStatus.RENDERING, attempts=F("attempts") + 1)
+        message = build_manager_report_email(job.range_type, job.recipient_list(), base_url=job.base_url)
+        set_job_status(job, ReportDispatchStatus.SENDING)
+        message.send()
+    except Exception as exc:
+        logger.exception("Manager report %s failed (attempt %s)", job.pk, self.request.retries + 1)
+        if self.request.retries >= self.max_retries:
+            set_job_status(job, ReportDispatchStatus.FAILED, last_error=str(exc), finished_at=timezone.now())
+            raise
+        set_job_status(job, ReportDispatchStatus.RETRYING, last_error=str(exc))
+        raise self.retry(exc=exc, countdown=release_backoff(self.request.retries))
+
+    set_job_status(job, ReportDispatchStatus.DONE, last_error="", finished_at=timezone.now())
+    if job.schedule_id:
+        ReportSchedule.objects.filter(pk=job.schedule_id).update(last_sent_on=timezone.localdate())
+
+
+def publish_manager_report(job):
+    """Send the dispatch job to the worker; a job that cannot be published is marked failed."""
+    try:
+        send_manager_report_task.delay(job.id)
+    except Exception as exc:
+        logger.exception("Could not queue manager report job %s", job.pk)
+        set_job_status(
+            job, ReportDispatchStatus.FAILED,
+            last_error=f"Could not queue the report: {exc}", finished_at=timezone.now(),
+        )
+
+
+def enqueue_manager_report(range_type, recipients, requested_by=None, base_url="", schedule=None):
+    """
+    Create a dispatch job and publish it once the surrounding transaction commits.
+    """
+    job = ReportDispatchJob.objects.create(
+        range_type=range_type,
+        recipients=", ".join(recipients),
+        requested_by=requested_by,
+        base_url=base_url,
+        schedule=schedule,
+    )
+    transaction.on_commit(lambda: publish_manager_report(job))
+    return job
+
+
+@shared_task
+def dispatch_due_report_schedules():
+    """
+    Queue one dispatch job for every active schedule that is due today.
+    Run periodically by Celery beat (CELERY_BEAT_SCHEDULE); safe to run often.
+    """
+    today = timezone.localdate()
+    queued = 0
+    for schedule in ReportSchedule.objects.filter(is_active=True):
+        if not schedule.is_due(today) or not schedule.recipient_list():
+            continue
+        already = schedule.jobs.filter(created_at__date=today).exclude(status=ReportDispatchStatus.FAILED).exists()
+        if already:
+            continue
+        enqueue_manager_report(
+            schedule.range_type, schedule.recipient_list(),
+            base_url=getattr(settings, "SITE_URL", ""), schedule=schedule,
+        )
+        queued += 1
+    return queued
+
+
+@shared_task
+def generate_efficiency_snapshots_task():
+    """
+    Weekly: backfill any missing efficiency snapshots, then store last week's
+    dashboard nudges so the analyst dashboard never calls the AI provider.
+    """
+    weeks = sum(len(batch) for batch, _ in generate_snapshots())
+    return {"weeks": weeks, "nudges": write_nudges()}
@@ -1,3 +1,562 @@
+import datetime
+import io
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from openpyxl import Workbook
+
+from lims.models import (
+    Client, ControlSpec, Equipment, InstrumentImportProfile, Parameter, ParameterGroup, QCMetrics, Sample,
+    SampleStatus, TestAssignment, TestResult,
+)
+from lims.models.coa import COAReleaseJob, ReleaseJobStatus
+from lims.models.reporting import ReportDispatchStatus
+from lims.tasks import (
+    enqueue_coa_release, enqueue_coa_summary, enqueue_manager_report, generate_coa_summary_task, release_stale_after,
+)
+from lims.utils.assignments import assign_samples
+from lims.utils.coa_cache import coa_invalidation_batch, flush_stale_coas
+from lims.utils.coa_dataset import CoaDataset
+from lims.utils.coa_summary_ai import cached_summary, summary_cache
+from lims.utils.derived import update_derived_results
+from lims.utils.derived_parameters import component_values, evaluate, stored_name
+from lims.utils.promotion import flush as promotion_flush, promotion_batch
+from lims.utils.report_cache import bump_report_version, cached_report_data, report_cache
+
+User = get_user_model()
+
+
+class DerivedParameterTests(TestCase):
+    """CHO and ME come from the derived-parameter registry, stored or computed for the COA."""
+
+    PROXIMATE = {"Moisture": 10, "Crude Protein": 20, "Fat": 5, "Crude Fibre": 4, "Ash": 6}
+
+    def setUp(self):
+        self.analyst = User.objects.create_user(username="analyst", password="x", role="analyst")
+        self.lab_client = Client.objects.create(
+            client_id="DERIVED", name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+        self.parameters = {}
+        for group_name, names in [("Proximate", list(self.PROXIMATE)), ("CHO", ["Carbohydrate"]), ("ME", ["ME"])]:
+            group = ParameterGroup.objects.create(name=group_name)
+            for name in names:
+                self.parameters[name] = Parameter.objects.create(
+                    name=name, group=group, unit="%", method="-", ref_limit="-", default_price=100,
+                )
+
+    def make_sample(self, code, values, derived=("Carbohydrate", "ME")):
+        sample = Sample.objects.create(
+            client=self.lab_client, sample_code=code, sample_type="feed", weight=10, status=SampleStatus.ASSIGNED,
+        )
+        for name, value in values.items():
+            assignment = TestAssignment.objects.create(
+                sample=sample, parameter=self.parameters[name], analyst=self.analyst, status="completed",
+            )
+            TestResult.objects.create(test_assignment=assignment, value=value, recorded_by=self.analyst)
+        for name in derived:
+            TestAssignment.objects.create(sample=sample, parameter=self.parameters[name], analyst=self.analyst)
+        return sample
+
+    def test_known_proximate_set(self):
+        values = evaluate([component_values(self.PROXIMATE)])[0]
+        self.assertEqual(values, {"CHO": 55.0, "ME": 3450.0})
+
+    def test_missing_inputs_produce_nothing(self):
+        partial = dict(self.PROXIMATE)
+        del partial["Ash"]
+        self.assertEqual(evaluate([component_values(partial), {}]), [{}, {}])
+
+        sample = self.make_sample("DERIVED-PARTIAL", partial)
+        self.assertEqual(update_derived_results([sample.id]), 0)
+        self.assertFalse(TestResult.objects.filter(source="system").exists())
+
+    def test_aliases_map_to_stored_name(self):
+        self.assertEqual(stored_name("Carbohydrate"), "CHO")
+        self.assertEqual(stored_name("nfe"), "CHO")
+        self.assertEqual(stored_name("ME"), "ME")
+        self.assertIsNone(stored_name("Crude Protein"))
+
+    def test_derived_values_are_stored_on_assignments(self):
+        sample = self.make_sample("DERIVED-1", self.PROXIMATE)
+        self.assertEqual(update_derived_results([sample.id], recorded_by=self.analyst), 2)
+        stored = dict(
+            TestResult.objects.filter(test_assignment__sample=sample, source="system")
+            .values_list("test_assignment__parameter__name", "value")
+        )
+        self.assertEqual(stored, {"Carbohydrate": 55.0, "ME": 3450.0})
+
+    def test_coa_skips_a_derived_value_already_stored(self):
+        self.make_sample("DERIVED-2", dict(self.PROXIMATE, Carbohydrate=50), derived=())
+        results = {
+            r["parameter"]: r["value"] for r in CoaDataset.for_client(self.lab_client).combined.samples[0].results
+        }
+        self.assertEqual(results["Carbohydrate"], 50.0)
+        self.assertNotIn("CHO", results)
+        self.assertEqual(results["ME"], 3450.0)
+
+
+class BatchResultEntryTests(TestCase):
+    """enter_batch_result persists a batch in a fixed number of queries."""
+
+    def setUp(self):
+        self.analyst = User.objects.create_user(username="analyst", password="x", role="analyst")
+        group = ParameterGroup.objects.create(name="Proximate")
+        self.parameter = Parameter.objects.create(
+            name="Protein", group=group, unit="%", method="AOAC 984.13", ref_limit="-", default_price=100,
+        )
+        self.client.force_login(self.analyst)
+
+    def make_batch(self, client_id, size):
+        client = Client.objects.create(
+            client_id=client_id, name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+        assignments = []
+        for i in range(size):
+            sample = Sample.objects.create(
+                client=client, sample_code=f"{client_id}-{i}", sample_type="feed", weight=10,
+                status=SampleStatus.ASSIGNED,
+            )
+            assignments.append(TestAssignment.objects.create(
+                sample=sample, parameter=self.parameter, analyst=self.analyst, status="in_progress",
+            ))
+        return client, assignments
+
+    def submit(self, client, assignments):
+        data = {"temperature": "25", "humidity": "50"}
+        for i, assignment in enumerate(assignments):
+            data[f"result_{assignment.id}-value"] = str(20 + i / 10)
+        url = reverse("enter_batch_result", args=[client.client_id, self.parameter.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_query_count_is_constant_in_batch_size(self):
+        small = self.submit(*self.make_batch("SMALL", 3))
+        large = self.submit(*self.make_batch("LARGE", 60))
+        self.assertEqual(small, large)
+
+    def test_batch_is_saved_and_promoted(self):
+        client, assignments = self.make_batch("SAVED", 5)
+        self.submit(client, assignments)
+
+        self.assertEqual(TestResult.objects.filter(test_assignment__in=assignments).count(), 5)
+        self.assertFalse(TestAssignment.objects.filter(sample__client=client).exclude(status="completed").exists())
+        self.assertFalse(Sample.objects.filter(client=client).exclude(status=SampleStatus.UNDER_REVIEW).exists())
+        result = TestResult.objects.get(test_assignment=assignments[0])
+        self.assertEqual(result.history.count(), 1)
+        self.assertEqual(result.test_assignment.testenvironment.temperature, 25)
+
+    def test_resubmission_updates_existing_results(self):
+        client, assignments = self.make_batch("AGAIN", 4)
+        self.submit(client, assignments)
+        self.submit(client, assignments)
+        self.assertEqual(TestResult.objects.filter(test_assignment__in=assignments).count(), 4)
+
+
+class PromotionCoordinatorTests(TestCase):
+    """Completed assignments queue one promotion check per (client, parameter)."""
+
+    def setUp(self):
+        self.analyst = User.objects.create_user(username="analyst", password="x", role="analyst")
+        group = ParameterGroup.objects.create(name="Proximate")
+        self.parameter = Parameter.objects.create(
+            name="Protein", group=group, unit="%", method="AOAC 984.13", ref_limit="-", default_price=100,
+        )
+        self.lab_client = Client.objects.create(
+            client_id="PROMO", name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+        self.assignments = []
+        for i in range(10):
+            sample = Sample.objects.create(
+                client=self.lab_client, sample_code=f"PROMO-{i}", sample_type="feed", weight=10,
+                status=SampleStatus.ASSIGNED,
+            )
+            self.assignments.append(TestAssignment.objects.create(
+                sample=sample, parameter=self.parameter, analyst=self.analyst, status="in_progress",
+            ))
+
+    def complete(self, assignments):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with promotion_batch():
+                for assignment in assignments:
+                    assignment.status = "completed"
+                    assignment.save()
+        return callbacks
+
+    def test_promotes_once_all_assignments_are_completed(self):
+        self.complete(self.assignments[:-1])
+        self.assertFalse(Sample.objects.filter(status=SampleStatus.UNDER_REVIEW).exists())
+
+        self.complete(self.assignments[-1:])
+        self.assertEqual(Sample.objects.filter(status=SampleStatus.UNDER_REVIEW).count(), 10)
+        self.assertEqual(Sample.history.filter(status=SampleStatus.UNDER_REVIEW).count(), 10)
+
+    def test_batch_flushes_once(self):
+        callbacks = self.complete(self.assignments)
+        self.assertEqual(sum(1 for callback in callbacks if callback is promotion_flush), 1)
+
+
+class CoaInvalidationTests(TestCase):
+    """Result and assignment writes resolve the clients with stale COAs once per batch."""
+
+    def setUp(self):
+        self.analyst = User.objects.create_user(username="analyst", password="x", role="analyst")
+        group = ParameterGroup.objects.create(name="Proximate")
+        self.parameter = Parameter.objects.create(
+            name="Protein", group=group, unit="%", method="AOAC 984.13", ref_limit="-", default_price=100,
+        )
+        self.lab_client = Client.objects.create(
+            client_id="STALE", name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+        self.assignments = []
+        for i in range(5):
+            sample = Sample.objects.create(
+                client=self.lab_client, sample_code=f"STALE-{i}", sample_type="feed", weight=10,
+                status=SampleStatus.ASSIGNED,
+            )
+            self.assignments.append(TestAssignment.objects.create(
+                sample=sample, parameter=self.parameter, analyst=self.analyst,
+            ))
+
+    def test_saves_do_not_query_clients(self):
+        with mock.patch("lims.utils.coa_cache.invalidate_client_coas") as invalidate:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with CaptureQueriesContext(connection) as queries, coa_invalidation_batch():
+                    for i, assignment in enumerate(self.assignments):
+                        TestResult.objects.create(test_assignment=assignment, value=20 + i, recorded_by=self.analyst)
+        self.assertFalse([q for q in queries if 'FROM "lims_client"' in q["sql"]])
+        self.assertEqual(sum(1 for callback in callbacks if callback is flush_stale_coas), 1)
+        invalidate.assert_called_once_with("STALE")
+
+
+class ReportCacheTests(TestCase):
+    """Report entries and their version stamp live in a cache shared by every process."""
+
+    def test_backend_is_not_process_local(self):
+        self.assertNotIn("LocMemCache", type(report_cache()).__name__)
+
+    def test_bump_retires_cached_entries(self):
+        build = mock.Mock(side_effect=[{"tests": 1}, {"tests": 2}])
+        day = datetime.date(2025, 1, 1)
+        self.assertEqual(cached_report_data("daily", day, day, day, build), {"tests": 1})
+        self.assertEqual(cached_report_data("daily", day, day, day, build), {"tests": 1})
+        bump_report_version()
+        self.assertEqual(cached_report_data("daily", day, day, day, build), {"tests": 2})
+
+
+class CoaReleaseJobTests(TestCase):
+    """Release jobs that were never published, or lost their task, do not block later releases."""
+
+    def setUp(self):
+        self.lab_client = Client.objects.create(
+            client_id="RELEASE", name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+
+    def enqueue(self, **patch):
+        with mock.patch("lims.tasks.release_client_coa_task.delay", **patch) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                job, created = enqueue_coa_release(self.lab_client)
+        job.refresh_from_db()
+        return job, created, delay
+
+    def test_active_job_is_reused(self):
+        first, created, delay = self.enqueue()
+        self.assertTrue(created)
+        delay.assert_called_once_with(first.id)
+        second, created, _ = self.enqueue()
+        self.assertFalse(created)
+        self.assertEqual(second, first)
+
+    def test_publish_failure_marks_the_job_failed(self):
+        job, _, _ = self.enqueue(side_effect=ConnectionError("broker down"))
+        self.assertEqual(job.status, ReleaseJobStatus.FAILED)
+        self.assertIn("broker down", job.last_error)
+        _, created, _ = self.enqueue()
+        self.assertTrue(created)
+
+    def test_stale_job_is_replaced(self):
+        stale = COAReleaseJob.objects.create(client=self.lab_client, status=ReleaseJobStatus.RENDERING)
+        COAReleaseJob.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - release_stale_after() - datetime.timedelta(minutes=1),
+        )
+        job, created, _ = self.enqueue()
+        self.assertTrue(created)
+        self.assertNotEqual(job, stale)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ReleaseJobStatus.FAILED)
+
+    def test_one_active_job_per_client(self):
+        COAReleaseJob.objects.create(client=self.lab_client)
+        with self.assertRaises(IntegrityError):
+            COAReleaseJob.objects.create(client=self.lab_client, status=ReleaseJobStatus.SENDING)
+
+
+class ManagerReportDispatchTests(TestCase):
+    """A report job that cannot be published is failed, not left queued."""
+
+    def test_publish_failure_marks_the_job_failed(self):
+        with mock.patch("lims.tasks.send_manager_report_task.delay", side_effect=ConnectionError("broker down")):
+            with self.captureOnCommitCallbacks(execute=True):
+                job = enqueue_manager_report("month", ["manager@example.com"])
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportDispatchStatus.FAILED)
+        self.assertIn("broker down", job.last_error)
+
+
+class CoaSummaryCacheTests(TestCase):
+    """The interpretation memo and its pending marker live in a cache shared by web and worker."""
+
+    payload = [{"sample_type": "Feed", "results": {"Protein": [20.0, 21.0]}}]
+
+    def setUp(self):
+        self.lab_client = Client.objects.create(
+            client_id="SUMMARY", name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+
+    def test_backend_is_not_process_local(self):
+        self.assertNotIn("LocMemCache", type(summary_cache()).__name__)
+
+    def test_failed_generation_can_be_queued_again(self):
+        with mock.patch("lims.tasks.generate_coa_summary_task.delay"):
+            self.assertTrue(enqueue_coa_summary(self.lab_client, self.payload, "fallback"))
+            self.assertFalse(enqueue_coa_summary(self.lab_client, self.payload, "fallback"))
+        with mock.patch("lims.tasks.generate_dynamic_summary", return_value="Summary generation failed: quota"):
+            generate_coa_summary_task(self.lab_client.pk, self.payload, "fallback")
+        self.assertIsNone(cached_summary(self.payload))
+        with mock.patch("lims.tasks.generate_coa_summary_task.delay"):
+            self.assertTrue(enqueue_coa_summary(self.lab_client, self.payload, "fallback"))
+
+
+class InstrumentImportTests(TestCase):
+    """Batch results imported from instrument exports through the instrument's profile."""
+
+    def setUp(self):
+        self.analyst = User.objects.create_user(username="analyst", password="x", role="analyst")
+        group = ParameterGroup.objects.create(name="Proximate")
+        self.parameter = Parameter.objects.create(
+            name="Protein", group=group, unit="%", method="AOAC 984.13", ref_limit="-", default_price=100,
+        )
+        ControlSpec.objects.create(parameter=self.parameter, min_acceptable=18, max_acceptable=22)
+        self.instrument = Equipment.objects.create(
+            name="Kjeltec", serial_number="KJ-1", date_installed=datetime.date(2024, 1, 1),
+        )
+        self.instrument.parameters_supported.add(self.parameter)
+        InstrumentImportProfile.objects.create(
+            equipment=self.instrument, sample_code_column="Sample ID", value_column="Protein %", header_row=2,
+        )
+        self.lab_client = Client.objects.create(
+            client_id="IMPORT", name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+        self.assignments = []
+        for code in ["IMPORT-1", "IMPORT-2", "QC-IMPORT"]:
+            sample = Sample.objects.create(
+                client=self.lab_client, sample_code=code, sample_type="qc" if code.startswith("QC") else "feed",
+                weight=10, status=SampleStatus.ASSIGNED,
+            )
+            self.assignments.append(TestAssignment.objects.create(
+                sample=sample, parameter=self.parameter, analyst=self.analyst, status="in_progress",
+                is_control=code.startswith("QC"),
+            ))
+        self.client.force_login(self.analyst)
+        self.url = reverse("import_batch_results", args=[self.lab_client.client_id, self.parameter.id])
+
+    def upload(self, name, content):
+        return self.client.post(self.url, {
+            "file": SimpleUploadedFile(name, content),
+            "instrument": self.instrument.id,
+            "temperature": "25",
+            "humidity": "50",
+        })
+
+    def test_csv_import_writes_results_and_qc(self):
+        content = "Kjeltec run 42\nSample ID,Protein %\nIMPORT-1,20.5\nimport-2 ,21\n\nQC-IMPORT,19.9\n"
+        response = self.upload("run.csv", content.encode())
+        self.assertRedirects(
+            response, reverse("result_success_batch", args=[self.lab_client.client_id, self.parameter.id]),
+            fetch_redirect_response=False,
+        )
+        values = dict(TestResult.objects.values_list("test_assignment__sample__sample_code", "value"))
+        self.assertEqual(values, {"IMPORT-1": 20.5, "IMPORT-2": 21.0})
+        self.assertEqual(QCMetrics.objects.get(test_assignment=self.assignments[2]).status, "pass")
+        self.assertEqual(self.assignments[0].testenvironment.instrument, self.instrument)
+
+    def test_xlsx_import(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["Exported by Kjeltec"])
+        ws.append(["Sample ID", "Protein %"])
+        ws.append(["IMPORT-1", 20.5])
+        ws.append(["IMPORT-2", 21])
+        out = io.BytesIO()
+        wb.save(out)
+        self.upload("run.xlsx", out.getvalue())
+        self.assertEqual(TestResult.objects.count(), 2)
+
+    def test_any_bad_row_rejects_the_file(self):
+        content = "header\nSample ID,Protein %\nIMPORT-1,20.5\nOTHER-9,21\nIMPORT-2,n/a\n"
+        response = self.upload("run.csv", content.encode())
+        self.assertRedirects(
+            response, reverse("enter_batch_result", args=[self.lab_client.client_id, self.parameter.id]),
+            fetch_redirect_response=False,
+        )
+        self.assertFalse(TestResult.objects.exists())
+
+    def test_second_control_row_rejects_the_file(self):
+        sample = Sample.objects.create(
+            client=self.lab_client, sample_code="QC-IMPORT-1", sample_type="qc", weight=10,
+            status=SampleStatus.ASSIGNED,
+        )
+        TestAssignment.objects.create(
+            sample=sample, parameter=self.parameter, analyst=self.analyst, status="in_progress", is_control=True,
+        )
+        content = "header\nSample ID,Protein %\nIMPORT-1,20.5\nQC-IMPORT,19.9\nQC-IMPORT-1,30\n"
+        self.upload("run.csv", content.encode())
+        self.assertFalse(TestResult.objects.exists())
+        self.assertFalse(QCMetrics.objects.exists())
+
+
+class SampleAssignmentTests(TestCase):
+    """assign_parameter_tests upserts assignments in bulk and numbers QC/REF samples from a sequence."""
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username="manager", password="x", role="manager")
+        self.analyst = User.objects.create_user(username="analyst", password="x", role="analyst")
+        self.other_analyst = User.objects.create_user(username="analyst2", password="x", role="analyst")
+        group = ParameterGroup.objects.create(name="Proximate")
+        self.parameter = Parameter.objects.create(
+            name="Protein", group=group, unit="%", method="AOAC 984.13", ref_limit="-", default_price=100,
+        )
+        self.client.force_login(self.manager)
+
+    def make_client(self, client_id, size):
+        client = Client.objects.create(
+            client_id=client_id, name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+        samples = [
+            Sample.objects.create(
+                client=client, sample_code=f"{client_id}-{i}", sample_type="feed", weight=10,
+                status=SampleStatus.RECEIVED,
+            )
+            for i in range(size)
+        ]
+        return client, samples
+
+    def post(self, client, samples):
+        url = reverse("assign_parameter_tests", args=[client.client_id, self.parameter.id])
+        data = {"analyst": self.analyst.id, "sample_ids": [s.id for s in samples], "include_reference": "on"}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_query_count_is_constant_in_sample_count(self):
+        small = self.post(*self.make_client("SMALL", 5))
+        large = self.post(*self.make_client("LARGE", 50))
+        self.assertEqual(small, large)
+
+    def test_reassignment_updates_the_row(self):
+        client, samples = self.make_client("AGAIN", 3)
+        assign_samples(client, self.parameter, self.analyst, [s.id for s in samples])
+        assign_samples(client, self.parameter, self.other_analyst, [s.id for s in samples])
+
+        assignments = TestAssignment.objects.filter(sample__in=samples, parameter=self.parameter)
+        self.assertEqual(assignments.count(), 3)
+        self.assertEqual({a.analyst for a in assignments}, {self.other_analyst})
+        history = assignments[0].history.order_by("history_date")
+        self.assertEqual([h.history_type for h in history], ["+", "~"])
+
+    def test_received_samples_become_assigned_with_history(self):
+        client, samples = self.make_client("RECV", 4)
+        assign_samples(client, self.parameter, self.analyst, [s.id for s in samples], assigned_by=self.manager)
+
+        self.assertFalse(Sample.objects.filter(id__in=[s.id for s in samples]).exclude(status=SampleStatus.ASSIGNED).exists())
+        history = Sample.history.filter(id__in=[s.id for s in samples], status=SampleStatus.ASSIGNED)
+        self.assertEqual(history.count(), 4)
+        self.assertEqual({h.history_user for h in history}, {self.manager})
+
+    def test_generated_codes_continue_after_probed_codes(self):
+        client, samples = self.make_client("X", 2)
+        for code in ["QC-X-PRO", "QC-X-PRO-1"]:
+            Sample.objects.create(client=client, sample_code=code, sample_type="qc", weight=0)
+
+        for _ in range(2):
+            assign_samples(client, self.parameter, self.analyst, [s.id for s in samples], include_reference=True)
+
+        codes = set(Sample.objects.filter(client=client).values_list("sample_code", flat=True))
+        self.assertLessEqual({"QC-X-PRO-2", "QC-X-PRO-3", "REF-X-PRO", "REF-X-PRO-1"}, codes)
+
+
+class AssignmentOverviewTests(TestCase):
+    """assign_overview_all_clients is built from grouped queries, one page of clients at a time."""
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username="manager", password="x", role="manager")
+        group = ParameterGroup.objects.create(name="Proximate")
+        self.parameter = Parameter.objects.create(
+            name="Protein", group=group, unit="%", method="AOAC 984.13", ref_limit="-", default_price=100,
+        )
+        self.client.force_login(self.manager)
+        self.url = reverse("assign_overview_all_clients")
+
+    def make_client(self, client_id, assigned, unassigned):
+        client = Client.objects.create(
+            client_id=client_id, name="C", organization="O", email="c@example.com", phone="1", address="A",
+        )
+        for i in range(assigned + unassigned):
+            sample = Sample.objects.create(
+                client=client, sample_code=f"{client_id}-{i}", sample_type="feed", weight=10,
+                status=SampleStatus.ASSIGNED if i < assigned else SampleStatus.RECEIVED,
+            )
+            if i < assigned:
+                TestAssignment.objects.create(sample=sample, parameter=self.parameter, analyst=self.manager)
+        return client
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_is_constant_in_client_count(self):
+        self.make_client("FEW-1", 2, 1)
+        _, few = self.get()
+        for i in range(20):
+            self.make_client(f"MANY-{i:02}", 2, 1)
+        _, many = self.get()
+        self.assertEqual(few, many)
+
+    def test_pending_filter_and_progress(self):
+        self.make_client("DONE", 3, 0)
+        self.make_client("OPEN", 1, 2)
+        response, _ = self.get(pending="1")
+        entries = response.context["client_data"]
+        self.assertEqual([entry["client"].client_id for entry in entries], ["OPEN"])
+        self.assertEqual(entries[0]["total_samples"], 3)
+        self.assertEqual(entries[0]["parameters"][0]["assigned_count"], 1)
+        self.assertEqual(len(entries[0]["unassigned_samples"]), 2)
+
+        response, _ = self.get()
+        self.assertEqual(response.context["page_obj"].paginator.count, 2)
+
+    def test_generated_qc_and_reference_samples_are_not_counted(self):
+        client = self.make_client("FULL", 0, 3)
+        fat = Parameter.objects.create(
+            name="Fat", group=self.parameter.group, unit="%", method="AOAC 2003.05", ref_limit="-", default_price=100,
+        )
+        sample_ids = list(Sample.objects.filter(client=client).values_list("id", flat=True))
+        for parameter in (self.parameter, fat):
+            assign_samples(client, parameter, self.manager, sample_ids, include_reference=True)
 
-# Create your tests here.
+        response, _ = self.get(pending="1")
+        self.assertEqual(response.context["client_data"], [])
+        entry = self.get()[0].context["client_data"][0]
+        self.assertEqual(entry["total_samples"], 3)
+        self.assertEqual([param["assigned_count"] for param in entry["parameters"]], [3, 3])
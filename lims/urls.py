@@ -37,6 +37,7 @@ urlpatterns = [
     path('reagent/send/', send_reagent_request, name='send_reagent_request'),
     path('reagent/issues/', reagent_issue_list, name='reagent_issue_list'),
     path('send-report/', send_manager_report, name='send_manager_report'),
+    path('send-report/job/<int:job_id>/', report_dispatch_status, name='report_dispatch_status'),
     path("expenses/new/", expense_create, name="expense_create"),
 
 
@@ -133,7 +134,12 @@ urlpatterns = [
     path("generate_coa/<str:client_id>/", views.generate_coa_pdf, name="generate_coa"),
     path("generate_coa/<str:client_id>/", views.generate_coa_pdf, name="generate_coa"),
     path("coa/release/client/<int:client_id>/", views.release_client_coa, name="release_client_coa"),
+    path("coa/release/job/<int:job_id>/", views.coa_release_job_status, name="coa_release_job_status"),
+    path("coa/release/ready/", views.release_ready_coas, name="release_ready_coas"),
+    path("coa_dashboard/client/<int:client_id>/samples/", views.coa_dashboard_samples, name="coa_dashboard_samples"),
+    path("preview_coa/<str:client_id>/summary/", views.coa_summary_status, name="coa_summary_status"),
     path('results/batch/<str:client_id>/<int:parameter_id>/', views.enter_batch_result, name='enter_batch_result'),
+    path('results/batch/<str:client_id>/<int:parameter_id>/import/', views.import_batch_results, name='import_batch_results'),
     path("generate_unaccredited_coa/<str:client_id>/", views.generate_unaccredited_coa_pdf, name="generate_unaccredited_coa"),
 
 
@@ -146,6 +152,7 @@ urlpatterns = [
     path("analyst/begin-analysis/<str:client_id>/<int:parameter_id>/", views.begin_parameter_analysis, name="begin_parameter_analysis"),
     path('analyst/results/history/', views.result_history_view, name='result_history'),
     path("reports/productivity/", analyst_productivity_view, name="analyst_productivity"),
+    path("reports/productivity/distribution/", productivity_distribution_json, name="productivity_distribution"),
 
     #api endpoints
     path("api/sample_status/", views.sample_status_json, name="sample_status_json"),
@@ -1,20 +1,60 @@
-import google.generativeai as genai
-from django.conf import settings
+"""
+Module: ai_helpers.py
+Description: Weekly efficiency nudges for analysts.
 
-genai.configure(api_key=settings.GEMINI_API_KEY)
+Nudges are written once a week by the snapshot job (lims.utils.efficiency_snapshots)
+through the configured text provider (lims.utils.ai_providers) and stored on
+the snapshot. When the provider is unavailable the deterministic local
+message below is stored instead, so the dashboard only ever reads text.
+"""
 
-def generate_efficiency_nudge(analyst_name, my_avg_sec, percentile_rank, test_count):
-    prompt = (
+import logging
+
+from lims.utils.ai_providers import AIProviderError, StubProvider, get_provider
+
+logger = logging.getLogger(__name__)
+
+
+def _format_duration(seconds):
+    minutes = int(seconds // 60)
+    if minutes >= 60:
+        return f"{minutes // 60}h {minutes % 60}m"
+    return f"{minutes}m {int(seconds % 60)}s"
+
+
+def fallback_nudge(analyst_name, my_avg_sec, percentile_rank, test_count):
+    """Local, deterministic nudge used when no provider text is available."""
+    opener = (
+        "Outstanding pace" if percentile_rank >= 75
+        else "Solid work" if percentile_rank >= 40
+        else "Thanks for your steady effort"
+    )
+    ranking = f", faster than {percentile_rank}% of the team" if percentile_rank else ""
+    return (
+        f"{opener}, {analyst_name}! You completed {test_count} test{'s' if test_count != 1 else ''} last week "
+        f"with an average bench time of {_format_duration(my_avg_sec)}{ranking}. Keep it up."
+    )
+
+
+def build_nudge_prompt(analyst_name, my_avg_sec, percentile_rank, test_count):
+    return (
         f"Create a short, positive message addressed to {analyst_name} who completed {test_count} lab tests this week. "
         f"Their average test duration was {int(my_avg_sec)} seconds, placing them in the top {percentile_rank} percentile. "
         "Encourage them with enthusiasm but keep it professional and human. Limit to 2–3 sentences."
     )
 
-    model = genai.GenerativeModel("gemini-2.5-flash")  
-
-    response = model.generate_content(prompt)
 
+def generate_efficiency_nudge(analyst_name, my_avg_sec, percentile_rank, test_count):
+    """
+    Nudge text from the configured provider, or the local fallback when the
+    provider is the offline stub or fails.
+    """
     try:
-        return response.text.strip()
-    except AttributeError:
-        return response.candidates[0].content.parts[0].text.strip()
+        provider = get_provider()
+        if isinstance(provider, StubProvider):
+            return fallback_nudge(analyst_name, my_avg_sec, percentile_rank, test_count)
+        text = provider.generate(build_nudge_prompt(analyst_name, my_avg_sec, percentile_rank, test_count))
+    except (AIProviderError, ImportError) as e:
+        logger.warning("Efficiency nudge generation failed for %s: %s", analyst_name, e)
+        text = ""
+    return text or fallback_nudge(analyst_name, my_avg_sec, percentile_rank, test_count)
@@ -0,0 +1,86 @@
+"""
+Module: ai_providers.py
+Description: Pluggable text-generation backends for the AI features
+(COA interpretations, analyst nudges).
+
+settings.AI_PROVIDER picks the backend:
+    "gemini"  Google Gemini (needs GEMINI_API_KEY)
+    "stub"    deterministic offline text, for tests and local development
+When unset, Gemini is used if an API key is configured, otherwise the stub.
+"""
+
+import re
+
+from django.conf import settings
+
+
+class AIProviderError(Exception):
+    """The provider could not produce text."""
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self):
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        self._genai = genai
+        self.model = getattr(settings, "AI_MODEL", "gemini-2.5-flash")
+
+    def generate(self, prompt):
+        try:
+            response = self._genai.GenerativeModel(self.model).generate_content(prompt)
+            try:
+                text = response.text
+            except (AttributeError, ValueError):
+                text = response.candidates[0].content.parts[0].text
+        except Exception as exc:
+            raise AIProviderError(str(exc)) from exc
+        return (text or "").strip()
+
+
+class StubProvider:
+    """
+    Offline provider. Returns a short, deterministic text built from the
+    "Name: v1, v2" data lines in the prompt, so the same prompt always
+    yields the same answer.
+    """
+
+    name = "stub"
+    DATA_LINE = re.compile(r"^([^:\n]+):\s*([-\d.,\s]+)$", re.MULTILINE)
+
+    def generate(self, prompt):
+        parts = []
+        for name, raw in self.DATA_LINE.findall(prompt):
+            values = [float(v) for v in re.findall(r"-?\d+(?:\.\d+)?", raw)]
+            if values:
+                parts.append(f"{name.strip()} averaged {sum(values) / len(values):.2f}")
+        if not parts:
+            return "Results are within the expected ranges for this sample type."
+        return "Offline interpretation: " + "; ".join(parts) + "."
+
+
+PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    StubProvider.name: StubProvider,
+}
+
+_instances = {}
+
+
+def provider_name():
+    name = getattr(settings, "AI_PROVIDER", None)
+    if name:
+        return name
+    return GeminiProvider.name if getattr(settings, "GEMINI_API_KEY", None) else StubProvider.name
+
+
+def get_provider():
+    """The configured provider (one instance per process)."""
+    name = provider_name()
+    if name not in PROVIDERS:
+        raise AIProviderError(f"Unknown AI_PROVIDER {name!r}; expected one of {sorted(PROVIDERS)}")
+    if name not in _instances:
+        _instances[name] = PROVIDERS[name]()
+    return _instances[name]
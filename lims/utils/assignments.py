@@ -0,0 +1,258 @@
+"""
+Module: assignments.py
+Description: Bulk assignment of a client's samples to an analyst for one parameter.
+
+assign_samples() upserts every selected assignment in one
+INSERT ... ON CONFLICT (sample, parameter) DO UPDATE and moves RECEIVED
+samples to ASSIGNED with one filtered UPDATE. The QC and reference samples
+it adds get their codes from SampleCodeSequence instead of probing for a
+free code. History rows are written in bulk. The rollup and COA work that
+per-row saves used to trigger through signals is scheduled explicitly.
+
+The all-clients overview is built from two grouped queries (samples per
+client, assignments per client and parameter), with per-client rollups in
+Python. Only the page's clients and their unassigned samples are loaded.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.utils import timezone
+
+from lims.models import Client, Sample, SampleCodeSequence, SampleStatus, TestAssignment
+from lims.utils.coa_cache import invalidate_client_coas
+from lims.utils.report_cache import bump_report_version
+from lims.utils.rollups import local_day, mark_dirty
+
+QC_REQUIRED_GROUPS = ("Proximate", "Gross Energy")
+REFERENCE_GROUPS = ("Proximate",)
+
+OVERVIEW_PAGE_SIZE = 25
+
+
+def code_prefix(kind, client, parameter):
+    """e.g. QC-JGLSP1-PRO for the QC sample of a client's Protein batch."""
+    return f"{kind}-{client.client_id}-{parameter.name[:3].upper()}"
+
+
+def _format_code(prefix, number):
+    # The first code is the bare prefix, then PREFIX-1, PREFIX-2, ...
+    return prefix if number == 1 else f"{prefix}-{number - 1}"
+
+
+def _codes_in_use(client, prefix):
+    """How many numbers of `prefix` were handed out before the client had a sequence row."""
+    highest = 0
+    for code in Sample.objects.filter(client=client, sample_code__startswith=prefix).values_list("sample_code", flat=True):
+        suffix = code[len(prefix):]
+        if suffix == "":
+            highest = max(highest, 1)
+        elif suffix[:1] == "-" and suffix[1:].isdigit():
+            highest = max(highest, int(suffix[1:]) + 1)
+    return highest
+
+
+def next_sample_code(client, kind, parameter):
+    """Allocate the next generated sample code for a client (atomic across requests)."""
+    prefix = code_prefix(kind, client, parameter)
+    with transaction.atomic():
+        SampleCodeSequence.objects.get_or_create(
+            client=client, prefix=prefix, defaults={"last_value": _codes_in_use(client, prefix)},
+        )
+        sequence = SampleCodeSequence.objects.select_for_update().get(client=client, prefix=prefix)
+        sequence.last_value += 1
+        sequence.save(update_fields=["last_value"])
+    return _format_code(prefix, sequence.last_value)
+
+
+def _add_generated_sample(client, parameter, analyst, kind, sample_type, **flags):
+    sample = Sample.objects.create(
+        client=client,
+        sample_code=next_sample_code(client, kind, parameter),
+        sample_type=sample_type,
+        weight=0,
+        status=SampleStatus.ASSIGNED,
+    )
+    return TestAssignment.objects.create(sample=sample, parameter=parameter, analyst=analyst, **flags)
+
+
+def assign_samples(client, parameter, analyst, sample_ids, control_sample_id=None,
+                   include_reference=False, assigned_by=None):
+    """
+    Assign `sample_ids` of `client` to `analyst` for `parameter`, re-assigning
+    existing assignments. Adds a reference sample (when requested, for the
+    groups that use one) and a QC sample (for the groups that require one).
+    Returns the number of samples assigned, excluding QC and reference.
+    """
+    sample_ids = list(sample_ids)
+    now = timezone.now()
+
+    with transaction.atomic():
+        previous = dict(
+            TestAssignment.objects.filter(sample_id__in=sample_ids, parameter=parameter)
+            .values_list("sample_id", "assigned_date")
+        )
+        TestAssignment.objects.bulk_create(
+            [
+                TestAssignment(
+                    sample_id=sample_id,
+                    parameter=parameter,
+                    analyst=analyst,
+                    is_control=sample_id == control_sample_id,
+                    assigned_date=now,
+                )
+                for sample_id in sample_ids
+            ],
+            update_conflicts=True,
+            unique_fields=["sample", "parameter"],
+            update_fields=["analyst", "is_control", "assigned_date"],
+        )
+        saved = list(TestAssignment.objects.filter(sample_id__in=sample_ids, parameter=parameter))
+        TestAssignment.history.bulk_history_create(
+            [a for a in saved if a.sample_id not in previous], default_user=assigned_by,
+        )
+        TestAssignment.history.bulk_history_create(
+            [a for a in saved if a.sample_id in previous], update=True, default_user=assigned_by,
+        )
+
+        received = list(Sample.objects.filter(id__in=sample_ids, status=SampleStatus.RECEIVED))
+        if received:
+            Sample.objects.filter(
+                id__in=[s.id for s in received], status=SampleStatus.RECEIVED,
+            ).update(status=SampleStatus.ASSIGNED)
+            for sample in received:
+                sample.status = SampleStatus.ASSIGNED
+            Sample.history.bulk_history_create(received, update=True, default_user=assigned_by)
+            transaction.on_commit(bump_report_version)
+
+        if include_reference and parameter.group.name in REFERENCE_GROUPS:
+            _add_generated_sample(client, parameter, analyst, "REF", "reference", is_reference=True)
+        if parameter.group.name in QC_REQUIRED_GROUPS:
+            _add_generated_sample(client, parameter, analyst, "QC", "qc", is_control=True)
+
+        # The bulk upsert skips the assignment signals
+        mark_dirty("workload", local_day(now))
+        for assigned_date in set(map(local_day, previous.values())):
+            mark_dirty("workload", assigned_date)
+        transaction.on_commit(lambda: invalidate_client_coas(client.client_id))
+
+    return len(sample_ids)
+
+
+def assignment_lookup(sample_ids, parameter):
+    """
+    {sample_id: (analyst full name, is_control)} for the parameter's
+    assignments of the given samples, in one query.
+    """
+    rows = TestAssignment.objects.filter(sample_id__in=sample_ids, parameter=parameter).values_list(
+        "sample_id", "analyst__first_name", "analyst__last_name", "is_control",
+    )
+    return {
+        sample_id: (f"{first or ''} {last or ''}".strip(), is_control)
+        for sample_id, first, last, is_control in rows
+    }
+
+
+def _generated(prefix=""):
+    """QC and reference samples, which assign_samples() adds itself; assign_parameter_tests never offers them."""
+    return Q(**{f"{prefix}sample_type__iexact": "qc"}) | Q(**{f"{prefix}sample_type__iexact": "reference"})
+
+
+def _analyst_assigned(sample_ref="pk"):
+    return Exists(TestAssignment.objects.filter(sample=OuterRef(sample_ref), analyst__isnull=False))
+
+
+def client_assignment_stats():
+    """
+    Assignment progress of every client, from two grouped queries:
+    {client pk: {"total_samples", "unassigned_count", "parameters", "assigned_lookup", "control_lookup"}}.
+    Generated QC and reference samples do not count towards the totals.
+    """
+    stats = defaultdict(lambda: {
+        "total_samples": 0,
+        "unassigned_count": 0,
+        "parameters": [],
+        "assigned_lookup": {},
+        "control_lookup": {},
+    })
+
+    sample_rows = (
+        Sample.objects.exclude(_generated())
+        .annotate(has_analyst=_analyst_assigned())
+        .values("client_id")
+        .annotate(total=Count("id"), unassigned=Count("id", filter=Q(has_analyst=False)))
+        .order_by()
+    )
+    for row in sample_rows:
+        stats[row["client_id"]]["total_samples"] = row["total"]
+        stats[row["client_id"]]["unassigned_count"] = row["unassigned"]
+
+    assignable = ~_generated("sample__")
+    parameter_rows = (
+        TestAssignment.objects
+        .values("sample__client_id", "parameter_id", "parameter__name")
+        .annotate(
+            tests=Count("id", filter=assignable),
+            assigned=Count("sample", distinct=True, filter=assignable & Q(analyst__isnull=False)),
+            control_sample_id=Max("sample_id", filter=Q(is_control=True)),
+        )
+        .order_by("parameter__name")
+    )
+    for row in parameter_rows:
+        entry = stats[row["sample__client_id"]]
+        if row["control_sample_id"] is not None:
+            entry["control_lookup"][row["parameter_id"]] = row["control_sample_id"]
+        if not row["tests"]:
+            continue
+        entry["assigned_lookup"][row["parameter_id"]] = row["assigned"]
+        entry["parameters"].append({
+            "id": row["parameter_id"],
+            "name": row["parameter__name"],
+            "assigned_count": row["assigned"],
+        })
+    return stats
+
+
+def has_pending_work(entry):
+    """Unassigned samples, or a parameter not yet assigned for every sample."""
+    if entry is None:
+        return False
+    return bool(entry["unassigned_count"]) or any(
+        param["assigned_count"] < entry["total_samples"] for param in entry["parameters"]
+    )
+
+
+def overview_client_ids(stats, pending_only=False):
+    ids = Client.objects.order_by("-client_id").values_list("id", flat=True)
+    if pending_only:
+        return [client_id for client_id in ids if has_pending_work(stats.get(client_id))]
+    return list(ids)
+
+
+def overview_entries(client_ids, stats):
+    """Template rows for one page of clients (two queries)."""
+    clients = Client.objects.in_bulk(client_ids)
+    unassigned = defaultdict(list)
+    for sample in (
+        Sample.objects.filter(client_id__in=client_ids)
+        .exclude(_generated())
+        .exclude(_analyst_assigned())
+        .order_by("id")
+    ):
+        unassigned[sample.client_id].append(sample)
+
+    entries = []
+    for client_id in client_ids:
+        entry = stats.get(client_id) or {
+            "total_samples": 0, "parameters": [], "assigned_lookup": {}, "control_lookup": {},
+        }
+        entries.append({
+            "client": clients[client_id],
+            "parameters": entry["parameters"],
+            "assigned_lookup": entry["assigned_lookup"],
+            "total_samples": entry["total_samples"],
+            "unassigned_samples": unassigned.get(client_id, []),
+            "control_lookup": entry["control_lookup"],
+        })
+    return entries
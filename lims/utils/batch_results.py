@@ -0,0 +1,107 @@
+"""
+Module: batch_results.py
+Description: Set-based persistence for batch result entry.
+
+A batch is one client's assignments for one parameter. Once every value has
+validated, write_batch_results() stores the results, the shared test
+environment and the assignment statuses in a fixed number of statements
+regardless of batch size:
+- new results are bulk-created; existing results and assignments are
+  updated set-wise; audit rows are written in bulk;
+- environments are upserted in one statement;
+- promotion is checked once for the whole batch (lims.utils.promotion).
+
+Bulk writes skip model signals, so the COA and report cache work those
+signals would have done is scheduled here.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history
+
+from lims.models import TestAssignment, TestEnvironment, TestResult
+from lims.utils.coa_cache import invalidate_client_coas
+from lims.utils.derived import update_derived_results
+from lims.utils.promotion import promote_pairs
+from lims.utils.report_cache import bump_report_version
+
+ENVIRONMENT_FIELDS = ["temperature", "humidity", "pressure", "instrument", "recorded_by"]
+
+
+def promote_client_if_complete(client, parameter, user=None):
+    """
+    Move the client's samples to UNDER_REVIEW when every assignment for
+    `parameter` is completed, right away rather than at commit. Returns True
+    when every assignment is completed.
+    """
+    return (client.pk, parameter.pk) in promote_pairs({(client.pk, parameter.pk)}, user=user)
+
+
+def write_batch_results(client, results, environment, user, control_assignment=None):
+    """
+    Persist a validated batch. `results` is a list of (assignment, unsaved
+    TestResult) pairs, new or existing, with the value set; `environment` is
+    an unsaved TestEnvironment carrying the shared conditions and instrument. `control_assignment`, if any, is marked
+    completed alongside the test assignments (its QC record is saved by the
+    caller). Returns the written results.
+    """
+    now = timezone.now()
+    to_create, to_update = [], []
+    environments = []
+    assignments = []
+
+    for assignment, result in results:
+        result.test_assignment = assignment
+        result.recorded_by = user
+        result.source = "manual"
+        result.recorded_at = now
+        (to_update if result.pk else to_create).append(result)
+
+        environments.append(TestEnvironment(
+            test_assignment=assignment,
+            temperature=environment.temperature,
+            humidity=environment.humidity,
+            pressure=environment.pressure,
+            instrument=environment.instrument,
+            recorded_by=user,
+        ))
+
+        assignment.status = "completed"
+        assignment.equipment_used = environment.instrument
+        assignments.append(assignment)
+
+    if control_assignment is not None:
+        control_assignment.status = "completed"
+        assignments.append(control_assignment)
+
+    with transaction.atomic():
+        if to_create:
+            bulk_create_with_history(to_create, TestResult, default_user=user)
+        if to_update:
+            # Only the value differs per row; the rest is one plain UPDATE
+            TestResult.objects.bulk_update(to_update, ["value"])
+            TestResult.objects.filter(id__in=[r.id for r in to_update]).update(
+                recorded_by=user, source="manual", recorded_at=now,
+            )
+            TestResult.history.bulk_history_create(to_update, update=True, default_user=user)
+        TestEnvironment.objects.bulk_create(
+            environments,
+            update_conflicts=True,
+            unique_fields=["test_assignment"],
+            update_fields=ENVIRONMENT_FIELDS,
+        )
+        # Every assignment gets the same status and instrument: two plain UPDATEs, history in bulk
+        TestAssignment.objects.filter(id__in=[a.id for a, _ in results]).update(
+            status="completed", equipment_used=environment.instrument,
+        )
+        if control_assignment is not None:
+            TestAssignment.objects.filter(id=control_assignment.id).update(status="completed")
+        if assignments:
+            TestAssignment.history.bulk_history_create(assignments, update=True, default_user=user)
+
+        update_derived_results({a.sample_id for a, _ in results}, recorded_by=user)
+
+        transaction.on_commit(lambda: invalidate_client_coas(client.client_id))
+        transaction.on_commit(bump_report_version)
+
+    return to_create + to_update
@@ -1,13 +1,14 @@
-from decimal import Decimal, ROUND_HALF_UP
+from lims.utils.derived_parameters import component_values, evaluate
 
 
 def calculate_cho_and_me(moisture, protein, fat, fiber, ash):
-    try:
-        cho = round(100 - (moisture + protein + fat + fiber + ash), 2)
-        me = round((4 * protein) + (9 * fat) + (4 * cho), 2)
-        return cho, me
-    except:
-        return None, None
+    """
+    (CHO %, ME kcal/kg) from the proximate values, or None for a value whose
+    inputs are missing. ME is ×10 (kcal/kg), not the kcal/100 g this returned
+    before the derived-parameter registry.
+    """
+    derived = evaluate([{"moisture": moisture, "protein": protein, "fat": fat, "fiber": fiber, "ash": ash}])[0]
+    return derived.get("CHO"), derived.get("ME")
 
 
 def calculate_nfe_and_me(results: dict) -> tuple:
@@ -20,22 +21,8 @@ def calculate_nfe_and_me(results: dict) -> tuple:
         "Moisture": 10.3,
         "Fiber": 2.1
     }
-    Returns (Carbohydrate (NFE), ME) or (None, None)
+    Returns (Carbohydrate (NFE), ME in kcal/kg) or (None, None) when any
+    input is missing. Formulas are the ones in lims.utils.derived_parameters.
     """
-    try:
-        protein = Decimal(results.get("Protein", 0))
-        fat = Decimal(results.get("Fat", 0))
-        ash = Decimal(results.get("Ash", 0))
-        moisture = Decimal(results.get("Moisture", 0))
-        fiber = Decimal(results.get("Fiber", 0))
-
-        nfe = Decimal("100") - (protein + fat + ash + moisture + fiber)
-        me = (protein * 4) + (fat * 9) + (nfe * 4)
-
-        nfe = nfe.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        me = me.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-        return float(nfe), float(me)
-    except Exception as e:
-        print("[calculate_nfe_and_me] Error:", e)
-        return None, None
+    derived = evaluate([component_values(results)])[0]
+    return derived.get("CHO"), derived.get("ME")
@@ -0,0 +1,225 @@
+"""
+Module: coa_cache.py
+Description: Content-addressed store for rendered COA PDFs.
+
+A COA only changes when the client's result rows, the interpretation text,
+the COA template or the letterhead change. We hash exactly those inputs and
+keep the rendered PDF in default_storage under that hash, so repeat downloads
+are served as a plain file read instead of a fresh WeasyPrint render.
+
+The key already changes with the data, so dropping old artifacts is only
+housekeeping. Signal handlers call mark_coas_stale() with the ids they have
+at hand; the affected clients are resolved with one query per request or
+transaction, in the same way as the report rollups.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import datetime
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+
+from lims.models import Client
+from lims.models.coa import COAInterpretation
+from lims.utils.coa_dataset import coa_rows
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+# Bump whenever lims/coa/coa_template.html (or the context it receives) changes
+# in a way that should invalidate every stored COA.
+COA_TEMPLATE_VERSION = "3"
+
+COA_CACHE_ROOT = "coa_cache"
+
+LETTERHEADS = {
+    True: "letterheads/accredited_letterhead.png",
+    False: "letterheads/unaccredited_letterhead.jpg",
+}
+
+
+def _coa_kind(accredited):
+    return "accredited" if accredited else "unaccredited"
+
+
+def _asset_fingerprint(path):
+    """
+    Identify a static asset by name, size and mtime so a replaced letterhead
+    produces a new cache key without hashing the image on every request.
+    """
+    found = finders.find(path) or os.path.join(settings.STATIC_ROOT, path)
+    try:
+        stat = os.stat(found)
+    except OSError:
+        return [path, None, None]
+    return [path, stat.st_size, int(stat.st_mtime)]
+
+
+def coa_cache_key(client, accredited=True, rows=None):
+    """
+    Hash of the client's result rows, interpretation text, template version
+    and letterhead. Any change to those inputs yields a different key.
+    Pass `rows` (from coa_rows) to reuse rows already fetched for rendering.
+    """
+    if rows is None:
+        rows = coa_rows(client)
+    summary_text = (
+        COAInterpretation.objects
+        .filter(client=client)
+        .values_list("summary_text", flat=True)
+        .first()
+    )
+    payload = {
+        "client": [client.client_id, client.name, client.organization,
+                   client.address, client.email, client.phone],
+        "rows": rows,
+        "summary": summary_text,
+        "template": COA_TEMPLATE_VERSION,
+        "letterhead": _asset_fingerprint(LETTERHEADS[accredited]),
+        "kind": _coa_kind(accredited),
+        # The report date is printed on the certificate itself
+        "date": datetime.date.today().isoformat(),
+    }
+    encoded = json.dumps(payload, default=str, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _client_dir(client_id):
+    return f"{COA_CACHE_ROOT}/{client_id}"
+
+
+def _artifact_path(client, accredited, key):
+    return f"{_client_dir(client.client_id)}/{_coa_kind(accredited)}-{key}.pdf"
+
+
+def open_cached_coa(client, accredited, key):
+    """
+    Return an open file for the stored COA matching `key`, or None on a miss.
+    """
+    path = _artifact_path(client, accredited, key)
+    try:
+        if default_storage.exists(path):
+            return default_storage.open(path, "rb")
+    except Exception:
+        logger.exception("Could not read cached COA %s", path)
+    return None
+
+
+def store_coa(client, accredited, key, pdf_bytes):
+    """
+    Save rendered COA bytes under `key`, replacing older artifacts of the
+    same kind for this client.
+    """
+    path = _artifact_path(client, accredited, key)
+    try:
+        _purge(client.client_id, prefix=f"{_coa_kind(accredited)}-", keep=path)
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(pdf_bytes))
+    except Exception:
+        # A cache write failure must never break the download itself
+        logger.exception("Could not store COA artifact %s", path)
+
+
+def _purge(client_id, prefix="", keep=None):
+    directory = _client_dir(client_id)
+    try:
+        _, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for name in files:
+        path = f"{directory}/{name}"
+        if name.startswith(prefix) and path != keep:
+            default_storage.delete(path)
+
+
+def invalidate_client_coas(client_id):
+    """
+    Drop every stored COA for a client. Called from signals whenever one of
+    the client's results, assignments or interpretation changes.
+    """
+    try:
+        _purge(client_id)
+    except Exception:
+        logger.exception("Could not invalidate COA artifacts for %s", client_id)
+
+
+STALE_LOOKUPS = {
+    "client": "id__in",
+    "sample": "sample__id__in",
+    "assignment": "sample__testassignment__id__in",
+}
+
+
+def _pending():
+    pending = getattr(_state, "pending", None)
+    if pending is None:
+        pending = _state.pending = {kind: set() for kind in STALE_LOOKUPS}
+    return pending
+
+
+def _flush_scheduled():
+    return any(item[1] is flush_stale_coas for item in connection.run_on_commit)
+
+
+def mark_coas_stale(kind, pk):
+    """
+    Queue the client behind a Client, Sample or TestAssignment pk (`kind`
+    "client", "sample" or "assignment") for COA invalidation after the
+    current commit. No query is run here.
+    """
+    if pk is None:
+        return
+    _pending()[kind].add(pk)
+    if not getattr(_state, "depth", 0) and not _flush_scheduled():
+        transaction.on_commit(flush_stale_coas)
+
+
+@contextmanager
+def coa_invalidation_batch():
+    """Collect every mark made inside the block and resolve them in one flush."""
+    _state.depth = getattr(_state, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        pending = getattr(_state, "pending", None)
+        if not _state.depth and pending and any(pending.values()):
+            transaction.on_commit(flush_stale_coas)
+
+
+def flush_stale_coas():
+    pending, _state.pending = getattr(_state, "pending", None), None
+    if not pending or not any(pending.values()):
+        return
+    condition = Q()
+    for kind, pks in pending.items():
+        if pks:
+            condition |= Q(**{STALE_LOOKUPS[kind]: pks})
+    try:
+        client_ids = set(Client.objects.filter(condition).values_list("client_id", flat=True))
+    except Exception:
+        logger.exception("Could not resolve clients for stale COAs")
+        return
+    for client_id in client_ids:
+        invalidate_client_coas(client_id)
+
+
+class CoaInvalidationBatchMiddleware:
+    """Resolves the COAs made stale while handling a request in one batch."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coa_invalidation_batch():
+            return self.get_response(request)
@@ -0,0 +1,229 @@
+"""
+Module: coa_dataset.py
+Description: Single-pass builder for everything that goes on a COA.
+
+Preview, download and release all need the same thing: the client's non-QC
+samples, their results split into accredited / unaccredited parameter groups,
+the derived CHO/ME values and the parameter header rows. CoaDataset builds it
+once from one flat values() query instead of walking prefetched model
+instances (and copying samples) in every view.
+"""
+
+import re
+from collections import defaultdict
+
+from django.db.models import Q
+
+from lims.models import TestAssignment
+from lims.utils.derived_parameters import REGISTRY, component_values, evaluate, stored_name
+
+
+ACCREDITED_GROUPS = {
+    "Gross Energy",
+    "Vitamins & Contaminants",
+    "Aflatoxin",
+    "CHO",
+    "ME",
+    "Fiber",
+    "Fiber Fractions",
+    "Proximate",
+}
+
+DEFAULT_ENVIRONMENT = "Ambient 25°C 50%RH"
+
+COA_ROW_FIELDS = (
+    "sample_id",
+    "sample__sample_code",
+    "sample__sample_type",
+    "sample__weight",
+    "sample__received_date",
+    "parameter__name",
+    "parameter__unit",
+    "parameter__method",
+    "parameter__group__name",
+    "testresult__value",
+    "testenvironment__temperature",
+    "testenvironment__humidity",
+)
+
+
+def clean_method(method_str):
+    """
+    Extracts only the AOAC reference from a full method string.
+    E.g., from 'Kjedahl (AOAC 984.13 2000)' it returns 'AOAC 984.13'
+    """
+    if not method_str:
+        return ""
+    match = re.search(r"(AOAC\s+\d{3,4}\.\d{1,2})", method_str, re.IGNORECASE)
+    return match.group(1) if match else " ".join(method_str.split())
+
+
+def coa_assignments(client):
+    """
+    The client's test assignments that belong on a COA (QC samples excluded).
+    """
+    return (
+        TestAssignment.objects
+        .filter(sample__client=client)
+        .exclude(Q(sample__sample_type__iexact="qc") | Q(sample__sample_code__istartswith="qc-"))
+    )
+
+
+def coa_rows(client):
+    """
+    Flat, ordered tuples (COA_ROW_FIELDS) for every COA assignment of a client.
+    """
+    return list(
+        coa_assignments(client)
+        .order_by("sample_id", "id")
+        .values_list(*COA_ROW_FIELDS)
+    )
+
+
+def weight_display(weights):
+    weights = [w for w in weights if w is not None]
+    if not weights:
+        return "N/A"
+    low, high = min(weights), max(weights)
+    return f"{low} g" if low == high else f"{low} g – {high} g"
+
+
+class CoaSample:
+    """One sample column/row of a COA. `results` holds only this section's values."""
+
+    __slots__ = ("id", "sample_code", "sample_type", "weight", "received_date", "environment", "results")
+
+    def __init__(self, meta, environment):
+        self.id, self.sample_code, self.sample_type, self.weight, self.received_date = meta
+        self.environment = environment
+        self.results = []
+
+
+class CoaSection:
+    """
+    The samples and parameter header for one certificate (accredited,
+    unaccredited, or everything for the preview).
+    """
+
+    def __init__(self):
+        self.samples = []
+        self._reported = {}   # name -> (unit, method) for parameters with a value
+        self._assigned = {}   # name -> (unit, method) for every assigned parameter
+
+    def __bool__(self):
+        return bool(self.samples)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @staticmethod
+    def _rows(parameters):
+        return [
+            {"name": name, "unit": unit, "method": clean_method(method)}
+            for name, (unit, method) in sorted(parameters.items(), key=lambda item: item[0].lower())
+        ]
+
+    @property
+    def parameters(self):
+        return self._rows(self._reported)
+
+    @property
+    def assigned_parameters(self):
+        return self._rows(self._assigned)
+
+    @property
+    def sample_weight_display(self):
+        return weight_display(s.weight for s in self.samples)
+
+    def sample_chunks(self, chunk_size=20):
+        return [self.samples[i:i + chunk_size] for i in range(0, len(self.samples), chunk_size)]
+
+
+class CoaDataset:
+    """
+    All COA data for a client, built in one pass over `coa_rows(client)`.
+
+    Each section's samples share the same result dicts, so splitting by
+    accreditation costs no copies.
+    """
+
+    def __init__(self, client, rows):
+        self.client = client
+        self.accredited = CoaSection()
+        self.unaccredited = CoaSection()
+        self.combined = CoaSection()
+        self.summary_input = defaultdict(list)
+        self._build(rows)
+
+    @classmethod
+    def for_client(cls, client):
+        return cls(client, coa_rows(client))
+
+    def section(self, accredited=True):
+        return self.accredited if accredited else self.unaccredited
+
+    @property
+    def sample_type(self):
+        return self.combined.samples[0].sample_type if self.combined.samples else None
+
+    def _build(self, rows):
+        samples = []
+        for row in rows:
+            if not samples or row[0] != samples[-1][0][0]:
+                samples.append((row[:5], []))
+            samples[-1][1].append(row[5:])
+
+        # Derived parameters for every sample in one batch
+        derived = evaluate([
+            component_values({entry[0]: entry[4] for entry in entries})
+            for _, entries in samples
+        ])
+        for (meta, entries), values in zip(samples, derived):
+            self._add_sample(meta, entries, values)
+
+    def _add_sample(self, meta, entries, derived):
+        environment = None
+        by_section = {True: [], False: []}
+        assigned = {True: {}, False: {}}
+
+        for name, unit, method, group, value, temperature, humidity in entries:
+            accredited = group in ACCREDITED_GROUPS
+            assigned[accredited][name] = (unit, method)
+            if value is not None:
+                value = float(value)
+                by_section[accredited].append(
+                    {"parameter": name, "method": method, "value": value, "unit": unit}
+                )
+            if environment is None and temperature is not None:
+                environment = f"{temperature}°C, {humidity}%RH"
+
+        # A derived value already stored on an assignment is reported as recorded
+        stored = {stored_name(entry[0]) for entry in entries if entry[4] is not None}
+        for name, value in derived.items():
+            if name in stored:
+                continue
+            param = REGISTRY[name]
+            accredited = param.group in ACCREDITED_GROUPS
+            assigned[accredited][name] = (param.unit, param.method)
+            by_section[accredited].append(
+                {"parameter": name, "method": param.method, "value": value, "unit": param.unit}
+            )
+
+        environment = environment or DEFAULT_ENVIRONMENT
+        combined = CoaSample(meta, environment)
+        self.combined.samples.append(combined)
+
+        for accredited, section in ((True, self.accredited), (False, self.unaccredited)):
+            self.combined._assigned.update(assigned[accredited])
+            results = by_section[accredited]
+            if not results and not assigned[accredited]:
+                continue
+            sample = CoaSample(meta, environment)
+            sample.results = results
+            section.samples.append(sample)
+            section._assigned.update(assigned[accredited])
+            for result in results:
+                section._reported[result["parameter"]] = (result["unit"], result["method"])
+                self.combined._reported[result["parameter"]] = (result["unit"], result["method"])
+                self.summary_input[result["parameter"]].append(result["value"])
+            combined.results.extend(results)
@@ -0,0 +1,206 @@
+"""
+Module: coa_render.py
+Description: COA rendering helpers shared by the COA views and the
+background release worker (lims.tasks).
+"""
+
+import datetime
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from pdfrw import PageMerge, PdfReader, PdfWriter
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from lims.models import Client, Sample, SampleStatus
+from lims.models.coa import COAInterpretation
+from lims.utils.coa_cache import LETTERHEADS
+from lims.utils.coa_dataset import CoaDataset
+from lims.utils.pdf_assets import COA_STYLESHEET
+from lims.utils.pdf_pool import render_many, render_pdf
+
+logger = logging.getLogger(__name__)
+
+
+SIGNATURES = ("images/signatures/hannah-sign.png", "images/signatures/julius-sign.jpg")
+
+COA_CHUNK_SIZE = 20
+
+
+def _static_file_url(path):
+    found = finders.find(path) or os.path.join(settings.STATIC_ROOT, path)
+    return f"file://{found}" if found else ""
+
+
+def release_samples(client):
+    """
+    The client's samples that go on a released COA (QC samples excluded).
+    """
+    return (
+        Sample.objects
+        .filter(client=client)
+        .exclude(Q(sample_type__iexact="qc") | Q(sample_code__istartswith="qc-"))
+    )
+
+
+def releasable_clients():
+    """
+    Clients ready for release: summary confirmed, not yet released, at least
+    one COA sample and every COA sample approved.
+    """
+    coa_samples = ~Q(sample__sample_type__iexact="qc") & ~Q(sample__sample_code__istartswith="qc-")
+    return (
+        Client.objects
+        .filter(summary_confirmed=True, coa_released=False)
+        .annotate(
+            coa_sample_count=Count("sample", filter=coa_samples, distinct=True),
+            pending_sample_count=Count(
+                "sample", filter=coa_samples & ~Q(sample__status=SampleStatus.APPROVED), distinct=True,
+            ),
+        )
+        .filter(coa_sample_count__gt=0, pending_sample_count=0)
+        .order_by("client_id")
+    )
+
+
+def release_summary_text(client):
+    interpretation = COAInterpretation.objects.filter(client=client).first()
+    return interpretation.summary_text if interpretation else "Summary not available."
+
+
+def coa_pdf_context(client, section, summary_text, accredited=True):
+    """
+    Template context for lims/coa/coa_template.html from one CoaDataset section.
+    """
+    return {
+        "client": client,
+        "samples": section.samples,
+        "sample_chunks": section.sample_chunks(COA_CHUNK_SIZE),
+        "parameters": section.parameters,
+        "summary_text": summary_text,
+        "sample_weight_display": section.sample_weight_display,
+        "today": datetime.date.today(),
+        "letterhead_url": _static_file_url(LETTERHEADS[accredited]),
+        "signature_1": _static_file_url(SIGNATURES[0]),
+        "signature_2": _static_file_url(SIGNATURES[1]),
+    }
+
+
+def coa_release_filename(client, accredited=True):
+    return f"COA_{client.client_id}_{'accredited' if accredited else 'unaccredited'}_{timezone.now().strftime('%Y%m%d-%H%M%S')}.pdf"
+
+
+def coa_html(client, section, summary_text, accredited=True):
+    return render_to_string("lims/coa/coa_template.html", coa_pdf_context(client, section, summary_text, accredited))
+
+
+def use_chunked_render(section):
+    """Large COAs are rendered chunk by chunk to keep WeasyPrint's memory flat."""
+    return len(section) > getattr(settings, "COA_CHUNKED_RENDER_THRESHOLD", 60)
+
+
+def stamp_page_footers(pages):
+    """
+    Draw the "Page X of Y" footer (and END OF REPORT on the last page) onto
+    stitched pages, matching the footer the template draws in one-pass mode.
+    """
+    total = len(pages)
+    buffer = io.BytesIO()
+    overlay = canvas.Canvas(buffer)
+    for number, page in enumerate(pages, start=1):
+        x0, y0, x1, y1 = (float(v) for v in page.inheritable.MediaBox)
+        overlay.setPageSize((x1 - x0, y1 - y0))
+        overlay.setFont("Helvetica", 6.75)  # 9px
+        text = f"Page {number} of {total}"
+        if number == total:
+            text = f"- END OF REPORT - | {text}"
+        overlay.drawCentredString((x1 - x0) / 2, 15 * mm, text)
+        overlay.showPage()
+    overlay.save()
+
+    for page, stamp in zip(pages, PdfReader(fdata=buffer.getvalue()).pages):
+        PageMerge(page).add(stamp).render()
+
+
+def render_chunked_coa(client, section, summary_text, accredited=True, base_url=None, renderer=render_pdf):
+    """
+    Render each COA_CHUNK_SIZE-sample page group as its own PDF fragment and
+    stitch the fragments with pdfrw. Only one chunk is laid out at a time, so
+    peak memory does not grow with the sample count. The summary and
+    signatures go on the last fragment; page footers are stamped afterwards
+    so numbering runs across the whole document.
+
+    Fragments go through the render pool by default (worker and release
+    command). Web requests pass pdf_assets.write_pdf to render inline
+    rather than start pool processes inside every web worker.
+    """
+    context = coa_pdf_context(client, section, summary_text, accredited)
+    chunks = context.pop("sample_chunks")
+    context["chunked"] = True
+
+    pages = []
+    for index, chunk in enumerate(chunks):
+        context["sample_chunks"] = [chunk]
+        context["more_chunks"] = index < len(chunks) - 1
+        html = render_to_string("lims/coa/coa_template.html", context)
+        fragment = renderer(html, base_url=base_url, stylesheets=[COA_STYLESHEET])
+        pages.extend(PdfReader(fdata=fragment).pages)
+        del html, fragment
+
+    stamp_page_footers(pages)
+
+    writer = PdfWriter()
+    writer.addpages(pages)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def render_coa_document(client, section, summary_text, accredited=True, base_url=None):
+    """PDF bytes for one COA section, chunked when the section is large."""
+    if use_chunked_render(section):
+        return render_chunked_coa(client, section, summary_text, accredited, base_url=base_url)
+    return render_pdf(coa_html(client, section, summary_text, accredited), base_url=base_url, stylesheets=[COA_STYLESHEET])
+
+
+def render_release_pdf(client, section, summary_text, accredited=True):
+    """
+    Render one COA attachment for release. Returns (filename, pdf_bytes).
+    """
+    try:
+        pdf_bytes = render_coa_document(client, section, summary_text, accredited)
+        return coa_release_filename(client, accredited), pdf_bytes
+    except Exception:
+        logger.exception("PDF generation failed")
+        raise
+
+
+def build_release_attachments(client, summary_text, dataset=None):
+    """
+    Render the accredited and/or unaccredited COA for a client.
+    Regular-size documents are rendered concurrently in the PDF render pool;
+    large ones go through the chunked renderer.
+    Returns a list of (filename, pdf_bytes) ready for notify_client_on_coa_release.
+    """
+    dataset = dataset or CoaDataset.for_client(client)
+
+    kinds = [accredited for accredited in (True, False) if dataset.section(accredited)]
+    pooled = [accredited for accredited in kinds if not use_chunked_render(dataset.section(accredited))]
+    try:
+        pdfs = dict(zip(pooled, render_many([
+            (coa_html(client, dataset.section(accredited), summary_text, accredited), None, [COA_STYLESHEET])
+            for accredited in pooled
+        ])))
+        for accredited in kinds:
+            if accredited not in pdfs:
+                pdfs[accredited] = render_chunked_coa(client, dataset.section(accredited), summary_text, accredited)
+    except Exception:
+        logger.exception("PDF generation failed")
+        raise
+    return [(coa_release_filename(client, accredited), pdfs[accredited]) for accredited in kinds]
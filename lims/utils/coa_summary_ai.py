@@ -1,7 +1,40 @@
-def generate_dynamic_summary(summary_data):
-    import google.generativeai as genai
+"""
+Module: coa_summary_ai.py
+Description: AI interpretation text for COAs.
+
+Summaries are cached on the normalized payload (sample type plus parameter
+values), so re-opening a preview whose results have not changed never calls
+the provider again. The cache lives in the "ai_summaries" cache alias
+(TTL and culling come from its CACHES entry). The Celery worker fills it and
+the web process reads it, so the alias must use a shared backend.
+"""
+
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+from lims.utils.ai_providers import AIProviderError, get_provider, provider_name
+
+logger = logging.getLogger(__name__)
 
-    # Normalize input
+SUMMARY_CACHE_ALIAS = "ai_summaries"
+FAILED_PREFIX = "Summary generation failed"
+
+
+def summary_cache():
+    alias = SUMMARY_CACHE_ALIAS if SUMMARY_CACHE_ALIAS in settings.CACHES else "default"
+    return caches[alias]
+
+
+def normalize_payload(summary_data):
+    """
+    Canonical form of the AI payload: a list of {"sample_type", "results"}
+    with lower-cased sample types, sorted parameters and values rounded to
+    2 decimals (what the COA prints).
+    """
     if isinstance(summary_data, dict):
         summary_data = [{
             "sample_type": "Unknown",
@@ -10,6 +43,25 @@ def generate_dynamic_summary(summary_data):
     elif not isinstance(summary_data, list):
         raise ValueError(f"Expected a list or dict, got: {type(summary_data)} — {summary_data}")
 
+    normalized = []
+    for sample in summary_data:
+        results = sample.get("results", {}) or {}
+        normalized.append({
+            "sample_type": (sample.get("sample_type") or "Unknown").strip().lower(),
+            "results": {
+                str(param): [round(float(v), 2) for v in values]
+                for param, values in sorted(results.items())
+            },
+        })
+    return sorted(normalized, key=lambda s: s["sample_type"])
+
+
+def summary_cache_key(summary_data):
+    encoded = json.dumps(normalize_payload(summary_data), sort_keys=True).encode("utf-8")
+    return f"coa-summary:{provider_name()}:{hashlib.sha256(encoded).hexdigest()}"
+
+
+def build_summary_prompt(summary_data):
     base_context = (
         "You are a senior food laboratory reporting officer. "
         "Write a single, concise interpretation (max 100 words) based on the sample results below. "
@@ -21,19 +73,46 @@ def generate_dynamic_summary(summary_data):
 
     prompt = base_context + "\n\nHere are the summarized test results by sample type:\n"
 
-    for sample in summary_data:
-        sample_type = sample.get("sample_type", "Unknown")
-        param_data = sample.get("results", {})
-        prompt += f"\nSample Type: {sample_type.title()}\n"
-        for param, values in param_data.items():
+    for sample in normalize_payload(summary_data):
+        prompt += f"\nSample Type: {sample['sample_type'].title()}\n"
+        for param, values in sample["results"].items():
             prompt += f"{param}: {', '.join(str(v) for v in values)}\n"
+    return prompt
+
+
+def fallback_summary(summary_input):
+    """Plain per-parameter averages, used while (or when) the AI text is unavailable."""
+    summary_lines = []
+    for pname, vals in summary_input.items():
+        if vals:
+            avg_val = sum(vals) / len(vals)
+            summary_lines.append(f"{pname}: avg {avg_val:.2f}")
+    return "\n".join(summary_lines) or "Summary not available."
+
+
+def cached_summary(summary_data):
+    """The cached interpretation for this payload, or None."""
+    return summary_cache().get(summary_cache_key(summary_data))
+
+
+def generate_dynamic_summary(summary_data):
+    """
+    Interpretation text for the payload, from the cache when possible.
+    Failures return a "Summary generation failed: ..." string and are not cached.
+    """
+    key = summary_cache_key(summary_data)
+    cache = summary_cache()
+    cached = cache.get(key)
+    if cached:
+        return cached
 
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")  
-        chat = model.start_chat()
-        response = chat.send_message(prompt)
-        result = response.text.strip()
-        return result if result else "No summary generated."
-    except Exception as e:
-        # Optional: log this
-        return f"Summary generation failed: {str(e)}"
+        result = get_provider().generate(build_summary_prompt(summary_data))
+    except (AIProviderError, ImportError) as e:
+        logger.warning("COA summary generation failed: %s", e)
+        return f"{FAILED_PREFIX}: {str(e)}"
+
+    if not result:
+        return "No summary generated."
+    cache.set(key, result)
+    return result
@@ -1,27 +1,100 @@
-from lims.models import Parameter, TestAssignment, TestResult
+"""
+Module: derived.py
+Description: Stores derived parameter results (CHO, ME, ...) on assignments.
 
-def _note_for(param):
-    return {
-        "Carbohydrate": "Calculated as: 100 – (Protein + Fat + Ash + Moisture + Fiber)",
-        "ME": "ME = (Protein × 4) + (Fat × 9) + (Carbohydrate × 4)"
-    }.get(param, "")
+Formulas live in lims.utils.derived_parameters. update_derived_results()
+reads the inputs for a batch of samples in one query, evaluates the registry
+over the batch and writes the values with bulk_create/bulk_update, keeping
+the history, COA and report cache side effects of a normal save.
+"""
 
+from collections import defaultdict
 
-def _inject_derived_result(param_name, value, sample, recorded_by=None):
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from lims.models import Client, TestAssignment, TestResult
+from lims.utils.coa_cache import invalidate_client_coas
+from lims.utils.derived_parameters import REGISTRY, derived_values, stored_name
+from lims.utils.promotion import mark_for_promotion
+from lims.utils.report_cache import bump_report_version
+
+
+def update_derived_results(sample_ids, recorded_by=None):
+    """
+    Recompute and store the derived results of a batch of samples from their
+    recorded inputs. Returns the number of results written.
+    """
+    sample_values = defaultdict(dict)
+    rows = TestResult.objects.filter(
+        test_assignment__sample_id__in=list(sample_ids),
+        value__isnull=False,
+    ).values_list("test_assignment__sample_id", "test_assignment__parameter__name", "value")
+    for sample_id, name, value in rows:
+        sample_values[sample_id][name] = value
+    return store_derived_values(derived_values(sample_values), recorded_by)
+
+
+def store_derived_values(values, recorded_by=None):
+    """
+    Write {sample_id: {derived name: value}} to the samples' derived
+    assignments (results are created or updated, assignments completed).
+    Samples without a matching assignment are skipped. Returns the number
+    of results written.
+    """
+    targets = {}
+    assignments = []
+    for assignment in TestAssignment.objects.filter(sample_id__in=list(values)).select_related("parameter", "sample"):
+        name = stored_name(assignment.parameter.name)
+        if name and name in values[assignment.sample_id]:
+            targets[assignment.id] = (values[assignment.sample_id][name], REGISTRY[name].note)
+            assignments.append(assignment)
+    if not targets:
+        return 0
+
+    existing = {r.test_assignment_id: r for r in TestResult.objects.filter(test_assignment_id__in=list(targets))}
+    to_create, to_update = [], []
+    for assignment_id, (value, note) in targets.items():
+        result = existing.get(assignment_id) or TestResult(test_assignment_id=assignment_id)
+        result.value = value
+        result.source = "system"
+        result.calculation_note = note
+        result.recorded_by = recorded_by
+        (to_update if result.pk else to_create).append(result)
 
-    try:
-        param = Parameter.objects.get(name=param_name)
-        assignment = TestAssignment.objects.get(sample=sample, parameter=param)
-        TestResult.objects.update_or_create(
-            test_assignment=assignment,
-            defaults={
-                'value': round(value, 2),
-                'source': 'system',
-                'calculation_note': _note_for(param_name),
-                'recorded_by': recorded_by
-            }
+    completed = [a for a in assignments if a.status != "completed"]
+    for assignment in completed:
+        assignment.status = "completed"
+
+    with transaction.atomic():
+        if to_create:
+            bulk_create_with_history(to_create, TestResult, default_user=recorded_by)
+        if to_update:
+            bulk_update_with_history(
+                to_update, TestResult, ["value", "source", "calculation_note", "recorded_by"],
+                default_user=recorded_by,
+            )
+        if completed:
+            bulk_update_with_history(completed, TestAssignment, ["status"], default_user=recorded_by)
+
+        # Bulk writes skip the model signals: do their COA and report cache work here
+        client_ids = set(
+            Client.objects.filter(sample__id__in={a.sample_id for a in assignments})
+            .values_list("client_id", flat=True)
         )
-        assignment.status = 'completed'
-        assignment.save()
-    except (Parameter.DoesNotExist, TestAssignment.DoesNotExist):
-        pass
+        for client_id in client_ids:
+            transaction.on_commit(lambda client_id=client_id: invalidate_client_coas(client_id))
+        transaction.on_commit(bump_report_version)
+
+        for assignment in completed:
+            mark_for_promotion(assignment.sample.client_id, assignment.parameter_id)
+
+    return len(targets)
+
+
+def _inject_derived_result(param_name, value, sample, recorded_by=None):
+    """Store one derived value for one sample (see store_derived_values)."""
+    name = stored_name(param_name)
+    if name is None or value is None:
+        return
+    store_derived_values({sample.id: {name: round(value, 2)}}, recorded_by=recorded_by)
@@ -0,0 +1,129 @@
+"""
+Module: derived_parameters.py
+Description: Registry of derived (calculated) parameters and the batch evaluator.
+
+Each DerivedParameter declares its formula, the inputs it reads (proximate
+components or earlier derived parameters) and the parameter names its value
+is stored under. evaluate() runs every registered formula over a whole batch
+of samples, one column at a time. Nothing here touches the database: the COA
+builder evaluates its rows directly, and lims.utils.derived stores values on
+assignments.
+"""
+
+
+# Lower-cased parameter name -> proximate component used by the formulas
+COMPONENT_NAMES = {
+    "protein": "protein",
+    "crude protein": "protein",
+    "fat": "fat",
+    "crude fat": "fat",
+    "fiber": "fiber",
+    "fibre": "fiber",
+    "crude fiber": "fiber",
+    "crude fibre": "fiber",
+    "moisture": "moisture",
+    "ash": "ash",
+}
+
+
+class DerivedParameter:
+    """
+    A calculated parameter. `formula` takes one positional argument per
+    entry in `inputs`; `stored_as` lists other parameter names that hold
+    this value on an assignment (e.g. "Carbohydrate" for CHO).
+    """
+
+    def __init__(self, name, inputs, formula, unit, method, group, note, stored_as=(), precision=2):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.formula = formula
+        self.unit = unit
+        self.method = method
+        self.group = group
+        self.note = note
+        self.stored_as = (name, *stored_as)
+        self.precision = precision
+
+
+# Evaluated in registration order, so a formula may read any parameter registered before it
+REGISTRY = {}
+
+
+def register(parameter):
+    REGISTRY[parameter.name] = parameter
+    return parameter
+
+
+register(DerivedParameter(
+    "CHO",
+    ("moisture", "protein", "fat", "fiber", "ash"),
+    lambda moisture, protein, fat, fiber, ash: 100 - (moisture + protein + fat + fiber + ash),
+    unit="%",
+    method="AOAC by difference",
+    group="CHO",
+    note="Calculated as: 100 – (Protein + Fat + Ash + Moisture + Fiber)",
+    stored_as=("Carbohydrate", "NFE"),
+))
+
+register(DerivedParameter(
+    "ME",
+    ("protein", "fat", "CHO"),
+    lambda protein, fat, cho: ((protein * 4) + (fat * 9) + (cho * 4)) * 10,
+    unit="kcal/kg",
+    method="Calculated using Atwater factors",
+    group="ME",
+    note="ME (kcal/kg) = ((Protein × 4) + (Fat × 9) + (Carbohydrate × 4)) × 10",
+))
+
+
+def stored_name(parameter_name):
+    """The registered derived parameter stored under `parameter_name`, or None."""
+    lowered = parameter_name.lower()
+    for param in REGISTRY.values():
+        if lowered in (alias.lower() for alias in param.stored_as):
+            return param.name
+    return None
+
+
+def component_values(values):
+    """{component: value} from a sample's {parameter name: value} map."""
+    components = {}
+    for name, value in values.items():
+        key = COMPONENT_NAMES.get(name.lower())
+        if key and value is not None:
+            components[key] = float(value)
+    return components
+
+
+def evaluate(rows):
+    """
+    Derived values for a batch of samples. `rows` is a list of {component:
+    value} maps; the result is a parallel list of {derived name: value} maps
+    holding only the parameters whose inputs were all present.
+    """
+    size = len(rows)
+    columns = {}
+    results = [{} for _ in range(size)]
+
+    def column(key):
+        if key not in columns:
+            columns[key] = [row.get(key) for row in rows]
+        return columns[key]
+
+    for param in REGISTRY.values():
+        out = [
+            None if None in args else round(param.formula(*args), param.precision)
+            for args in zip(*(column(key) for key in param.inputs))
+        ] if param.inputs else [None] * size
+        columns[param.name] = out
+        for result, value in zip(results, out):
+            if value is not None:
+                result[param.name] = value
+    return results
+
+
+def derived_values(sample_values):
+    """{sample_id: {derived name: value}} for {sample_id: {parameter name: value}}."""
+    sample_ids = list(sample_values)
+    computed = evaluate([component_values(sample_values[sid]) for sid in sample_ids])
+    return dict(zip(sample_ids, computed))
@@ -0,0 +1,183 @@
+"""
+Module: efficiency_snapshots.py
+Description: Weekly analyst efficiency snapshots (average bench duration,
+test count and percentile rank among that week's analysts).
+
+Weeks run Monday–Sunday by result recording date. Missing weeks are
+processed in batches: one grouped query per batch, ranks computed in
+memory, rows written with bulk_create(update_conflicts=True). Every
+processed week is recorded in EfficiencySnapshotWeek, so later runs only
+fill the gaps. write_nudges() then stores last week's dashboard nudges.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from lims.models import TestResult
+from lims.models.ai import EfficiencySnapshot, EfficiencySnapshotWeek
+from lims.utils.ai_helpers import generate_efficiency_nudge
+
+WEEKS_PER_BATCH = 12
+
+
+def monday(day):
+    return day - timedelta(days=day.weekday())
+
+
+def last_complete_week(today=None):
+    """Start of the most recent week that has fully ended."""
+    today = today or timezone.localdate()
+    return monday(today) - timedelta(days=7)
+
+
+def timed_results():
+    return TestResult.objects.filter(
+        started_at__isnull=False,
+        recorded_at__isnull=False,
+        test_assignment__analyst__isnull=False,
+    )
+
+
+def pending_weeks(since=None, until=None, rebuild=False):
+    """
+    Week starts from `since` (default: the first timed result) up to `until`
+    (default: the last complete week) that still need processing.
+    """
+    until = monday(until) if until else last_complete_week()
+    if since is None:
+        first = timed_results().aggregate(first=Min("recorded_at"))["first"]
+        if first is None:
+            return []
+        since = timezone.localtime(first).date()
+    week = monday(since)
+
+    done = set()
+    if not rebuild:
+        done = set(EfficiencySnapshotWeek.objects.filter(
+            week_start__range=(week, until),
+        ).values_list("week_start", flat=True))
+
+    weeks = []
+    while week <= until:
+        if week not in done:
+            weeks.append(week)
+        week += timedelta(days=7)
+    return weeks
+
+
+def rank_week(rows):
+    """
+    Percentile rank per analyst for one week's {analyst_id: (avg_duration, tests)}:
+    the share of the week's analysts whose average was slower.
+    """
+    durations = sorted(avg.total_seconds() for avg, _ in rows.values())
+    cohort = len(durations)
+    ranks = {}
+    for analyst_id, (avg, _) in rows.items():
+        mine = avg.total_seconds()
+        # Strictly slower analysts: everything after the last value <= mine
+        slower = cohort - bisect_right(durations, mine)
+        ranks[analyst_id] = (round(slower / cohort * 100) if cohort else 0, slower, cohort)
+    return ranks
+
+
+def process_weeks(weeks):
+    """Compute and store snapshots for a batch of week starts. Returns rows written."""
+    if not weeks:
+        return 0
+    first, last = min(weeks), max(weeks)
+    wanted = set(weeks)
+
+    stats = (
+        timed_results()
+        .filter(recorded_at__date__gte=first, recorded_at__date__lte=last + timedelta(days=6))
+        .annotate(
+            week=TruncWeek("recorded_at"),
+            duration=ExpressionWrapper(F("recorded_at") - F("started_at"), output_field=DurationField()),
+        )
+        .values("week", "test_assignment__analyst")
+        .annotate(avg_duration=Avg("duration"), test_count=Count("id"))
+        .order_by()
+    )
+
+    by_week = defaultdict(dict)
+    for row in stats:
+        week = row["week"]
+        week = timezone.localtime(week).date() if hasattr(week, "hour") else week
+        if week in wanted and row["avg_duration"] is not None:
+            by_week[week][row["test_assignment__analyst"]] = (row["avg_duration"], row["test_count"])
+
+    snapshots = []
+    for week, rows in by_week.items():
+        for analyst_id, (rank, slower, cohort) in rank_week(rows).items():
+            avg, tests = rows[analyst_id]
+            snapshots.append(EfficiencySnapshot(
+                analyst_id=analyst_id,
+                week_start=week,
+                week_end=week + timedelta(days=6),
+                average_duration=avg,
+                total_tests=tests,
+                percentile_rank=rank,
+                faster_than=slower,
+                cohort_size=cohort,
+            ))
+
+    with transaction.atomic():
+        # Drop snapshots for analysts who no longer have timed results in a recomputed week
+        for week in weeks:
+            EfficiencySnapshot.objects.filter(week_start=week).exclude(
+                analyst_id__in=list(by_week.get(week, {})),
+            ).delete()
+        EfficiencySnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=["analyst", "week_start", "week_end"],
+            update_fields=["average_duration", "total_tests", "percentile_rank", "faster_than", "cohort_size"],
+        )
+        EfficiencySnapshotWeek.objects.bulk_create(
+            [EfficiencySnapshotWeek(week_start=week, analyst_count=len(by_week.get(week, {}))) for week in weeks],
+            update_conflicts=True,
+            unique_fields=["week_start"],
+            update_fields=["analyst_count", "processed_at"],
+        )
+    return len(snapshots)
+
+
+def generate_snapshots(since=None, until=None, rebuild=False, batch_size=WEEKS_PER_BATCH):
+    """
+    Process every pending week in batches. Yields (weeks, rows written) per batch.
+    """
+    weeks = pending_weeks(since, until, rebuild)
+    for i in range(0, len(weeks), batch_size):
+        batch = weeks[i:i + batch_size]
+        yield batch, process_weeks(batch)
+
+
+def write_nudges(week_start=None, overwrite=False):
+    """
+    Generate and store the dashboard nudge for every snapshot of a week
+    (default: last complete week) that does not have one yet. Returns the count.
+    """
+    week_start = week_start or last_complete_week()
+    snapshots = EfficiencySnapshot.objects.filter(week_start=week_start).select_related("analyst")
+    if not overwrite:
+        snapshots = snapshots.filter(nudge_text="")
+
+    updated = []
+    for snapshot in snapshots:
+        analyst = snapshot.analyst
+        snapshot.nudge_text = generate_efficiency_nudge(
+            analyst.get_short_name() or analyst.username,
+            snapshot.average_duration.total_seconds(),
+            snapshot.percentile_rank or 0,
+            snapshot.total_tests,
+        )
+        updated.append(snapshot)
+    EfficiencySnapshot.objects.bulk_update(updated, ["nudge_text"])
+    return len(updated)
@@ -0,0 +1,199 @@
+"""
+Module: instrument_import.py
+Description: Imports a batch's results from an instrument's exported file.
+
+Kjeldahl, fat extractor and calorimeter software export CSV, TSV or XLSX.
+The instrument's InstrumentImportProfile says which columns hold the sample
+code and the value. The file is read one row at a time:
+- csv.reader over the upload stream;
+- openpyxl in read-only mode for XLSX.
+Only the batch's results are held in memory, never the whole file.
+
+Every row is validated first: the sample must belong to the batch, the value
+must be a number, and a control row needs a ControlSpec (one control per file). Any row error
+rejects the whole file. Otherwise all writes go through
+write_batch_results() in one transaction.
+"""
+
+import csv
+import io
+import math
+import os
+from decimal import Decimal
+
+from django.db import transaction
+from openpyxl import load_workbook
+
+from lims.models import ControlSpec, QCMetrics, TestAssignment, TestResult
+from lims.utils.batch_results import write_batch_results
+
+SUPPORTED_EXTENSIONS = {".csv", ".tsv", ".txt", ".xlsx"}
+
+# Stop collecting row errors after this many; the analyst fixes the file and retries
+MAX_ERRORS = 50
+
+
+class InstrumentImportError(Exception):
+    """The file cannot be read with the instrument's profile."""
+
+
+def _text_rows(stream, delimiter):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text, delimiter=delimiter)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise InstrumentImportError(f"Could not read the file as text: {exc}") from exc
+    finally:
+        # Leave the upload open for Django to clean up
+        text.detach()
+
+
+def _xlsx_rows(stream, sheet_name):
+    try:
+        wb = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as exc:
+        raise InstrumentImportError(f"Could not open the workbook: {exc}") from exc
+    try:
+        if sheet_name and sheet_name not in wb.sheetnames:
+            raise InstrumentImportError(f"Worksheet '{sheet_name}' not found.")
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        for row in ws.iter_rows(values_only=True):
+            yield ["" if cell is None else cell for cell in row]
+    finally:
+        wb.close()
+
+
+def read_rows(upload, profile):
+    """
+    Yield (row number, sample code, raw value) for every non-empty data row
+    of an uploaded export, reading it one row at a time.
+    """
+    extension = os.path.splitext(upload.name)[1].lower()
+    stream = getattr(upload, "file", upload)
+    if extension == ".xlsx":
+        rows = _xlsx_rows(stream, profile.sheet_name)
+    elif extension in SUPPORTED_EXTENSIONS:
+        rows = _text_rows(stream, "\t" if extension == ".tsv" else profile.delimiter)
+    else:
+        raise InstrumentImportError(f"Unsupported file type '{extension}'.")
+
+    code_index = value_index = None
+    for number, row in enumerate(rows, start=1):
+        if number < profile.header_row:
+            continue
+        if number == profile.header_row:
+            headers = [str(cell).strip().lower() for cell in row]
+            try:
+                code_index = headers.index(profile.sample_code_column.strip().lower())
+                value_index = headers.index(profile.value_column.strip().lower())
+            except ValueError:
+                raise InstrumentImportError(
+                    f"Row {number} must contain the columns '{profile.sample_code_column}' "
+                    f"and '{profile.value_column}'."
+                )
+            continue
+        if not any(str(cell).strip() for cell in row):
+            continue
+        code = str(row[code_index]).strip() if code_index < len(row) else ""
+        raw = row[value_index] if value_index < len(row) else ""
+        yield number, code, raw
+
+    if code_index is None:
+        raise InstrumentImportError(f"The file has no header row {profile.header_row}.")
+
+
+def parse_value(raw, decimal_comma=False):
+    """A finite float from a cell value; raises ValueError otherwise."""
+    if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        value = float(raw)
+    else:
+        text = str(raw).strip()
+        if decimal_comma:
+            text = text.replace(".", "").replace(",", ".")
+        value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(raw)
+    return value
+
+
+def import_instrument_file(upload, profile, client, parameter, user, environment):
+    """
+    Import an instrument export into the client's batch for `parameter`.
+    `environment` is an unsaved TestEnvironment with the run's conditions.
+
+    Returns {"imported": count, "errors": [...], "qc_status": "pass"/"fail"/None}.
+    Nothing is written when "errors" is not empty.
+    """
+    assignments = {
+        a.sample.sample_code.strip().lower(): a
+        for a in TestAssignment.objects
+        .filter(sample__client=client, parameter=parameter)
+        .select_related("sample", "testresult")
+    }
+    spec = ControlSpec.objects.filter(parameter=parameter).first()
+
+    results = []
+    control = None
+    seen = set()
+    errors = []
+
+    for number, code, raw in read_rows(upload, profile):
+        if len(errors) >= MAX_ERRORS:
+            break
+        key = code.lower()
+        assignment = assignments.get(key)
+        if assignment is None:
+            errors.append(f"Row {number}: sample '{code}' is not part of this batch.")
+            continue
+        if key in seen:
+            errors.append(f"Row {number}: sample '{code}' appears more than once.")
+            continue
+        seen.add(key)
+        try:
+            value = parse_value(raw, profile.decimal_comma)
+        except ValueError:
+            errors.append(f"Row {number}: '{raw}' is not a number.")
+            continue
+
+        if assignment.is_control:
+            if spec is None:
+                errors.append(f"Row {number}: '{code}' is a control but {parameter.name} has no control spec.")
+                continue
+            if control is not None:
+                errors.append(
+                    f"Row {number}: '{code}' is a second control; the file already has "
+                    f"'{control[0].sample.sample_code}'."
+                )
+                continue
+            control = (assignment, value)
+        else:
+            result = getattr(assignment, "testresult", None) or TestResult()
+            result.value = value
+            results.append((assignment, result))
+
+    if not errors and not results and control is None:
+        errors.append("The file contains no results.")
+    if errors:
+        return {"imported": 0, "errors": errors, "qc_status": None}
+
+    qc_status = None
+    with transaction.atomic():
+        write_batch_results(
+            client, results, environment, user,
+            control_assignment=control[0] if control else None,
+        )
+        if control:
+            assignment, value = control
+            qc, _ = QCMetrics.objects.update_or_create(
+                test_assignment=assignment,
+                defaults={
+                    "measured_value": Decimal(str(round(value, 2))),
+                    "min_acceptable": spec.min_acceptable,
+                    "max_acceptable": spec.max_acceptable,
+                    "expected_value": spec.expected_value,
+                    "tolerance": spec.default_tolerance or Decimal("10"),
+                },
+            )
+            qc_status = qc.status
+
+    return {"imported": len(results) + (1 if control else 0), "errors": [], "qc_status": qc_status}
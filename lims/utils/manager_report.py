@@ -0,0 +1,192 @@
+"""
+Module: manager_report.py
+Description: Builds the manager report context shared by the dashboard,
+the PDF/Excel exports and the emailed report, and the email itself.
+"""
+
+from datetime import timedelta
+
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.utils import timezone
+from django.utils.html import strip_tags
+from django.utils.timezone import now
+
+from lims.models import CalibrationRecord, Equipment, Expense, Sample, TestAssignment
+from lims.utils.pdf_assets import write_pdf
+from lims.utils.report_cache import cached_report_data
+from lims.utils.workload_facts import workload_report
+
+
+def manager_report_context(range_type="month", logo_url=None):
+    """
+    Everything the manager report templates (dashboard, PDF, email) and the
+    Excel export need for one range: "day", "week", "month", "last_month"
+    or "all_time". Independent of the request so background jobs can use it.
+    """
+    today = timezone.now().date()
+
+    # ----- Date range selection -----
+    if range_type == "week":
+        start_date = today - timedelta(days=today.weekday())
+        end_date = start_date + timedelta(days=6)
+        range_label = f"{start_date:%b %d} – {end_date:%b %d, %Y}"
+    elif range_type == "day":
+        start_date = end_date = today
+        range_label = f"{today:%b %d, %Y}"
+    elif range_type == "last_month":
+        first_day_this_month = today.replace(day=1)
+        last_day_last_month = first_day_this_month - timedelta(days=1)
+        start_date = last_day_last_month.replace(day=1)
+        end_date = last_day_last_month
+        range_label = f"{start_date:%B %Y}"
+    elif range_type == "all_time":
+        start_date = None
+        end_date = today
+        range_label = "All Time"
+    else:  # current month
+        start_date = today.replace(day=1)
+        end_date = today
+        range_label = f"{start_date:%B %Y}"
+
+    # ----- Filters -----
+    sample_filters = {"received_date__lte": end_date}
+    test_filters = {"assigned_date__date__lte": end_date, "is_control": False}
+    calibration_filters = {"calibration_date__lte": end_date}
+    expense_filters = {"date__lte": end_date}
+
+    if start_date:
+        sample_filters["received_date__gte"] = start_date
+        test_filters["assigned_date__date__gte"] = start_date
+        calibration_filters["calibration_date__gte"] = start_date
+        expense_filters["date__gte"] = start_date
+
+    # ----- Querysets -----
+    samples = Sample.objects.filter(**sample_filters).exclude(sample_type__iexact="QC")
+
+    tests = (
+        TestAssignment.objects
+        .select_related("parameter", "sample", "analyst")
+        .filter(**test_filters)
+    )
+
+    equipment = Equipment.objects.all()
+    calibrations = CalibrationRecord.objects.filter(**calibration_filters)
+    expenses_qs = Expense.objects.filter(**expense_filters)
+
+    # ----- Aggregations (from the daily workload facts, cached per range) -----
+    def build_report_data():
+        workload = workload_report(start_date, end_date, today)
+        workload["summary"] = {
+            "samples_received": samples.count(),
+            "test_assignments": workload["test_count"],
+            "assigned_with_analysts": workload["assigned_with_analysts"],
+            "active_equipment": equipment.filter(is_active=True).count(),
+            "expired_calibrations": CalibrationRecord.objects.filter(expires_on__lt=today).count(),
+        }
+        return workload
+
+    workload = cached_report_data(range_type, start_date, end_date, today, build_report_data)
+    summary = workload["summary"]
+
+    # ----- Finance: gross, expenses, net -----
+    gross_income = workload["gross_income"]
+    total_expenses = workload["total_expenses"]
+    net_income = gross_income - total_expenses
+
+    # ----- Optional UI-friendly summary card data -----
+    summary_cards = [
+        {"title": "Samples Received", "value": summary["samples_received"], "icon": "🧪", "class": "card-received"},
+        {"title": "Tests Assigned", "value": summary["test_assignments"], "icon": "🔍", "class": "card-assigned"},
+        {"title": "With Analysts", "value": summary["assigned_with_analysts"], "icon": "👩‍🔬", "class": "card-analysts"},
+        {"title": "Active Equipment", "value": summary["active_equipment"], "icon": "⚙️", "class": "card-equipment"},
+        {"title": "Expired Calibrations", "value": summary["expired_calibrations"], "icon": "⏰", "class": "card-calibrations"},
+    ]
+
+    if logo_url is None:
+        logo_url = static("images/logo.jpg")
+
+    # slice for dashboard (avoid loading large tables in page)
+    recent_expenses = expenses_qs.order_by("-date", "-created")[:10] if hasattr(Expense, "created") else expenses_qs.order_by("-date")[:10]
+
+    return {
+        # raw objects
+        "samples": samples,
+        "tests": tests,
+        "equipment": equipment,
+        "calibrations": calibrations,
+        "expenses": expenses_qs,          # full queryset (PDF/Excel)
+        "recent_expenses": recent_expenses,  # lightweight for dashboard
+
+        # summaries
+        "summary": summary,
+        "summary_cards": summary_cards,
+
+        # date range
+        "start_date": start_date,
+        "end_date": end_date,
+        "range_type": range_type,
+        "range_label": range_label,
+
+        # breakdowns
+        "daily_totals": workload["daily_totals"],
+        "weekly_totals": workload["weekly_totals"],
+        "monthly_totals": workload["monthly_totals"],
+        "top_parameters": workload["top_parameters"],
+        "analyst_workload": workload["analyst_workload"],
+        "parameter_stats": workload["parameter_stats"],
+        "sample_per_analyst": workload["sample_per_analyst"],
+        "analysis_summary": workload["analysis_summary"],
+
+        # finance (backward compatibility: total_income == gross)
+        "gross_income": gross_income,
+        "total_income": gross_income,  # keep old key
+        "total_expenses": total_expenses,
+        "net_income": net_income,
+
+        # today
+        "today_total_income": workload["today_total_income"],
+        "today_test_count": workload["today_test_count"],
+
+        # misc
+        "now": now(),
+        "logo_url": logo_url,
+    }
+
+
+def build_manager_report_email(range_type, recipients, base_url=""):
+    """
+    The manager report email for a range: HTML body (with expenses table),
+    plain-text fallback and the full report as a PDF attachment rendered
+    in memory. `base_url` is the site root the report's images resolve against.
+    """
+    logo_url = urljoin(base_url, static("images/logo.jpg")) if base_url else None
+    context = manager_report_context(range_type, logo_url=logo_url)
+
+    # Human-friendly numbers for subject
+    gross = context.get("gross_income") or context.get("total_income") or 0
+    expenses = context.get("total_expenses") or 0
+    net = context.get("net_income") or 0
+
+    # Subject line w/ quick finance readout
+    subject = (
+        f"Manager Report ({context.get('range_label', range_type.title())}): "
+        f"Gross ₦{gross:,.2f} | Expenses ₦{expenses:,.2f} | Net ₦{net:,.2f}"
+    )
+
+    html_content = render_to_string("lims/manager/manager_report.html", context)
+    text_content = strip_tags(html_content)
+
+    pdf_html = render_to_string("lims/manager/report_pdf.html", context)
+    pdf_bytes = write_pdf(pdf_html, base_url=base_url or None)
+
+    msg = EmailMultiAlternatives(subject, text_content, settings.DEFAULT_FROM_EMAIL, recipients)
+    msg.attach_alternative(html_content, "text/html")
+
+    filename = f"Manager_Report_{context.get('range_type','range')}_{context.get('end_date')}.pdf"
+    msg.attach(filename, pdf_bytes, "application/pdf")
+    return msg
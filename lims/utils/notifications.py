@@ -57,11 +57,12 @@ def notify_low_stock(manager_email, reagent_name, batch_number, number_of_bottle
 
 
 
-def notify_client_on_coa_release(*, client, summary_text, attachments=None, pdf_bytes=None, filename=None):
+def notify_client_on_coa_release(*, client, summary_text, attachments=None, pdf_bytes=None, filename=None, connection=None):
     """
     Email the client letting them know their COA is ready.
     Supports multiple PDF attachments (via 'attachments' list).
     If 'attachments' is not provided, falls back to a single (pdf_bytes, filename).
+    Pass an open `connection` to reuse one SMTP session across several releases.
     """
     subject = "Your Certificate of Analysis (COA) is Now Available"
     from_email = settings.DEFAULT_FROM_EMAIL
@@ -104,7 +105,8 @@ def notify_client_on_coa_release(*, client, summary_text, attachments=None, pdf_
         from_email=from_email,
         to=to_list,
         bcc=bcc_list,
-        headers={'Reply-To': 'jaageelab@gmail.com', 'Message-ID': message_id}
+        headers={'Reply-To': 'jaageelab@gmail.com', 'Message-ID': message_id},
+        connection=connection,
     )
     msg.attach_alternative(html_body, "text/html")
 
@@ -0,0 +1,135 @@
+"""
+Module: pdf_assets.py
+Description: Per-process cache of WeasyPrint inputs that never change
+between documents.
+
+- Stylesheets are compiled into weasyprint.CSS objects once and passed to
+  write_pdf(stylesheets=...) instead of being re-parsed from every document.
+- One FontConfiguration is reused so fonts are looked up once.
+- `url_fetcher` serves static assets (letterheads, signatures, the lab logo)
+  from memory. It handles both file:// paths and /static/ URLs, so a PDF
+  view no longer fetches images from its own web server over HTTP.
+
+Everything else falls through to WeasyPrint's default fetcher.
+"""
+
+import mimetypes
+import os
+import threading
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template
+from weasyprint import CSS, HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+COA_STYLESHEET = "lims/coa/coa_print.css"
+
+# Loaded by warm() so the first real document does not pay for them
+PRELOAD_ASSETS = (
+    "letterheads/accredited_letterhead.png",
+    "letterheads/unaccredited_letterhead.jpg",
+    "images/signatures/hannah-sign.png",
+    "images/signatures/julius-sign.jpg",
+    "images/logo.jpg",
+)
+PRELOAD_STYLESHEETS = (COA_STYLESHEET,)
+
+# path -> (mtime, bytes, mime_type). Shared across threads; values are immutable.
+_assets = {}
+# FontConfiguration and compiled CSS wrap Pango/cffi state, so keep one per thread
+_local = threading.local()
+
+
+def font_config():
+    if getattr(_local, "font_config", None) is None:
+        _local.font_config = FontConfiguration()
+    return _local.font_config
+
+
+def stylesheet(template_name):
+    """
+    A compiled weasyprint.CSS for a plain CSS file in the template dirs.
+    """
+    cache = getattr(_local, "stylesheets", None)
+    if cache is None:
+        cache = _local.stylesheets = {}
+    if template_name not in cache:
+        source = get_template(template_name).template.source
+        cache[template_name] = CSS(string=source, font_config=font_config())
+    return cache[template_name]
+
+
+def _static_prefix():
+    prefix = urlparse(settings.STATIC_URL).path
+    return "/" + prefix.strip("/") + "/"
+
+
+def _static_file(relative):
+    relative = relative.lstrip("/")
+    found = finders.find(relative)
+    if found:
+        return found
+    candidate = os.path.join(settings.STATIC_ROOT, relative)
+    return candidate if os.path.isfile(candidate) else None
+
+
+def local_path(url):
+    """
+    The file on disk behind a file:// or /static/ URL, or None.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        path = unquote(parsed.path)
+        return path if os.path.isfile(path) else None
+    if parsed.scheme in ("http", "https", ""):
+        prefix = _static_prefix()
+        if parsed.path.startswith(prefix):
+            return _static_file(unquote(parsed.path[len(prefix):]))
+    return None
+
+
+def asset_bytes(path):
+    """
+    File contents from memory, re-read only when the file's mtime changes.
+    """
+    mtime = os.stat(path).st_mtime
+    cached = _assets.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as fh:
+            data = fh.read()
+        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        cached = _assets[path] = (mtime, data, mime_type)
+    return cached[1], cached[2]
+
+
+def url_fetcher(url, *args, **kwargs):
+    path = local_path(url)
+    if path:
+        data, mime_type = asset_bytes(path)
+        return {"string": data, "mime_type": mime_type, "redirected_url": url}
+    return default_url_fetcher(url, *args, **kwargs)
+
+
+def write_pdf(html, base_url=None, stylesheets=()):
+    """
+    Render an HTML string to PDF bytes with the cached fetcher, fonts and
+    compiled stylesheets (template names, e.g. COA_STYLESHEET).
+    """
+    document = HTML(string=html, base_url=base_url, url_fetcher=url_fetcher)
+    return document.write_pdf(
+        stylesheets=[stylesheet(name) for name in stylesheets],
+        font_config=font_config(),
+    )
+
+
+def warm():
+    """Load fonts, stylesheets and static assets ahead of the first render."""
+    font_config()
+    for name in PRELOAD_STYLESHEETS:
+        stylesheet(name)
+    for relative in PRELOAD_ASSETS:
+        path = _static_file(relative)
+        if path:
+            asset_bytes(path)
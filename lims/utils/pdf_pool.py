@@ -0,0 +1,168 @@
+"""
+Module: pdf_pool.py
+Description: Pool of pre-warmed WeasyPrint worker processes.
+
+HTML strings go in, PDF bytes come out. Workers import WeasyPrint and lay
+out a throwaway document when they start, so fonts and the default
+stylesheets are already loaded when real jobs arrive. A semaphore bounds
+the number of queued documents so a burst of releases cannot pile HTML
+strings up in memory, and every job has a timeout.
+
+The pool belongs to the Celery worker and the release_coas command. Web
+requests render inline with pdf_assets.write_pdf so that web workers do not
+each start their own pool.
+
+Settings:
+    PDF_RENDER_WORKERS        worker processes (0 renders inline, in-process)
+    PDF_RENDER_QUEUE_SIZE     max documents queued or rendering at once
+    PDF_RENDER_TIMEOUT        seconds allowed per document
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_slots = None
+_lock = threading.Lock()
+
+WARMUP_HTML = "<html><body><h1>warm-up</h1><table><tr><td>0.00</td></tr></table></body></html>"
+
+
+class PdfRenderError(Exception):
+    """A document could not be rendered by the pool."""
+
+
+class PdfRenderTimeout(PdfRenderError):
+    """A document took longer than PDF_RENDER_TIMEOUT."""
+
+
+class PdfPoolBusy(PdfRenderError):
+    """The render queue stayed full for longer than PDF_RENDER_TIMEOUT."""
+
+
+def _workers():
+    return getattr(settings, "PDF_RENDER_WORKERS", 2)
+
+
+def _timeout():
+    return getattr(settings, "PDF_RENDER_TIMEOUT", 120)
+
+
+def _warm_worker():
+    """
+    Pool initializer: set up Django (templates, staticfiles) and load
+    WeasyPrint, fonts, compiled stylesheets and static assets once.
+    """
+    import django
+    django.setup()
+
+    from lims.utils import pdf_assets
+    pdf_assets.warm()
+    pdf_assets.write_pdf(WARMUP_HTML)
+
+
+def _render(html, base_url=None, stylesheets=()):
+    from lims.utils.pdf_assets import write_pdf
+    return write_pdf(html, base_url=base_url, stylesheets=stylesheets)
+
+
+def _can_fork_workers():
+    # Daemonic processes (e.g. Celery prefork children) may not have children
+    return not multiprocessing.current_process().daemon
+
+
+def get_pool():
+    """
+    The process-wide executor, created on first use. Returns None when the
+    pool is disabled or cannot be used from this process.
+    """
+    global _pool, _slots
+    if _workers() <= 0 or not _can_fork_workers():
+        return None
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+            _slots = threading.BoundedSemaphore(getattr(settings, "PDF_RENDER_QUEUE_SIZE", 8))
+        return _pool
+
+
+def shutdown_pool():
+    """
+    Tear the pool down, terminating workers that are stuck on a document.
+    The next render starts a fresh pool.
+    """
+    global _pool, _slots
+    with _lock:
+        pool, _pool, _slots = _pool, None, None
+    if pool is None:
+        return
+    # A hung WeasyPrint layout never returns on its own, so kill the workers
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(html, base_url=None, stylesheets=()):
+    """
+    Queue one document. Blocks while the queue is full and raises
+    PdfPoolBusy if no slot frees up within the timeout.
+    """
+    pool = get_pool()
+    if pool is None:
+        raise PdfRenderError("PDF render pool is not available in this process.")
+
+    slots = _slots
+    if not slots.acquire(timeout=_timeout()):
+        raise PdfPoolBusy("PDF render queue is full.")
+    try:
+        future = pool.submit(_render, html, base_url, tuple(stylesheets))
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def render_many(documents, timeout=None):
+    """
+    Render [(html, base_url[, stylesheets]), ...] concurrently and return
+    the PDF bytes in the same order. Falls back to rendering inline when
+    the pool is off.
+    """
+    documents = list(documents)
+    if get_pool() is None or len(documents) == 0:
+        return [_render(*document) for document in documents]
+
+    timeout = timeout or _timeout()
+    futures = []
+    try:
+        for document in documents:
+            futures.append(submit(*document))
+        return [future.result(timeout=timeout) for future in futures]
+    except FutureTimeout:
+        logger.error("PDF render exceeded %ss; restarting render pool", timeout)
+        shutdown_pool()
+        raise PdfRenderTimeout(f"PDF render exceeded {timeout}s")
+    except BrokenProcessPool as exc:
+        logger.error("PDF render pool died; restarting it")
+        shutdown_pool()
+        raise PdfRenderError(str(exc)) from exc
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def render_pdf(html, base_url=None, stylesheets=(), timeout=None):
+    """Render a single document through the pool."""
+    return render_many([(html, base_url, stylesheets)], timeout=timeout)[0]
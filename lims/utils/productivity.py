@@ -0,0 +1,147 @@
+"""
+Module: productivity.py
+Description: Turnaround-time (TAT) and bench-duration distributions for the
+analyst productivity report.
+
+All numbers for a range come from one values_list fetch: per analyst,
+per parameter and overall, we report the count, mean and p50/p90/p99 in
+seconds. Percentiles are computed in Python on the sorted durations
+(linear interpolation, the same definition as numpy's default), which keeps
+the report meaningful when a few tests sat for weeks. Results are cached
+per range behind the manager report data version.
+"""
+
+import datetime
+from collections import defaultdict
+
+from django.utils import timezone
+
+from lims.models import TestAssignment
+from lims.utils.report_cache import cached_report_data
+
+PERCENTILES = (50, 90, 99)
+
+
+def productivity_range(range_type, today):
+    """(start_date, end_date) for a report range; start_date is None for all time."""
+    if range_type == "day":
+        return today, today
+    if range_type == "week":
+        return today - datetime.timedelta(days=7), today
+    if range_type == "month":
+        return today.replace(day=1), today
+    if range_type == "last_month":
+        last_day_last_month = today.replace(day=1) - datetime.timedelta(days=1)
+        return last_day_last_month.replace(day=1), last_day_last_month
+    if range_type == "all_time":
+        return None, today
+    return today, today
+
+
+def assignments_in_range(start_date, end_date):
+    if start_date:
+        return TestAssignment.objects.filter(
+            status="verified",
+            is_control=False,
+            testresult__recorded_at__date__range=(start_date, end_date),
+        )
+    return TestAssignment.objects.filter(
+        status="completed",
+        is_control=False,
+        testresult__recorded_at__date__lte=end_date,
+    )
+
+
+def percentile(sorted_values, p):
+    """The p-th percentile of an already sorted list (linear interpolation)."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def distribution(values):
+    """count, mean and percentiles (seconds) of a list of durations in seconds."""
+    values = sorted(values)
+    stats = {"count": len(values), "mean": sum(values) / len(values) if values else None}
+    for p in PERCENTILES:
+        stats[f"p{p}"] = percentile(values, p)
+    return stats
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def productivity_stats(start_date, end_date):
+    """
+    Tests, samples, parameters and TAT/duration distributions per analyst,
+    per parameter and overall for the range.
+    """
+    rows = (
+        assignments_in_range(start_date, end_date)
+        .values_list(
+            "analyst__username", "parameter__name", "sample_id",
+            "sample__received_date", "testresult__started_at", "testresult__recorded_at",
+        )
+        .iterator(chunk_size=5000)
+    )
+
+    def bucket():
+        return {"tests": 0, "samples": set(), "params": set(), "tat": [], "duration": []}
+
+    analysts = defaultdict(bucket)
+    parameters = defaultdict(bucket)
+    overall = bucket()
+
+    received_midnight = {}
+    for analyst, parameter, sample_id, received, started, recorded in rows:
+        tat = None
+        if received and recorded:
+            if received not in received_midnight:
+                received_midnight[received] = _start_of_day(received)
+            tat = (recorded - received_midnight[received]).total_seconds()
+        duration = (recorded - started).total_seconds() if started and recorded else None
+
+        for b in (analysts[analyst], parameters[parameter], overall):
+            b["tests"] += 1
+            b["samples"].add(sample_id)
+            b["params"].add(parameter)
+            if tat is not None:
+                b["tat"].append(tat)
+            if duration is not None:
+                b["duration"].append(duration)
+
+    def summarize(b):
+        return {
+            "tests": b["tests"],
+            "samples": len(b["samples"]),
+            "params": len(b["params"]),
+            "tat": distribution(b["tat"]),
+            "duration": distribution(b["duration"]),
+        }
+
+    return {
+        "analysts": sorted(
+            ({"analyst_name": name, **summarize(b)} for name, b in analysts.items()),
+            key=lambda row: -row["tests"],
+        ),
+        "parameters": sorted(
+            ({"parameter_name": name, **summarize(b)} for name, b in parameters.items()),
+            key=lambda row: -row["tests"],
+        ),
+        "overall": summarize(overall),
+    }
+
+
+def cached_productivity_stats(range_type, today=None):
+    today = today or timezone.localdate()
+    start_date, end_date = productivity_range(range_type, today)
+    stats = cached_report_data(
+        range_type, start_date, end_date, today,
+        lambda: productivity_stats(start_date, end_date),
+        namespace="productivity",
+    )
+    return start_date, end_date, stats
@@ -0,0 +1,124 @@
+"""
+Module: promotion.py
+Description: Coalesced promotion of a client's samples to UNDER_REVIEW.
+
+A client's samples move to review once every assignment for a parameter
+is completed. Writers call mark_for_promotion() with the (client,
+parameter) pair they touched. Pairs are collected per thread and evaluated
+in one transaction.on_commit batch, in the same way as the report rollups:
+once per request (PromotionBatchMiddleware wraps each request in
+promotion_batch()), or once per transaction for writes outside a request.
+
+A batch checks all of its pairs with one aggregate query and promotes the
+ready clients with one UPDATE ... WHERE status != under_review. History
+rows are then inserted in bulk.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from lims.models import Sample, SampleStatus, TestAssignment
+from lims.utils.report_cache import bump_report_version
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def _pending():
+    pending = getattr(_state, "pending", None)
+    if pending is None:
+        pending = _state.pending = set()
+    return pending
+
+
+def _flush_scheduled():
+    return any(item[1] is flush for item in connection.run_on_commit)
+
+
+def mark_for_promotion(client_id, parameter_id):
+    """Queue a (client pk, parameter pk) pair for a promotion check after the current commit."""
+    if client_id is None or parameter_id is None:
+        return
+    _pending().add((client_id, parameter_id))
+    if not getattr(_state, "depth", 0) and not _flush_scheduled():
+        transaction.on_commit(flush)
+
+
+@contextmanager
+def promotion_batch():
+    """Collect every pair marked inside the block and check them in one flush."""
+    _state.depth = getattr(_state, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        if not _state.depth and getattr(_state, "pending", None):
+            transaction.on_commit(flush)
+
+
+def ready_pairs(pairs):
+    """The (client pk, parameter pk) pairs whose assignments are all completed."""
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    rows = (
+        TestAssignment.objects
+        .filter(
+            sample__client_id__in={client_id for client_id, _ in pairs},
+            parameter_id__in={parameter_id for _, parameter_id in pairs},
+        )
+        .values_list("sample__client_id", "parameter_id")
+        .annotate(open_count=Count("id", filter=~Q(status="completed")))
+        .order_by()
+    )
+    return {(client_id, parameter_id) for client_id, parameter_id, open_count in rows
+            if open_count == 0 and (client_id, parameter_id) in pairs}
+
+
+def promote_pairs(pairs, user=None):
+    """
+    Promote the clients of every ready pair. Returns the ready pairs, whether
+    or not any of their samples still needed moving.
+    """
+    ready = ready_pairs(pairs)
+    client_ids = {client_id for client_id, _ in ready}
+    if not client_ids:
+        return ready
+
+    with transaction.atomic():
+        to_promote = Sample.objects.filter(client_id__in=client_ids).exclude(status=SampleStatus.UNDER_REVIEW)
+        samples = list(to_promote.select_for_update())
+        if samples:
+            to_promote.filter(id__in=[s.id for s in samples]).update(status=SampleStatus.UNDER_REVIEW)
+            for sample in samples:
+                sample.status = SampleStatus.UNDER_REVIEW
+            Sample.history.bulk_history_create(samples, update=True, default_user=user)
+            transaction.on_commit(bump_report_version)
+            logger.info("Promoted %d samples of clients %s to review", len(samples), sorted(client_ids))
+    return ready
+
+
+def flush():
+    pending, _state.pending = getattr(_state, "pending", None), None
+    if not pending:
+        return
+    try:
+        promote_pairs(pending)
+    except Exception:
+        logger.exception("Could not promote samples for %s", sorted(pending))
+
+
+class PromotionBatchMiddleware:
+    """Checks the promotions queued while handling a request in one batch."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with promotion_batch():
+            return self.get_response(request)
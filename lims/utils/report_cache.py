@@ -0,0 +1,69 @@
+"""
+Module: report_cache.py
+Description: Short-lived cache of the manager report aggregates (and the
+analyst productivity distributions, under their own namespace).
+
+The dashboard, PDF, Excel and email views all need the same numbers for a
+range, usually within a minute of each other. Entries are keyed by range and
+by a data-version stamp; writes that change the numbers (rollup rebuilds,
+samples, results, equipment, calibrations) call bump_report_version(), which retires
+every cached entry at once. The stamp and the entries live in the "reports"
+cache alias, shared by every web process and the Celery worker, so a bump
+from any of them is seen by all.
+"""
+
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION_KEY = "manager-report:version"
+REPORT_CACHE_ALIAS = "reports"
+
+
+def report_cache():
+    alias = REPORT_CACHE_ALIAS if REPORT_CACHE_ALIAS in settings.CACHES else "default"
+    return caches[alias]
+
+
+def report_version():
+    cache = report_cache()
+    version = cache.get(REPORT_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(REPORT_VERSION_KEY, version, timeout=None):
+            version = cache.get(REPORT_VERSION_KEY, version)
+    return version
+
+
+def bump_report_version():
+    # Runs after writes commit; a cache outage must not fail the write
+    try:
+        report_cache().set(REPORT_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    except Exception:
+        logger.exception("Could not bump the report data version")
+
+
+def report_cache_key(range_type, start_date, end_date, today, namespace="manager-report"):
+    return f"{namespace}:{report_version()}:{range_type}:{start_date}:{end_date}:{today}"
+
+
+def cached_report_data(range_type, start_date, end_date, today, build, namespace="manager-report"):
+    """build() for this range, or the stored result of an earlier call."""
+    try:
+        key = report_cache_key(range_type, start_date, end_date, today, namespace)
+        cache = report_cache()
+        data = cache.get(key)
+    except Exception:
+        logger.exception("Report cache unavailable; building %s uncached", namespace)
+        return build()
+    if data is None:
+        data = build()
+        try:
+            cache.set(key, data, timeout=getattr(settings, "MANAGER_REPORT_CACHE_TTL", 300))
+        except Exception:
+            logger.exception("Could not store %s in the report cache", namespace)
+    return data
@@ -0,0 +1,127 @@
+"""
+Module: report_export.py
+Description: Full-detail manager report workbook.
+
+Built with openpyxl's write-only mode: every row goes straight to the
+worksheet's temporary file as it is read from a .iterator() queryset, and the
+finished workbook is saved to a temporary file that the view streams back.
+Memory use therefore does not grow with the size of the range.
+"""
+
+import datetime
+import tempfile
+
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from lims.models import CalibrationRecord, Expense, TestAssignment
+
+EXPORT_CHUNK_SIZE = 2000
+
+HEADER_FONT = Font(bold=True)
+
+
+def excel_value(value):
+    """Excel cannot store timezone-aware datetimes; write them in local time."""
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+def _write_sheet(wb, title, headers, rows):
+    ws = wb.create_sheet(title)
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = HEADER_FONT
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for row in rows:
+        ws.append([excel_value(v) for v in row])
+
+
+def _in_range(qs, field, start_date, end_date):
+    qs = qs.filter(**{f"{field}__lte": end_date})
+    if start_date:
+        qs = qs.filter(**{f"{field}__gte": start_date})
+    return qs
+
+
+def assignment_rows(start_date, end_date):
+    qs = _in_range(TestAssignment.objects.filter(is_control=False), "assigned_date__date", start_date, end_date)
+    return (
+        qs.order_by("assigned_date", "id")
+        .values_list(
+            "assigned_date", "sample__sample_code", "sample__client__client_id", "sample__client__name",
+            "parameter__group__name", "parameter__name", "analyst__username", "status",
+            "testresult__value", "parameter__default_price",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def expense_rows(start_date, end_date):
+    return (
+        _in_range(Expense.objects.all(), "date", start_date, end_date)
+        .order_by("date", "id")
+        .values_list("date", "category", "description", "amount", "entered_by__username", "note")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def calibration_rows(start_date, end_date):
+    return (
+        _in_range(CalibrationRecord.objects.all(), "calibration_date", start_date, end_date)
+        .order_by("calibration_date", "id")
+        .values_list(
+            "equipment__name", "equipment__serial_number", "calibration_date",
+            "expires_on", "calibrated_by", "comments",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def build_report_workbook(context):
+    """
+    Write the report for the context's range to a temporary .xlsx file and
+    return it, rewound and open. The caller owns (and closes) the file.
+    """
+    start_date, end_date = context["start_date"], context["end_date"]
+    wb = Workbook(write_only=True)
+
+    _write_sheet(wb, "Lab Report", ["Parameter", "Tests Run", "Revenue (₦)"], (
+        (row["parameter_name"], row["total_tests"], float(row["total_income"] or 0))
+        for row in context["top_parameters"]
+    ))
+    _write_sheet(wb, "Assignments", [
+        "Assigned", "Sample", "Client ID", "Client", "Group", "Parameter",
+        "Analyst", "Status", "Result", "Price (₦)",
+    ], assignment_rows(start_date, end_date))
+    _write_sheet(wb, "Daily Income", ["Day", "Income (₦)"], (
+        (row["day"], row["income"]) for row in context["daily_totals"]
+    ))
+    _write_sheet(wb, "Weekly Income", ["Week starting", "Income (₦)"], (
+        (row["week"], row["income"]) for row in context["weekly_totals"]
+    ))
+    _write_sheet(wb, "Monthly Income", ["Month", "Income (₦)"], (
+        (row["month"], row["income"]) for row in context["monthly_totals"]
+    ))
+    _write_sheet(wb, "Expenses", [
+        "Date", "Category", "Description", "Amount (₦)", "Entered by", "Note",
+    ], expense_rows(start_date, end_date))
+
+    samples = {row["analyst_name"]: row["sample_count"] for row in context["sample_per_analyst"]}
+    _write_sheet(wb, "Analyst Workload", ["Analyst", "Tests", "Samples"], (
+        (row["analyst_name"] or "Unassigned", row["total_tests"], samples.get(row["analyst_name"], 0))
+        for row in context["analyst_workload"]
+    ))
+    _write_sheet(wb, "Calibrations", [
+        "Equipment", "Serial number", "Calibrated on", "Expires on", "Calibrated by", "Comments",
+    ], calibration_rows(start_date, end_date))
+
+    out = tempfile.TemporaryFile(suffix=".xlsx")
+    wb.save(out)
+    out.seek(0)
+    return out
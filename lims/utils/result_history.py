@@ -0,0 +1,132 @@
+"""
+Module: result_history.py
+Description: Keyset-paginated result history for analysts.
+
+Pages are cut on (recorded_at, id), newest first, so each request fetches
+one page of rows no matter how many results the analyst has recorded.
+Turnaround time and bench duration are computed in the query. The
+per-client and per-parameter totals come from a single GROUP BY over the
+filtered set, so the page's groups show overall counts without loading
+the other pages.
+"""
+
+from collections import Counter, OrderedDict
+
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_datetime
+
+HISTORY_PAGE_SIZE = 50
+
+
+def encode_cursor(row):
+    return f"{row['recorded_at'].isoformat()}|{row['id']}"
+
+
+def decode_cursor(value):
+    """(recorded_at, id) from a cursor string, or None if it is malformed."""
+    try:
+        stamp, pk = (value or "").rsplit("|", 1)
+        # An unencoded "+" in the UTC offset arrives as a space
+        stamp = stamp.replace(" ", "+")
+        recorded_at = parse_datetime(stamp)
+        return (recorded_at, int(pk)) if recorded_at else None
+    except ValueError:
+        return None
+
+
+def history_rows(results):
+    return (
+        results.filter(recorded_at__isnull=False)
+        .annotate(
+            sample_code=F("test_assignment__sample__sample_code"),
+            parameter_name=F("test_assignment__parameter__name"),
+            client_code=F("test_assignment__sample__client__client_id"),
+            turnaround=ExpressionWrapper(
+                TruncDate("recorded_at") - F("test_assignment__sample__received_date"),
+                output_field=DurationField(),
+            ),
+            duration=ExpressionWrapper(F("recorded_at") - F("started_at"), output_field=DurationField()),
+        )
+        .values(
+            "id", "value", "recorded_at", "sample_code", "parameter_name", "client_code",
+            "turnaround", "duration",
+        )
+    )
+
+
+def history_page(results, after=None, before=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    One page of `results` (a filtered TestResult queryset), newest first.
+    `after` continues with older rows than the cursor, `before` goes back to
+    newer ones. Returns (rows, older_cursor, newer_cursor); a cursor is None
+    when there is nothing further in that direction.
+    """
+    rows = history_rows(results)
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    if before:
+        stamp, pk = before
+        page = list(
+            rows.filter(Q(recorded_at__gt=stamp) | Q(recorded_at=stamp, id__gt=pk))
+            .order_by("recorded_at", "id")[:page_size + 1]
+        )
+        has_newer = len(page) > page_size
+        page = list(reversed(page[:page_size]))
+        has_older = True
+    else:
+        if after:
+            stamp, pk = after
+            rows = rows.filter(Q(recorded_at__lt=stamp) | Q(recorded_at=stamp, id__lt=pk))
+        page = list(rows.order_by("-recorded_at", "-id")[:page_size + 1])
+        has_older = len(page) > page_size
+        page = page[:page_size]
+        has_newer = bool(after)
+
+    for row in page:
+        row["turnaround_days"] = row["turnaround"].days if row["turnaround"] is not None else None
+
+    older = encode_cursor(page[-1]) if page and has_older else None
+    newer = encode_cursor(page[0]) if page and has_newer else None
+    return page, older, newer
+
+
+def history_totals(results):
+    """{(client_id, parameter): count} for the whole filtered set, in one query."""
+    return {
+        (row["client_code"], row["parameter_name"]): row["n"]
+        for row in results.filter(recorded_at__isnull=False)
+        .values(
+            client_code=F("test_assignment__sample__client__client_id"),
+            parameter_name=F("test_assignment__parameter__name"),
+        )
+        .annotate(n=Count("id"))
+        .order_by()
+    }
+
+
+def group_page(rows, totals):
+    """
+    The page's rows grouped by client, then parameter, in page order, each
+    group carrying its total across all pages.
+    """
+    client_totals = Counter()
+    for (client_code, _), n in totals.items():
+        client_totals[client_code] += n
+
+    clients = OrderedDict()
+    for row in rows:
+        params = clients.setdefault(row["client_code"], OrderedDict())
+        params.setdefault(row["parameter_name"], []).append(row)
+
+    return [
+        {
+            "client_id": client_code,
+            "total": client_totals[client_code],
+            "parameters": [
+                {"name": name, "total": totals.get((client_code, name), len(tests)), "rows": tests}
+                for name, tests in params.items()
+            ],
+        }
+        for client_code, params in clients.items()
+    ]
@@ -0,0 +1,96 @@
+"""
+Module: rollups.py
+Description: Keeps the manager report rollups (DailyWorkloadFact,
+DailyExpenseTotal) current as assignments and expenses are written.
+
+Signal handlers call mark_dirty() with the day a write touched. Marks are
+collected per thread and applied in a single transaction.on_commit batch:
+once per request (RollupBatchMiddleware wraps each request in
+rollup_batch()), or once per transaction for writes outside a request.
+A rolled-back transaction never reaches the flush, and a failed flush
+only leaves drift for check_report_rollups to repair.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from lims.utils.workload_facts import rebuild_days, rebuild_expense_days
+
+logger = logging.getLogger(__name__)
+
+REBUILDERS = {
+    "workload": rebuild_days,
+    "expenses": rebuild_expense_days,
+}
+
+_state = threading.local()
+
+
+def local_day(value):
+    """The report day of a datetime (current timezone) or date."""
+    if value is None:
+        return None
+    if hasattr(value, "hour"):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _pending():
+    pending = getattr(_state, "pending", None)
+    if pending is None:
+        pending = _state.pending = {kind: set() for kind in REBUILDERS}
+    return pending
+
+
+def _flush_scheduled():
+    return any(item[1] is flush for item in connection.run_on_commit)
+
+
+def mark_dirty(kind, day):
+    """Queue `day` of rollup `kind` for recomputation after the current commit."""
+    if day is None:
+        return
+    _pending()[kind].add(day)
+    if not getattr(_state, "depth", 0) and not _flush_scheduled():
+        transaction.on_commit(flush)
+
+
+@contextmanager
+def rollup_batch():
+    """Collect every mark made inside the block and apply them in one flush."""
+    _state.depth = getattr(_state, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        pending = getattr(_state, "pending", None)
+        if not _state.depth and pending and any(pending.values()):
+            transaction.on_commit(flush)
+
+
+def flush():
+    pending, _state.pending = getattr(_state, "pending", None), None
+    if not pending:
+        return
+    for kind, days in pending.items():
+        if not days:
+            continue
+        try:
+            REBUILDERS[kind](days)
+        except Exception:
+            logger.exception("Could not update %s rollups for %s", kind, sorted(days))
+
+
+class RollupBatchMiddleware:
+    """Applies the rollup changes made while handling a request in one batch."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with rollup_batch():
+            return self.get_response(request)
@@ -0,0 +1,229 @@
+"""
+Module: workload_facts.py
+Description: Builds DailyWorkloadFact rows and answers the manager report
+from them.
+
+Facts are always rebuilt a whole day at a time from the TestAssignment
+table, so a rebuild is idempotent and its cost depends on one day's tests.
+DailyExpenseTotal is rebuilt the same way from Expense. lims.utils.rollups
+decides which days to rebuild after each write.
+The report then aggregates at most one row per (day, client, parameter,
+analyst) instead of scanning the assignment history.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+
+from lims.models import DailyExpenseTotal, DailyWorkloadFact, Expense, TestAssignment
+from lims.utils.report_cache import bump_report_version
+
+FACT_BATCH_SIZE = 1000
+
+
+def assignment_rows(start=None, end=None):
+    """(day, client, group, parameter, analyst, sample, price) per non-control assignment."""
+    qs = TestAssignment.objects.filter(is_control=False)
+    if start:
+        qs = qs.filter(assigned_date__date__gte=start)
+    if end:
+        qs = qs.filter(assigned_date__date__lte=end)
+    return (
+        qs.annotate(day=TruncDate("assigned_date"))
+        .order_by("id")
+        .values_list(
+            "day", "sample__client_id", "parameter__group_id", "parameter_id",
+            "analyst_id", "sample_id", "parameter__default_price",
+        )
+    )
+
+
+def compute_facts(rows):
+    """
+    Fold assignment rows into unsaved DailyWorkloadFact objects.
+    Rows must arrive in a stable order (assignment id) so the distinct-sample
+    credits land on the same fact on every rebuild.
+    """
+    facts = {}
+    samples = defaultdict(set)
+    group_credit = set()
+    analyst_credit = set()
+
+    for day, client_id, group_id, parameter_id, analyst_id, sample_id, price in rows:
+        key = (day, client_id, group_id, parameter_id, analyst_id)
+        fact = facts.get(key)
+        if fact is None:
+            fact = facts[key] = DailyWorkloadFact(
+                day=day, client_id=client_id, group_id=group_id,
+                parameter_id=parameter_id, analyst_id=analyst_id, income=Decimal("0"),
+            )
+        fact.test_count += 1
+        fact.income += price or 0
+        samples[key].add(sample_id)
+
+        if (day, client_id, group_id, sample_id) not in group_credit:
+            group_credit.add((day, client_id, group_id, sample_id))
+            fact.group_sample_count += 1
+        if (day, analyst_id, sample_id) not in analyst_credit:
+            analyst_credit.add((day, analyst_id, sample_id))
+            fact.analyst_sample_count += 1
+
+    for key, fact in facts.items():
+        fact.sample_count = len(samples[key])
+    return list(facts.values())
+
+
+def rebuild_facts(start=None, end=None):
+    """Replace the facts for [start, end] (open-ended when None). Returns the number of rows written."""
+    facts = compute_facts(assignment_rows(start, end).iterator(chunk_size=5000))
+
+    existing = DailyWorkloadFact.objects.all()
+    if start:
+        existing = existing.filter(day__gte=start)
+    if end:
+        existing = existing.filter(day__lte=end)
+
+    with transaction.atomic():
+        existing.delete()
+        DailyWorkloadFact.objects.bulk_create(facts, batch_size=FACT_BATCH_SIZE)
+    transaction.on_commit(bump_report_version)
+    return len(facts)
+
+
+def rebuild_days(days):
+    """Rebuild the facts for each given date."""
+    written = 0
+    for day in sorted(set(days)):
+        written += rebuild_facts(day, day)
+    return written
+
+
+def rebuild_expense_days(days):
+    """Recompute DailyExpenseTotal for each given date."""
+    days = sorted(set(days))
+    totals = (
+        Expense.objects.filter(date__in=days)
+        .values("date")
+        .annotate(amount=Sum("amount"), entries=Count("id"))
+    )
+    rows = [DailyExpenseTotal(day=t["date"], amount=t["amount"], entry_count=t["entries"]) for t in totals]
+    with transaction.atomic():
+        DailyExpenseTotal.objects.filter(day__in=days).delete()
+        DailyExpenseTotal.objects.bulk_create(rows)
+    transaction.on_commit(bump_report_version)
+    return len(rows)
+
+
+def rebuild_expenses(start=None, end=None):
+    """Recompute DailyExpenseTotal for every expense date in [start, end]."""
+    expenses = Expense.objects.all()
+    existing = DailyExpenseTotal.objects.all()
+    if start:
+        expenses, existing = expenses.filter(date__gte=start), existing.filter(day__gte=start)
+    if end:
+        expenses, existing = expenses.filter(date__lte=end), existing.filter(day__lte=end)
+    days = set(expenses.values_list("date", flat=True).distinct())
+    days.update(existing.values_list("day", flat=True))
+    return rebuild_expense_days(days)
+
+
+def fact_snapshot(facts):
+    """{day: {grain: counters}} for comparing stored facts with a recompute."""
+    snapshot = defaultdict(dict)
+    for f in facts:
+        snapshot[f.day][(f.client_id, f.group_id, f.parameter_id, f.analyst_id)] = (
+            f.test_count, f.sample_count, f.group_sample_count, f.analyst_sample_count, Decimal(f.income),
+        )
+    return snapshot
+
+
+def workload_drift(start, end):
+    """Days in [start, end] whose stored facts differ from a full recompute."""
+    stored = fact_snapshot(DailyWorkloadFact.objects.filter(day__range=(start, end)).iterator())
+    computed = fact_snapshot(compute_facts(assignment_rows(start, end).iterator(chunk_size=5000)))
+    return sorted(day for day in set(stored) | set(computed) if stored.get(day) != computed.get(day))
+
+
+def expense_drift(start, end):
+    """Days in [start, end] whose DailyExpenseTotal differs from the Expense table."""
+    stored = {
+        t.day: (Decimal(t.amount), t.entry_count)
+        for t in DailyExpenseTotal.objects.filter(day__range=(start, end))
+    }
+    computed = {
+        t["date"]: (Decimal(t["amount"]), t["entries"])
+        for t in Expense.objects.filter(date__range=(start, end))
+        .values("date").annotate(amount=Sum("amount"), entries=Count("id"))
+    }
+    return sorted(day for day in set(stored) | set(computed) if stored.get(day) != computed.get(day))
+
+
+def workload_report(start_date, end_date, today):
+    """
+    The manager report's test and income breakdowns for [start_date, end_date]
+    (start_date None means all time), as plain lists and numbers in the
+    shapes the report templates use, so the result can be cached.
+    """
+    facts = DailyWorkloadFact.objects.filter(day__lte=end_date)
+    if start_date:
+        facts = facts.filter(day__gte=start_date)
+
+    totals = facts.aggregate(
+        income=Sum("income"),
+        tests=Sum("test_count"),
+        with_analysts=Sum("test_count", filter=Q(analyst__isnull=False)),
+    )
+    today_totals = DailyWorkloadFact.objects.filter(day=today).aggregate(
+        income=Sum("income"), tests=Sum("test_count"),
+    )
+    expenses = DailyExpenseTotal.objects.filter(day__lte=end_date)
+    if start_date:
+        expenses = expenses.filter(day__gte=start_date)
+    total_expenses = expenses.aggregate(total=Sum("amount"))["total"]
+
+    return {
+        "analysis_summary": list(
+            facts.values(
+                date_assigned=F("day"),
+                client_name=F("client__name"),
+                parameter_group=F("group__name"),
+            )
+            .annotate(sample_count=Sum("group_sample_count"), income=Sum("income"))
+            .order_by("-date_assigned")
+        ),
+        "daily_totals": list(facts.values("day").annotate(income=Sum("income")).order_by("day")),
+        "weekly_totals": list(
+            facts.annotate(week=TruncWeek("day")).values("week").annotate(income=Sum("income")).order_by("week")
+        ),
+        "monthly_totals": list(
+            facts.annotate(month=TruncMonth("day")).values("month").annotate(income=Sum("income")).order_by("month")
+        ),
+        "top_parameters": list(
+            facts.values(parameter_name=F("parameter__name"))
+            .annotate(total_tests=Sum("test_count"), total_income=Sum("income"))
+            .order_by("-total_income")[:10]
+        ),
+        "analyst_workload": list(
+            facts.values(analyst_name=F("analyst__username"))
+            .annotate(total_tests=Sum("test_count"))
+            .order_by("-total_tests")
+        ),
+        "sample_per_analyst": list(
+            facts.values(analyst_name=F("analyst__username"))
+            .annotate(sample_count=Sum("analyst_sample_count"))
+        ),
+        "parameter_stats": list(
+            facts.values(parameter_name=F("parameter__name"))
+            .annotate(test_count=Sum("test_count"))
+            .order_by("-test_count")
+        ),
+        "gross_income": Decimal(totals["income"] or 0),
+        "total_expenses": Decimal(total_expenses or 0),
+        "test_count": totals["tests"] or 0,
+        "assigned_with_analysts": totals["with_analysts"] or 0,
+        "today_total_income": today_totals["income"] or 0,
+        "today_test_count": today_totals["tests"] or 0,
+    }
@@ -9,22 +9,19 @@ from lims.forms import ResultEntryForm
 from collections import defaultdict, Counter
 from django.utils.timezone import now
 from datetime import timedelta
-from lims.utils.derived import _inject_derived_result
+from lims.utils.derived import update_derived_results
 from lims.models import User, ai
-from lims.utils.calculations import calculate_nfe_and_me
-from django.core.paginator import Paginator
 from datetime import datetime
 from lims.models import *
-from lims.utils.ai_helpers import generate_efficiency_nudge
+from lims.utils.ai_helpers import fallback_nudge
+from lims.utils.result_history import group_page, history_page, history_totals
 from lims.models.ai import EfficiencySnapshot
 from django.contrib.auth import get_user_model
 from django.utils.timezone import now
 from datetime import datetime
-from django.core.paginator import Paginator
 from django.utils.dateparse import parse_date
 from collections import defaultdict
 from datetime import datetime
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
 from lims.models import TestResult
@@ -86,20 +83,22 @@ def analyst_dashboard_view(request):
     nudge_message = ""
 
     if my_snapshot and my_snapshot.average_duration:
-        durations = [s.average_duration.total_seconds() for s in snapshots if s.average_duration]
-        my_avg = my_snapshot.average_duration.total_seconds()
-        faster_than = sum(1 for d in durations if my_avg < d)
-        percentile = round((faster_than / len(durations)) * 100) if durations else 0
-
-        try:
-            nudge_message = generate_efficiency_nudge(
+        # Written weekly by the snapshot job; never generated on page load
+        nudge_message = my_snapshot.nudge_text
+        if not nudge_message:
+            my_avg = my_snapshot.average_duration.total_seconds()
+            percentile = my_snapshot.percentile_rank
+            if percentile is None:
+                # Snapshot written before ranks were stored
+                cohort = snapshots.count()
+                faster_than = snapshots.filter(average_duration__gt=my_snapshot.average_duration).count()
+                percentile = round((faster_than / cohort) * 100) if cohort else 0
+            nudge_message = fallback_nudge(
                 request.user.get_short_name() or request.user.username,
                 my_avg,
                 percentile,
                 my_snapshot.total_tests
             )
-        except Exception as e:
-            nudge_message = f"⚠️ Couldn't generate nudge: {str(e)}"
 
     context = {
         'grouped_assignments': dict(grouped),
@@ -128,10 +127,7 @@ def result_history_view(request):
     date_to = request.GET.get('to')
     parameter = request.GET.get('parameter')
 
-    results = TestResult.objects.select_related(
-        'test_assignment__sample__client',
-        'test_assignment__parameter'
-    ).filter(recorded_by=request.user)
+    results = TestResult.objects.filter(recorded_by=request.user)
 
     if client_id:
         results = results.filter(test_assignment__sample__client__client_id=client_id)
@@ -145,31 +141,20 @@ def result_history_view(request):
     if date_to:
         results = results.filter(recorded_at__date__lte=datetime.strptime(date_to, "%Y-%m-%d").date())
 
-    total_results = results.count()
+    totals = history_totals(results)
+    rows, older_cursor, newer_cursor = history_page(
+        results, after=request.GET.get('after'), before=request.GET.get('before'),
+    )
+
     parameter_totals = Counter()
-    grouped = defaultdict(lambda: defaultdict(list))
-
-    # Enrich and group
-    for r in results:
-        assignment = r.test_assignment
-        sample = assignment.sample
-        r.sample_code = sample.sample_code
-        r.parameter = assignment.parameter.name
-        r.client_id = sample.client.client_id
-        received = sample.received_date
-        r.turnaround_days = (r.recorded_at.date() - received).days if received and r.recorded_at else None
-        r.duration = str(r.recorded_at - r.started_at) if r.started_at and r.recorded_at else None
-
-        parameter_totals[r.parameter] += 1
-        grouped[r.client_id][r.parameter].append(r)
-
-    client_groups = list(grouped.items())
-    paginator = Paginator(client_groups, 3)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    for (_, param_name), count in totals.items():
+        parameter_totals[param_name] += count
+    total_results = sum(parameter_totals.values())
 
     return render(request, 'lims/analyst/result_history.html', {
-        'page_obj': page_obj,
+        'client_groups': group_page(rows, totals),
+        'older_cursor': older_cursor,
+        'newer_cursor': newer_cursor,
         'filters': {
             'client_id': client_id or '',
             'from': date_from or '',
@@ -286,17 +271,7 @@ def enter_result_view(request, assignment_id):
 
             # Calculate derived results
             if not test.is_control:
-                sample = test.sample
-                results = TestResult.objects.filter(test_assignment__sample=sample)
-                result_dict = {
-                    r.test_assignment.parameter.name: float(r.value)
-                    for r in results if r.value is not None
-                }
-                nfe, me = calculate_nfe_and_me(result_dict)
-                if nfe is not None:
-                    _inject_derived_result("Carbohydrate", nfe, sample, recorded_by=request.user)
-                if me is not None:
-                    _inject_derived_result("ME", me, sample, recorded_by=request.user)
+                update_derived_results([test.sample_id], recorded_by=request.user)
 
             # Mark test assignment as completed
             test.status = 'completed'
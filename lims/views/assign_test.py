@@ -1,9 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from lims.models import Client, Sample, Parameter, TestAssignment, User
 from django.urls import reverse
-from django.db.models import Count, Q
-from django.db.models import Count, F
-from lims.models import Client, Sample, Parameter, TestAssignment, QCMetrics, ControlSpec, User, SampleStatus
+from django.db.models import Q
+from lims.models import Client, Sample, Parameter, TestAssignment, QCMetrics, ControlSpec, User
 import csv
 from django.http import HttpResponse
 from reportlab.pdfgen import canvas
@@ -12,9 +11,12 @@ from django.contrib.auth import get_user_model
 from notifications.utils import notify
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_protect
-from django.utils import timezone
 from collections import defaultdict
 from lims.utils.notifications import notify_analyst_by_email
+from lims.utils.assignments import (
+    OVERVIEW_PAGE_SIZE, assign_samples, assignment_lookup, client_assignment_stats, overview_client_ids,
+    overview_entries,
+)
 
 User = get_user_model()
 
@@ -42,86 +44,21 @@ def assign_parameter_tests(request, client_id, parameter_id):
         include_reference = request.POST.get("include_reference") == "on"
 
         # Limit to samples the manager was allowed to pick from.             # <<< changed (defensive)
-        allowed_ids = list(samples.values_list("id", flat=True))
+        allowed_ids = set(samples.values_list("id", flat=True))
         if sample_ids:
-            filtered_ids = [sid for sid in sample_ids if sid and int(sid) in allowed_ids]
-            selected_samples = Sample.objects.filter(id__in=filtered_ids)
+            selected_ids = [int(sid) for sid in sample_ids if sid.isdigit() and int(sid) in allowed_ids]
         else:
-            selected_samples = samples
-
-        # Assign selected samples
-        for sample in selected_samples:
-            is_control = str(sample.id) == control_sample_id
-            TestAssignment.objects.update_or_create(
-                sample=sample,
-                parameter=parameter,
-                defaults={
-                    "analyst": analyst,
-                    "is_control": is_control,
-                    "assigned_date": timezone.now(),
-                }
-            )
-
-        # Update sample statuses
-        for sample in selected_samples:
-            if sample.status == SampleStatus.RECEIVED:
-                sample.status = SampleStatus.ASSIGNED
-                sample.save(update_fields=["status"])
-
-        # --- Auto Reference (if requested + Proximate) ---------------------
-        if include_reference and parameter.group.name == "Proximate":
-            base_code = f"REF-{client.client_id}-{parameter.name[:3].upper()}"
-            sample_code = base_code
-            count = 1
-            while Sample.objects.filter(sample_code=sample_code).exists():
-                sample_code = f"{base_code}-{count}"
-                count += 1
-
-            reference_sample, _ = Sample.objects.get_or_create(
-                sample_code=sample_code,
-                defaults={
-                    "client": client,
-                    "sample_type": "reference",
-                    "weight": 0,
-                    "status": SampleStatus.ASSIGNED
-                }
-            )
-
-            TestAssignment.objects.get_or_create(
-                sample=reference_sample,
-                parameter=parameter,
-                defaults={"analyst": analyst, "is_reference": True}
-            )
-
-        # --- Auto QC when required -----------------------------------------
-        qc_required_groups = ["Proximate", "Gross Energy"]
-        if parameter.group.name in qc_required_groups:
-            base_code = f"QC-{client.client_id}-{parameter.name[:3].upper()}"
-            sample_code = base_code
-            count = 1
-            while Sample.objects.filter(sample_code=sample_code).exists():
-                sample_code = f"{base_code}-{count}"
-                count += 1
-
-            qc_sample, _ = Sample.objects.get_or_create(
-                sample_code=sample_code,
-                defaults={
-                    "client": client,
-                    "sample_type": "qc",
-                    "weight": 0,
-                    "status": SampleStatus.ASSIGNED
-                }
-            )
-
-            TestAssignment.objects.get_or_create(
-                sample=qc_sample,
-                parameter=parameter,
-                defaults={"analyst": analyst, "is_control": True}
-            )
-
-        # Count *only user-assigned (non QC/Reference)* samples.              # <<< changed
-        sample_count = selected_samples.count()
+            selected_ids = sorted(allowed_ids)
+
+        # Upsert every assignment, mark received samples assigned, add QC/reference samples
+        sample_count = assign_samples(
+            client, parameter, analyst, selected_ids,
+            control_sample_id=int(control_sample_id) if control_sample_id and control_sample_id.isdigit() else None,
+            include_reference=include_reference,
+            assigned_by=request.user,
+        )
 
+        # Count *only user-assigned (non QC/Reference)* samples.
         notify_analyst_by_email(
             analyst.email,
             analyst.get_full_name(),
@@ -131,26 +68,15 @@ def assign_parameter_tests(request, client_id, parameter_id):
         )
         return redirect('assign_by_parameter_overview', client_id=client.client_id)
 
-    # --- Assigned sample IDs limited to assignable samples ----------------- # <<< changed
-    assignable_ids = samples.values_list('id', flat=True)
-    assigned_sample_ids = TestAssignment.objects.filter(
-        sample_id__in=assignable_ids,
-        parameter=parameter
-    ).values_list('sample_id', flat=True)
-
-    # Current control among assignable samples (if any)                       # <<< changed
-    current_control_id = TestAssignment.objects.filter(
-        sample_id__in=assignable_ids,
-        parameter=parameter,
-        is_control=True
-    ).values_list('sample_id', flat=True).first()
+    # Existing assignments of the assignable samples, with analyst names, in one query
+    samples = list(samples)
+    lookup = assignment_lookup([sample.id for sample in samples], parameter)
+    assigned_sample_ids = list(lookup)
+    current_control_id = next((sample_id for sample_id, (_, is_control) in lookup.items() if is_control), None)
 
     # Decorate for template (safe: assignment may not exist)
     for sample in samples:
-        assignment = sample.testassignment_set.filter(parameter=parameter).first()
-        sample.assigned_analyst_name = (
-            assignment.analyst.get_full_name() if assignment and assignment.analyst else ""
-        )
+        sample.assigned_analyst_name = lookup.get(sample.id, ("", False))[0]
 
     return render(
         request,
@@ -192,71 +118,19 @@ def assign_overview_all_clients(request):
     Show for ALL clients:
     - parameter assignment progress
     - unassigned samples
-    all on one page grouped by client
+    grouped by client, paginated; ?pending=1 keeps only clients with unassigned work
     """
-    clients = Client.objects.all().order_by("-client_id")
-
-    # to hold data for each client
-    client_data = []
-
-    for client in clients:
-        # all samples except QC
-        samples = Sample.objects.filter(client=client).exclude(sample_type="QC")
-        total_samples = samples.count()
-
-        # assigned samples
-        assigned_sample_ids = TestAssignment.objects.filter(
-            sample__client=client,
-            analyst__isnull=False
-        ).values_list("sample_id", flat=True)
-
-        unassigned_samples = samples.exclude(id__in=assigned_sample_ids)
-
-        # parameter stats
-        parameter_stats = (
-            TestAssignment.objects
-            .filter(sample__client=client, analyst__isnull=False)
-            .exclude(sample__sample_type="QC")
-            .values('parameter_id')
-            .annotate(assigned_count=Count('sample', distinct=True))
-        )
-        assigned_lookup = {
-            stat['parameter_id']: stat['assigned_count'] for stat in parameter_stats
-        }
+    pending_only = request.GET.get("pending") == "1"
 
-        parameter_ids = (
-            TestAssignment.objects
-            .filter(sample__client=client)
-            .exclude(sample__sample_type="QC")
-            .values_list('parameter', flat=True)
-            .distinct()
-        )
-        parameters = Parameter.objects.filter(id__in=parameter_ids).order_by('name')
-        for param in parameters:
-            param.assigned_count = assigned_lookup.get(param.id, 0)
-
-        # QC controls
-        control_stats = (
-            TestAssignment.objects
-            .filter(sample__client=client, is_control=True)
-            .values('parameter')
-            .annotate(control_sample_id=F('sample_id'))
-        )
-        control_lookup = {
-            stat['parameter']: stat['control_sample_id'] for stat in control_stats
-        }
-
-        client_data.append({
-            "client": client,
-            "parameters": parameters,
-            "assigned_lookup": assigned_lookup,
-            "total_samples": total_samples,
-            "unassigned_samples": unassigned_samples,
-            "control_lookup": control_lookup,
-        })
+    # Two grouped queries for every client, then only the page's clients and samples
+    stats = client_assignment_stats()
+    client_ids = overview_client_ids(stats, pending_only=pending_only)
+    page_obj = Paginator(client_ids, OVERVIEW_PAGE_SIZE).get_page(request.GET.get("page"))
 
     return render(request, "lims/manager/assign_overview_all_clients.html", {
-        "client_data": client_data
+        "client_data": overview_entries(list(page_obj.object_list), stats),
+        "page_obj": page_obj,
+        "pending_only": pending_only,
     })
 
 
@@ -1,229 +1,84 @@
-import io
-import os
-import re
-import uuid
 import logging
-import tempfile
-from collections import defaultdict
 import datetime
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
-from pdfrw import PdfReader, PdfWriter, PageMerge
-from weasyprint import HTML
-from django.conf import settings
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.http import HttpResponse, HttpResponseNotFound, FileResponse
+from django.core.paginator import Paginator
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.http import HttpResponse, HttpResponseNotFound, FileResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template.loader import render_to_string
-from django.templatetags.static import static
-from django.utils import timezone
-from lims.models import Client, Sample, SampleStatus, TestResult
-from lims.models.coa import COAInterpretation
+from lims.models import Client, SampleStatus
+from lims.models.coa import COAInterpretation, COAReleaseJob
 from lims.forms import COAInterpretationForm
-from lims.utils.calculations import calculate_cho_and_me
-from lims.utils.coa_summary_ai import generate_dynamic_summary
-from lims.utils.notifications import notify_client_on_coa_release
-import copy
-from django.contrib.staticfiles import finders
+from lims.utils.coa_cache import coa_cache_key, open_cached_coa, store_coa
+from lims.utils.coa_dataset import ACCREDITED_GROUPS, CoaDataset, coa_assignments, coa_rows
+from lims.utils.pdf_assets import COA_STYLESHEET, write_pdf
+from lims.utils.coa_render import (
+    coa_pdf_context, releasable_clients, release_samples, release_summary_text, render_chunked_coa, use_chunked_render,
+)
+from lims.utils.coa_summary_ai import cached_summary, fallback_summary
+from lims.tasks import enqueue_coa_release, enqueue_coa_summary
 
 
 logger = logging.getLogger(__name__)
 
 
 
-def clean_method(method_str):
-    """
-    Extracts only the AOAC reference from a full method string.
-    E.g., from 'Kjedahl (AOAC 984.13 2000)' it returns 'AOAC 984.13'
-    """
-    match = re.search(r"(AOAC\s+\d{3,4}\.\d{1,2})", method_str, re.IGNORECASE)
-    return match.group(1) if match else method_str
-
-
-def chunked_samples(samples, chunk_size=8):
-    """Split the samples queryset/list into chunks of `chunk_size`."""
-    for i in range(0, len(samples), chunk_size):
-        yield samples[i:i + chunk_size]
+def coa_filename(client, accredited=True):
+    return f"COA_{client.client_id or client.id}_{'accredited' if accredited else 'unaccredited'}_{datetime.date.today().isoformat()}.pdf"
 
 
-def abs_static(path, pdf_mode=False, request=None):
+def render_coa_pdf(request, client, section, accredited=True, cache_key=None):
     """
-    Return a static file URL:
-    - If pdf_mode=True, return file:// path from STATIC_ROOT.
-    - Otherwise, return an absolute HTTP URL if request is provided.
+    Render the PDF for one CoaDataset section (accredited or unaccredited).
+    When `cache_key` is given the rendered bytes are kept in the COA artifact store.
     """
-    if pdf_mode:
-        return f"file://{os.path.join(settings.STATIC_ROOT, path)}"
-    
-    # If request is passed, build absolute URL, otherwise return relative static path
-    return request.build_absolute_uri(static(path)) if request else static(path)
-
-ACCREDITED_GROUPS = {
-    "Gross Energy",
-    "Vitamins & Contaminants",
-    "Aflatoxin",
-    "CHO",
-    "ME",
-    "Fiber",
-    "Fiber Fractions",
-    "Proximate",
-}
-
-
-def split_samples_by_accreditation(samples):
-    """
-    Split parameters of each sample into accredited and unaccredited lists.
-    """
-    accredited_groups = {
-        "Gross Energy", "Vitamins & Contaminants", "Aflatoxin",
-        "CHO", "ME", "Fiber Fractions", "Proximate"
-    }
+    context = coa_pdf_context(client, section, release_summary_text(client), accredited)
 
-    accredited_samples = []
-    unaccredited_samples = []
-
-    for s in samples:
-        s_accredited = copy.copy(s)
-        s_unaccredited = copy.copy(s)
-
-        s_accredited.filtered_assignments = []
-        s_unaccredited.filtered_assignments = []
-
-        for ta in s.testassignment_set.all():
-            group_name = ta.parameter.group.name if ta.parameter.group else None
-            if group_name in accredited_groups:
-                s_accredited.filtered_assignments.append(ta)
-            else:
-                s_unaccredited.filtered_assignments.append(ta)
-
-        if s_accredited.filtered_assignments:
-            accredited_samples.append(s_accredited)
-        if s_unaccredited.filtered_assignments:
-            unaccredited_samples.append(s_unaccredited)
+    if request.GET.get("preview"):
+        context["inline_css"] = True
+        return HttpResponse(render_to_string("lims/coa/coa_template.html", context))
+
+    if use_chunked_render(section):
+        # Inline: the render pool is for the worker, not for web processes
+        pdf = render_chunked_coa(
+            client, section, context["summary_text"], accredited,
+            base_url=request.build_absolute_uri("/"), renderer=write_pdf,
+        )
+    else:
+        html = render_to_string("lims/coa/coa_template.html", context)
+        pdf = write_pdf(html, base_url=request.build_absolute_uri("/"), stylesheets=[COA_STYLESHEET])
+    if cache_key:
+        store_coa(client, accredited, cache_key, pdf)
 
-    return accredited_samples, unaccredited_samples
+    filename = coa_filename(client, accredited)
+    response = HttpResponse(pdf, content_type="application/pdf")
+    response["Content-Disposition"] = f'attachment; filename=\"{filename}\"'
+    return response
 
 
 
-def render_coa_pdf(request, client, samples, accredited=True):
+def _serve_coa(request, client, accredited):
     """
-    Render the PDF for either accredited or unaccredited samples.
+    Serve a COA from the artifact store when its inputs are unchanged,
+    otherwise render it and keep the result for the next download.
     """
-    accredited_groups = {
-        "Gross Energy", "Vitamins & Contaminants", "Aflatoxin",
-        "CHO", "ME", "Fiber", "Proximate"
-    }
-    parameters = {}
-
-    for sample in samples:
-        sample.results = []
-        sample_environment = None
-        param_values = {}
-
-        # Get only assignments relevant for this COA
-        assignments = getattr(sample, "filtered_assignments", sample.testassignment_set.all())
-        for ta in assignments:
-            group_name = ta.parameter.group.name if ta.parameter.group else None
-
-            # Skip if not matching current COA type
-            if accredited and group_name not in accredited_groups:
-                continue
-            if not accredited and group_name in accredited_groups:
-                continue
-
-            param = ta.parameter
-            res = getattr(ta, "testresult", None)
-            if res and res.value is not None:
-                value = float(res.value)
-                param_values[param.name.lower()] = value
-                sample.results.append({
-                    "parameter": param.name,
-                    "method": param.method,
-                    "value": value,
-                    "unit": param.unit,
-                })
-                # Add parameter to parameter table
-                parameters[param.name] = (param.unit, clean_method(param.method))
-
-            env = getattr(ta, "testenvironment", None)
-            if env and not sample_environment:
-                sample_environment = f"{env.temperature}°C, {env.humidity}%RH"
-
-        # Derived CHO & ME
-        key_map = {
-            "protein": "protein",
-            "crude fat": "fat",
-            "crude fibre": "fiber",
-            "crude fiber": "fiber",
-            "moisture": "moisture",
-            "ash": "ash",
-        }
-        normalized = {norm: param_values[raw] for raw, norm in key_map.items() if raw in param_values}
-        required = {"protein", "fat", "fiber", "moisture", "ash"}
-        if required.issubset(normalized):
-            cho = round(100 - sum(normalized[k] for k in required), 2)
-            me = round(((normalized["protein"] * 4) + (normalized["fat"] * 9) + (cho * 4)) * 10, 2)
-            sample.results.append({"parameter": "CHO", "method": "AOAC (by difference)", "value": cho, "unit": "%"})
-            sample.results.append({"parameter": "ME", "method": "Calculated (Atwater factors)", "value": me, "unit": "kcal/kg"})
-            parameters.setdefault("CHO", ("%", "AOAC (by difference)"))
-            parameters.setdefault("ME", ("kcal/kg", "Calculated (Atwater factors)"))
-
-        sample.environment = sample_environment or "Ambient 25°C 50%RH"
-
-    # Prepare parameter table
-    parameter_rows = [
-        {"name": name, "unit": unit, "method": clean_method(method)}
-        for name, (unit, method) in sorted(parameters.items(), key=lambda x: x[0].lower())
-    ]
-
-    # Summary
-    interpretation = COAInterpretation.objects.filter(client=client).first()
-    summary_text = interpretation.summary_text if interpretation else "Summary not available."
-
-    # Weight display
-    weights = [s.weight for s in samples if s.weight is not None]
-    sample_weight_display = f"{min(weights)} g – {max(weights)} g" if len(weights) > 1 else (f"{weights[0]} g" if weights else "N/A")
-
-    # Chunking
-    chunk_size = 20
-    sample_chunks = [samples[i:i + chunk_size] for i in range(0, len(samples), chunk_size)]
-
-    # Letterhead & signatures
-    letterhead_url = abs_static(
-        "letterheads/accredited_letterhead.png" if accredited else "letterheads/unaccredited_letterhead.jpg",
-        pdf_mode=True
-    )
-    signature_1 = abs_static("images/signatures/hannah-sign.png", pdf_mode=True)
-    signature_2 = abs_static("images/signatures/julius-sign.jpg", pdf_mode=True)
-
-    context = {
-        "client": client,
-        "samples": samples,
-        "sample_chunks": sample_chunks,
-        "parameters": parameter_rows,
-        "summary_text": summary_text,
-        "sample_weight_display": sample_weight_display,
-        "today": datetime.date.today(),
-        "letterhead_url": letterhead_url,
-        "signature_1": signature_1,
-        "signature_2": signature_2,
-    }
-
-    html = render_to_string("lims/coa/coa_template.html", context)
-    if request.GET.get("preview"):
-        return HttpResponse(html)
-
-    pdf = HTML(string=html, base_url=request.build_absolute_uri("/")).write_pdf()
-    filename = f"COA_{client.client_id or client.id}_{'accredited' if accredited else 'unaccredited'}_{datetime.date.today().isoformat()}.pdf"
-    response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename=\"{filename}\"'
-    return response
+    rows = coa_rows(client)
+
+    cache_key = None
+    if not request.GET.get("preview"):
+        cache_key = coa_cache_key(client, accredited, rows=rows)
+        cached = open_cached_coa(client, accredited, cache_key)
+        if cached:
+            return FileResponse(
+                cached,
+                as_attachment=True,
+                filename=coa_filename(client, accredited),
+                content_type="application/pdf",
+            )
 
+    section = CoaDataset(client, rows).section(accredited)
+    return render_coa_pdf(request, client, section, accredited=accredited, cache_key=cache_key)
 
 
 @login_required
@@ -232,15 +87,7 @@ def generate_coa_pdf(request, client_id):
     Generate the accredited COA PDF.
     """
     client = get_object_or_404(Client, client_id=client_id)
-    samples = (
-        Sample.objects
-        .filter(client=client)
-        .exclude(sample_type="qc")
-        .prefetch_related("testassignment_set__parameter__group", "testassignment_set__testresult")
-    )
-
-    accredited_samples, _ = split_samples_by_accreditation(samples)
-    return render_coa_pdf(request, client, accredited_samples, accredited=True)
+    return _serve_coa(request, client, accredited=True)
 
 
 @login_required
@@ -249,15 +96,7 @@ def generate_unaccredited_coa_pdf(request, client_id):
     Generate the unaccredited COA PDF.
     """
     client = get_object_or_404(Client, client_id=client_id)
-    samples = (
-        Sample.objects
-        .filter(client=client)
-        .exclude(sample_type="qc")
-        .prefetch_related("testassignment_set__parameter__group", "testassignment_set__testresult")
-    )
-
-    _, unaccredited_samples = split_samples_by_accreditation(samples)
-    return render_coa_pdf(request, client, unaccredited_samples, accredited=False)
+    return _serve_coa(request, client, accredited=False)
 
 
 
@@ -288,331 +127,152 @@ def edit_summary(request, client_id):
 
 
 
+COA_DASHBOARD_PAGE_SIZE = 20
+
+# Non-QC samples, as seen from Client
+COA_SAMPLES = ~Q(sample__sample_type__iexact="qc") & ~Q(sample__sample_code__istartswith="qc-")
+
+
 @login_required
 def coa_dashboard(request):
-    # Get all samples except QC
-    samples = (
-        Sample.objects
-        .exclude(sample_type="qc")
-        .select_related("client")
-        .prefetch_related("testassignment_set__parameter")
-        .order_by("-client__client_id", "-received_date")
+    """
+    One row per client with SQL aggregates (sample counts, approvals,
+    unaccredited work), paginated. Unreleased clients are shown by default;
+    ?show=released or ?show=all widens the list. Sample detail is loaded
+    per client on demand (coa_dashboard_samples).
+    """
+    show = request.GET.get("show", "pending")
+    query = request.GET.get("q", "").strip()
+
+    unaccredited_work = (
+        coa_assignments(OuterRef("pk"))
+        .exclude(parameter__group__name__in=ACCREDITED_GROUPS)
     )
+    clients = (
+        Client.objects
+        .annotate(
+            sample_count=Count("sample", filter=COA_SAMPLES, distinct=True),
+            approved_count=Count(
+                "sample", filter=COA_SAMPLES & Q(sample__status=SampleStatus.APPROVED), distinct=True,
+            ),
+            last_received=Max("sample__received_date", filter=COA_SAMPLES),
+            has_unaccredited=Exists(unaccredited_work),
+        )
+        .filter(sample_count__gt=0)
+        .order_by("-client_id")
+    )
+    if show == "pending":
+        clients = clients.filter(coa_released=False)
+    elif show == "released":
+        clients = clients.filter(coa_released=True)
+    if query:
+        clients = clients.filter(
+            Q(client_id__icontains=query) | Q(name__icontains=query) | Q(organization__icontains=query)
+        )
 
-    # Group samples by client
-    grouped = defaultdict(lambda: {
-        "samples": [],
-        "all_completed": True,
-        "has_unaccredited": False
-    })
+    page_obj = Paginator(clients, COA_DASHBOARD_PAGE_SIZE).get_page(request.GET.get("page"))
 
-    for sample in samples:
-        client_entry = grouped[sample.client]
-        client_entry["samples"].append(sample)
-
-        # Add assignments (without touching testassignment_set)
-        sample.assignments = [
-            {
-                "parameter": a.parameter.name,
-                "method": a.parameter.method,
-                "unit": a.parameter.unit,
-            }
-            for a in sample.testassignment_set.all()
-        ]
-
-        # Check completion status
-        if sample.status != SampleStatus.APPROVED:
-            client_entry["all_completed"] = False
-
-    # Determine has_unaccredited for each client
-    for client, data in grouped.items():
-        accredited, unaccredited = split_samples_by_accreditation(data["samples"])
-        data["has_unaccredited"] = bool(unaccredited)
+    # Latest release job per client on this page so in-flight releases can be polled
+    page_clients = list(page_obj.object_list)
+    latest_jobs = {}
+    for job in COAReleaseJob.objects.filter(client__in=page_clients).order_by("client_id", "-created_at"):
+        latest_jobs.setdefault(job.client_id, job)
+    for client in page_clients:
+        client.all_completed = client.approved_count == client.sample_count
+        client.release_job = latest_jobs.get(client.id)
 
     context = {
-        "grouped": dict(grouped),
+        "clients": page_clients,
+        "page_obj": page_obj,
+        "show": show,
+        "query": query,
+        "releasable_count": releasable_clients().count(),
     }
     return render(request, "lims/coa/coa_dashboard.html", context)
 
 
+@login_required
+def coa_dashboard_samples(request, client_id):
+    """
+    Sample rows for one client card, fetched when the card is expanded.
+    """
+    client = get_object_or_404(Client, pk=client_id)
+    samples = (
+        release_samples(client)
+        .only("sample_code", "received_date", "sample_type", "status")
+        .order_by("-received_date", "sample_code")
+    )
+    return render(request, "lims/coa/_coa_dashboard_samples.html", {"client": client, "samples": samples})
 
 
-def _clean_method(txt):
-    if not txt:
-        return ""
-    return " ".join(str(txt).split())
-
-
-
-import logging
-from django.contrib.staticfiles import finders
-from weasyprint import HTML
 
-logger = logging.getLogger(__name__)
 
 @login_required
 def release_client_coa(request, client_id):
+    """
+    Queue the COA render-and-send for a client and return immediately.
+    The worker (lims.tasks.release_client_coa_task) does the rendering and SMTP.
+    """
     if request.method != "POST":
         return HttpResponse("❌ Not a POST request", status=405)
 
     client = get_object_or_404(Client, pk=client_id)
 
-    # --- Interpretation summary ---
-    interpretation = COAInterpretation.objects.filter(client=client).first()
-    summary_text = interpretation.summary_text if interpretation else "Summary not available."
-
-    # --- Client samples (ignore QC) ---
-    samples = (
-        Sample.objects
-        .exclude(sample_code__istartswith="qc-")
-        .filter(client=client)
-        .prefetch_related(
-            "testassignment_set__parameter__group",
-            "testassignment_set__testresult",
-            "testassignment_set__testenvironment",
-        )
-    )
-    if not samples.exists():
+    if not release_samples(client).exists():
         return HttpResponseNotFound("No samples found for this client.")
 
-    accredited_samples, unaccredited_samples = split_samples_by_accreditation(samples)
-
-    def generate_pdf(samples, accredited=True):
-        try:
-            # --- Prepare parameters/results ---
-            parameters = {}
-            for sample in samples:
-                sample.results = []
-                sample_environment = None
-                param_values = {}
-
-                for ta in sample.testassignment_set.all():
-                    group_name = ta.parameter.group.name if ta.parameter.group else None
-                    if accredited and group_name not in ACCREDITED_GROUPS:
-                        continue
-                    if not accredited and group_name in ACCREDITED_GROUPS:
-                        continue
-
-                    param = ta.parameter
-                    res = getattr(ta, "testresult", None)
-                    if res and res.value is not None:
-                        val = float(res.value)
-                        param_values[param.name.lower()] = val
-                        sample.results.append({
-                            "parameter": param.name,
-                            "method": param.method,
-                            "value": val,
-                            "unit": param.unit,
-                        })
-                        parameters[param.name] = (param.unit, param.method)
-
-                    env = getattr(ta, "testenvironment", None)
-                    if env and sample_environment is None:
-                        sample_environment = f"{env.temperature}°C, {env.humidity}%RH"
-
-                # --- Derived CHO/ME ---
-                key_map = {
-                    "protein": "protein",
-                    "crude fat": "fat",
-                    "ash": "ash",
-                    "moisture": "moisture",
-                    "crude fibre": "fiber",
-                    "crude fiber": "fiber",
-                }
-                mapped = {v: param_values[k] for k, v in key_map.items() if k in param_values}
-                if {"protein", "fat", "fiber", "moisture", "ash"}.issubset(mapped):
-                    cho = round(100 - sum(mapped[k] for k in ["protein", "fat", "fiber", "moisture", "ash"]), 2)
-                    me = round(((mapped["protein"] * 4) + (mapped["fat"] * 9) + (cho * 4)) * 10, 2)
-                    sample.results += [
-                        {"parameter": "CHO", "method": "AOAC by difference", "value": cho, "unit": "%"},
-                        {"parameter": "ME", "method": "Atwater factors", "value": me, "unit": "kcal/kg"},
-                    ]
-                    parameters.setdefault("CHO", ("%", "AOAC by difference"))
-                    parameters.setdefault("ME", ("kcal/kg", "Atwater factors"))
-
-                sample.environment = sample_environment or "Ambient 25°C 50%RH"
-
-            param_list = [
-                {"name": n, "unit": u, "method": _clean_method(m)}
-                for n, (u, m) in sorted(parameters.items(), key=lambda x: x[0].lower())
-            ]
-
-            # --- Weights ---
-            weights = [s.weight for s in samples if s.weight is not None]
-            sample_weight_display = (
-                f"{weights[0]} g" if len(weights) == 1 else
-                f"{min(weights)} g – {max(weights)} g" if weights else "N/A"
-            )
-
-            # --- Find assets via staticfiles ---
-            letterhead = finders.find(
-                "letterheads/accredited_letterhead.png" if accredited else "letterheads/unaccredited_letterhead.jpg"
-            )
-            sig1 = finders.find("images/signatures/hannah-sign.png")
-            sig2 = finders.find("images/signatures/julius-sign.jpg")
-
-            # --- PDF context ---
-            pdf_context = {
-                "client": client,
-                "samples": samples,
-                "sample_chunks": list(chunked_samples(samples, 20)),
-                "parameters": param_list,
-                "summary_text": summary_text,
-                "today": datetime.date.today(),
-                "letterhead_url": f"file://{letterhead}" if letterhead else "",
-                "signature_1": f"file://{sig1}" if sig1 else "",
-                "signature_2": f"file://{sig2}" if sig2 else "",
-                "sample_weight_display": sample_weight_display,
-            }
-
-            # --- Render ---
-            html = render_to_string("lims/coa/coa_template.html", pdf_context)
-            pdf_bytes = HTML(string=html).write_pdf()
-
-            filename = f"COA_{client.client_id}_{'accredited' if accredited else 'unaccredited'}_{timezone.now().strftime('%Y%m%d-%H%M%S')}.pdf"
-            return filename, pdf_bytes
-        except Exception as e:
-            logger.exception("PDF generation failed")
-            raise
-
-    # --- Build attachments ---
-    attachments = []
-    if accredited_samples:
-        attachments.append(generate_pdf(accredited_samples, True))
-    if unaccredited_samples:
-        attachments.append(generate_pdf(unaccredited_samples, False))
-
-    if not attachments:
-        return HttpResponseNotFound("No accredited or unaccredited samples found.")
-
-    # --- Mark released & email ---
-    try:
-        with transaction.atomic():
-            samples.update(coa_released=True)
-            client.coa_released = True
-            client.save(update_fields=["coa_released"])
-
-            notify_client_on_coa_release(client=client, summary_text=summary_text, attachments=attachments)
-
-        messages.success(request, f"✅ COA(s) released and emailed to {client.name}.")
-    except Exception as e:
-        logger.exception("Email sending failed")
-        return HttpResponseServerError("❌ Error while sending email")
+    job, created = enqueue_coa_release(client, requested_by=request.user)
+    if created:
+        messages.success(request, f"📨 COA release for {client.name} queued. The dashboard will update when it has been emailed.")
+    else:
+        messages.info(request, f"⏳ A COA release for {client.name} is already in progress.")
 
     return redirect("coa_dashboard")
 
 
+@login_required
+def release_ready_coas(request):
+    """
+    Bulk action: queue a release job for every client whose samples are all
+    approved and whose summary is confirmed.
+    """
+    if request.method != "POST":
+        return HttpResponse("❌ Not a POST request", status=405)
 
+    queued = 0
+    for client in releasable_clients():
+        _, created = enqueue_coa_release(client, requested_by=request.user)
+        queued += created
 
+    if queued:
+        messages.success(request, f"📨 Queued COA release for {queued} client(s).")
+    else:
+        messages.info(request, "No new clients were ready for release.")
+    return redirect("coa_dashboard")
 
 
-
-def _build_sample_data(samples_qs):
+@login_required
+def coa_release_job_status(request, job_id):
     """
-    Mutates & returns a list of sample-like objects annotated with:
-      .results = [{parameter, method, value, unit}, ...]
-      .environment = string
-    Also returns a sorted parameter list and a summary_input dict for summary generation.
+    JSON progress of a COA release job, polled by the COA dashboard.
     """
-    parameters = {}  # name -> (unit, method)
-    summary_input = defaultdict(list)
-
-    samples = list(samples_qs)  # evaluate once
-
-    for sample in samples:
-        sample.results = []
-        sample.environment = None
-
-        param_values = {}  # for CHO / ME
-        for ta in sample.testassignment_set.all():
-            param = ta.parameter
-            res = getattr(ta, "testresult", None)
-
-            if res and res.value is not None:
-                value = float(res.value)
-                param_values[param.name.lower()] = value
-
-                sample.results.append({
-                    "parameter": param.name,
-                    "method": param.method,
-                    "value": value,
-                    "unit": param.unit,
-                })
-
-                parameters[param.name] = (param.unit, param.method)
-                summary_input[param.name].append(value)
-
-            env = getattr(ta, "testenvironment", None)
-            if env and sample.environment is None:
-                sample.environment = f"{env.temperature}°C, {env.humidity}%RH"
-
-        # derived CHO / ME
-        key_map = {
-            "protein": "protein",
-            "crude fat": "fat",
-            "crude fibre": "fiber",
-            "crude fiber": "fiber",
-            "moisture": "moisture",
-            "ash": "ash",
-        }
-        mapped = {}
-        for raw, norm in key_map.items():
-            if raw in param_values:
-                mapped[norm] = param_values[raw]
-
-        required = {"protein", "fat", "fiber", "moisture", "ash"}
-        if required.issubset(mapped.keys()):
-            cho = round(100 - sum(mapped[k] for k in required), 2)
-            me = round(((mapped["protein"] * 4) + (mapped["fat"] * 9) + (cho * 4)) * 10, 2)
-
-            sample.results.append({
-                "parameter": "CHO",
-                "method": "AOAC by difference",
-                "value": cho,
-                "unit": "%",
-            })
-            sample.results.append({
-                "parameter": "ME",
-                "method": "Calculated using Atwater factors",
-                "value": me,
-                "unit": "kcal/kg",
-            })
-
-            parameters.setdefault("CHO", ("%", "AOAC by difference"))
-            parameters.setdefault("ME", ("kcal/kg", "Calculated using Atwater factors"))
-            summary_input["CHO"].append(cho)
-            summary_input["ME"].append(me)
-
-        if sample.environment is None:
-            sample.environment = "Ambient 25°C 50%RH"
-
-    # Sort param list
-    param_rows = [
-        {"name": name, "unit": unit, "method": clean_method(method)}
-        for name, (unit, method) in sorted(parameters.items(), key=lambda x: x[0].lower())
-    ]
-    return samples, param_rows, summary_input
+    job = get_object_or_404(COAReleaseJob.objects.select_related("client"), pk=job_id)
+    return JsonResponse(job.as_dict())
+
+
+
+
+
 
 
 @login_required
 def preview_coa(request, client_id):
-    samples = (
-        Sample.objects
-        .exclude(sample_code__startswith="QC-")
-        .filter(client__client_id=client_id)
-        .prefetch_related(
-            "testassignment_set__parameter",
-            "testassignment_set__testresult",
-            "testassignment_set__testenvironment",
-            "client"
-        )
-    )
+    client = get_object_or_404(Client, client_id=client_id)
+    dataset = CoaDataset.for_client(client)
 
-    if not samples.exists():
+    if not dataset.combined:
         return HttpResponse("No samples found for this client.", status=404)
 
-    client = samples.first().client
-
     # ✅ Get or create interpretation
     interpretation, _ = COAInterpretation.objects.get_or_create(client=client)
 
@@ -624,141 +284,49 @@ def preview_coa(request, client_id):
         messages.success(request, "Summary updated successfully.")
         return redirect("preview_coa", client_id=client_id)
 
-    # ✅ Prepare table data
-    table_data = []
-    parameter_set = set()
-    summary_input = {}  # { "Protein": [34.1, 33.8], ... }
-
-    for sample in samples:
-        row_data = {
-            "sample_code": sample.sample_code,
-            "weight": getattr(sample, "weight", None),
-            "environment": None,
-            "results": [],
-        }
-        param_values = {}
-
-        # Collect results for this sample
-        for ta in sample.testassignment_set.all():
-            res = getattr(ta, "testresult", None)
-            param = ta.parameter
-            parameter_set.add((param.name, param.unit, param.method))
-
-            if res and res.value is not None:
-                # normalize to float for summary calcs
-                val = float(res.value)
-                param_values[param.name.lower()] = val
-                row_data["results"].append({
-                    "parameter": param.name,
-                    "method": param.method,
-                    "value": val,
-                    "unit": param.unit,
-                })
-
-            env = getattr(ta, "testenvironment", None)
-            if env and not row_data["environment"]:
-                row_data["environment"] = f"{env.temperature}°C, {env.humidity}%RH"
-
-        # ✅ CHO and ME calculations (kcal/kg)
-        calc_map = {
-            "protein": "protein",
-            "crude fat": "fat",
-            "ash": "ash",
-            "moisture": "moisture",
-            "crude fibre": "fiber",
-        }
-
-        mapped_values = {}
-        for key, alias in calc_map.items():
-            if key in param_values:
-                mapped_values[alias] = param_values[key]
-
-        if all(alias in mapped_values for alias in ["protein", "fat", "ash", "moisture", "fiber"]):
-            cho = round(
-                100 - sum(mapped_values[k] for k in ["protein", "fat", "ash", "moisture", "fiber"]),
-                2
-            )
-            me = round(
-                ((mapped_values["protein"] * 4)
-                 + (mapped_values["fat"] * 9)
-                 + (cho * 4)) * 10,
-                2
-            )
+    summary_input = dataset.summary_input  # { "Protein": [34.1, 33.8], ... }
+    summary_pending = False
 
-            row_data["results"].append({
-                "parameter": "CHO",
-                "method": "AOAC by difference",
-                "value": cho,
-                "unit": "%",  # by-difference proximate remainder
-            })
-            row_data["results"].append({
-                "parameter": "ME",
-                "method": "Calculated using Atwater factors",
-                "value": me,
-                "unit": "kcal/kg",
-            })
-
-            parameter_set.add(("CHO", "%", "AOAC by difference"))
-            parameter_set.add(("ME", "kcal/kg", "Calculated using Atwater factors"))
-
-        row_data["environment"] = row_data["environment"] or "Ambient 25°C 50%RH"
-        table_data.append(row_data)
-
-        # ✅ Collect for summary generation
-        for result in row_data["results"]:
-            # result["value"] already float
-            summary_input.setdefault(result["parameter"], []).append(result["value"])
-
-    # ✅ Auto-generate summary if empty (AI first, fallback to avg)
+    # ✅ Auto-generate summary if empty: cached AI text right away, otherwise
+    # show the averages and let the worker fill in the AI text
     if not interpretation.summary_text:
         # Build AI payload (single item, using first sample's sample_type)
-        sample_type_name = getattr(samples.first(), "sample_type", None) or "Unknown"
         ai_payload = [{
-            "sample_type": sample_type_name,
-            "results": summary_input
+            "sample_type": dataset.sample_type or "Unknown",
+            "results": dict(summary_input)
         }]
 
-        ai_text = generate_dynamic_summary(ai_payload)
-        if ai_text and not ai_text.startswith("Summary generation failed"):
+        ai_text = cached_summary(ai_payload)
+        if ai_text:
             interpretation.summary_text = ai_text.strip()
+            interpretation.save()
         else:
-            # Fallback: avg lines
-            summary_lines = []
-            for pname, vals in summary_input.items():
-                if vals:
-                    avg_val = sum(vals) / len(vals)
-                    summary_lines.append(f"{pname}: avg {avg_val:.2f}")
-            interpretation.summary_text = "\n".join(summary_lines) or "Summary not available."
-
-        interpretation.save()
-
-    parameters = sorted(list(parameter_set))
-    summary_text = interpretation.summary_text
-
-    # Optional: include signatures & weight if your template needs them
-    # weight aggregation (lightweight; based on table_data)
-    weights = [row["weight"] for row in table_data if row["weight"] is not None]
-    if len(weights) == 1:
-        sample_weight_display = f"{weights[0]} g"
-    elif weights:
-        sample_weight_display = f"{min(weights)} g – {max(weights)} g"
-    else:
-        sample_weight_display = "N/A"
+            enqueue_coa_summary(client, ai_payload, fallback_summary(summary_input))
+            summary_pending = True
 
     context = {
         "client": client,
-        "samples": table_data,
-        "parameters": [
-            {"name": p[0], "unit": p[1], "method": clean_method(p[2])}
-            for p in parameters
-        ],
-        "summary_text": summary_text,
+        "samples": dataset.combined.samples,
+        "parameters": dataset.combined.assigned_parameters,
+        "summary_text": interpretation.summary_text or fallback_summary(summary_input),
+        "summary_pending": summary_pending,
         "today": datetime.date.today(),
         "letterhead_url": request.build_absolute_uri('/static/letterheads/coa_letterhead.png'),
 
          "signature_1": request.build_absolute_uri('/static/images/signatures/hannah-sign.png'),
          "signature_2": request.build_absolute_uri('/static/images/signatures/julius-sign.jpg'),
-         "sample_weight_display": sample_weight_display,
+         "sample_weight_display": dataset.combined.sample_weight_display,
     }
 
     return render(request, "lims/coa/preview_coa.html", context)
+
+
+@login_required
+def coa_summary_status(request, client_id):
+    """
+    Polled by the COA preview while the AI interpretation is generated.
+    """
+    client = get_object_or_404(Client, client_id=client_id)
+    interpretation = COAInterpretation.objects.filter(client=client).first()
+    summary_text = interpretation.summary_text if interpretation else ""
+    return JsonResponse({"ready": bool(summary_text), "summary_text": summary_text})
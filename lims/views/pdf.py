@@ -1,6 +1,6 @@
 from django.http import HttpResponse
 from django.template.loader import render_to_string
-from weasyprint import HTML
+from lims.utils.pdf_assets import write_pdf
 from lims.models import Client, Sample
 from django.utils import timezone
 
@@ -23,7 +23,7 @@ def intake_pdf_download(request, client_id):
         'now': timezone.now()
     })
 
-    pdf_file = HTML(string=html).write_pdf()
+    pdf_file = write_pdf(html)
 
     response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="JGL_Receipt_{client.client_id_code}.pdf"'
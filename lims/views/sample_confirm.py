@@ -1,6 +1,6 @@
 from django.shortcuts import render, get_object_or_404
 from lims.models import Client, Sample, TestAssignment
-from weasyprint import HTML
+from lims.utils.pdf_assets import write_pdf
 from django.template.loader import render_to_string
 from django.core.mail import EmailMessage
 from django.utils import timezone
@@ -47,7 +47,7 @@ def send_receipt_email(client, samples):
     })
 
     # Generate PDF
-    pdf = HTML(string=html_string).write_pdf()
+    pdf = write_pdf(html_string)
 
     # Compose email
     email_body = f"""
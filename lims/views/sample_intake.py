@@ -14,7 +14,7 @@ from users.models import RoleChoices
 from django.template.loader import render_to_string
 from django.http import HttpResponse
 from django.utils.timezone import now
-from weasyprint import HTML, CSS
+from lims.utils.pdf_assets import write_pdf
 
 
 
@@ -144,8 +144,7 @@ def download_sample_intake_pdf(request):
     })
 
     # Render to PDF using WeasyPrint
-    html = HTML(string=html_string, base_url=request.build_absolute_uri('/'))
-    pdf = html.write_pdf()
+    pdf = write_pdf(html_string, base_url=request.build_absolute_uri('/'))
 
     # Optional: add timestamp to filename
     timestamp = now().strftime('%Y%m%d_%H%M')
@@ -1,26 +1,16 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
-from django.utils import timezone
-from lims.utils.derived import _inject_derived_result
-from lims.models import TestAssignment, Equipment, TestResult, QCMetrics, SampleStatus, TestEnvironment, Client, Parameter
-from lims.forms import ResultEntryForm, QCMetricsForm, TestEnvironmentForm
-from django.contrib.auth import get_user_model
-from lims.utils.notifications import notify_manager_on_result_submission
-from django.contrib.auth.models import User
-from django.forms import modelform_factory
-from django import forms
-from django.db import transaction
-from django.utils.timezone import now as timezone_now
-from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
 from django.db import transaction
-from decimal import Decimal
+from django.forms import modelform_factory
+from django.views.decorators.http import require_POST
 
-from lims.models import (
-    TestAssignment, TestResult, TestEnvironment, Equipment,
-    ControlSpec, User
-)
-from lims.forms import QCMetricsForm, TestEnvironmentForm
+from lims.forms import InstrumentImportForm, QCMetricsForm, TestEnvironmentForm
+from lims.models import Client, ControlSpec, Equipment, Parameter, TestAssignment, TestEnvironment, TestResult
+from lims.utils.batch_results import promote_client_if_complete, write_batch_results
+from lims.utils.instrument_import import InstrumentImportError, import_instrument_file
+from lims.utils.notifications import notify_manager_on_result_submission
 
 User = get_user_model()
 
@@ -142,17 +132,27 @@ def enter_result(request, assignment_id):
 
 
 
+def promote_and_notify(client, parameter, analyst):
+    """Promote the client and notify managers once every assignment for the parameter is completed."""
+    if promote_client_if_complete(client, parameter, user=analyst):
+        managers = User.objects.filter(groups__name="Manager", is_active=True)
+        for manager in managers:
+            notify_manager_on_result_submission(
+                manager.email, analyst.get_full_name(), client.client_id, parameter.name
+            )
+
+
 @login_required
 def enter_batch_result(request, client_id, parameter_id):
     # Fetch assignments
-    assignments = (
+    assignments = list(
         TestAssignment.objects
         .filter(sample__client__client_id=client_id, parameter_id=parameter_id)
-        .select_related('sample', 'parameter')
+        .select_related('sample__client', 'parameter', 'testresult')
     )
 
     # ✅ Prevent crash if analysis not started
-    if not assignments.exists():
+    if not assignments:
         messages.error(
             request,
             "⚠️ No analysis started for this client/parameter. "
@@ -205,25 +205,6 @@ def enter_batch_result(request, client_id, parameter_id):
             is_active=True
         )
 
-    # ✅ Promote client if all assignments completed
-    def promote_if_complete(client, parameter, analyst_name):
-        incomplete = TestAssignment.objects.filter(
-            sample__client=client,
-            parameter=parameter
-        ).exclude(status="completed")
-
-        if not incomplete.exists():
-            for sample in client.sample_set.all():
-                if sample.status != "under_review":
-                    sample.status = "under_review"
-                    sample.save(update_fields=["status"])
-
-            managers = User.objects.filter(groups__name="Manager", is_active=True)
-            for manager in managers:
-                notify_manager_on_result_submission(
-                    manager.email, analyst_name, client.client_id, parameter.name
-                )
-
     # ✅ Handle POST submission
     if request.method == "POST":
         all_valid = all(form.is_valid() for _, form in result_forms)
@@ -232,43 +213,23 @@ def enter_batch_result(request, client_id, parameter_id):
 
         if env_valid and all_valid and qc_valid:
             with transaction.atomic():
-                # Save environment data
+                # Save results, environment and statuses for the whole batch
                 env_data = env_form.save(commit=False)
-
-                for assignment, form in result_forms:
-                    result = form.save(commit=False)
-                    result.test_assignment = assignment
-                    result.recorded_by = request.user
-                    result.source = "manual"
-                    result.recorded_at = timezone_now()
-                    result.save()
-
-                    # Save environment details for each assignment
-                    TestEnvironment.objects.update_or_create(
-                        test_assignment=assignment,
-                        defaults={
-                            "temperature": env_data.temperature,
-                            "humidity": env_data.humidity,
-                            "pressure": env_data.pressure,
-                            "instrument": env_data.instrument,
-                            "recorded_by": request.user,
-                        }
-                    )
-
-                    assignment.status = "completed"
-                    assignment.equipment_used = env_data.instrument
-                    assignment.save()
+                write_batch_results(
+                    client,
+                    [(assignment, form.save(commit=False)) for assignment, form in result_forms],
+                    env_data, request.user,
+                    control_assignment=control_assignment,
+                )
 
                 # Save QC form if exists
                 if qc_form and control_assignment:
                     qc = qc_form.save(commit=False)
                     qc.test_assignment = control_assignment
                     qc.save()
-                    control_assignment.status = "completed"
-                    control_assignment.save()
 
-                # Check if all assignments complete → promote client
-                promote_if_complete(client, parameter, request.user.get_full_name())
+                # Check once if all assignments complete → promote client
+                promote_and_notify(client, parameter, request.user)
 
                 messages.success(request, "✅ Batch result submitted successfully.")
                 return redirect(
@@ -289,11 +250,60 @@ def enter_batch_result(request, client_id, parameter_id):
         "equipment_qs": Equipment.objects.filter(parameters_supported=parameter, is_active=True),
         "env_form": env_form,
         "control_spec": control_spec,
+        "import_form": InstrumentImportForm(parameter=parameter),
     }
 
     return render(request, "lims/analyst/batch_result_entry.html", context)
 
 
+@login_required
+@require_POST
+def import_batch_results(request, client_id, parameter_id):
+    """
+    Import a batch's results from an instrument export (see
+    lims.utils.instrument_import). The whole file is rejected on any row error.
+    """
+    client = get_object_or_404(Client, client_id=client_id)
+    parameter = get_object_or_404(Parameter, id=parameter_id)
+    back = redirect("enter_batch_result", client_id=client.client_id, parameter_id=parameter.id)
+
+    form = InstrumentImportForm(request.POST, request.FILES, parameter=parameter)
+    if not form.is_valid():
+        for field, errors in form.errors.items():
+            for error in errors:
+                messages.error(request, f"❌ {form.fields[field].label if field in form.fields else field}: {error}")
+        return back
+
+    instrument = form.cleaned_data["instrument"]
+    environment = TestEnvironment(
+        temperature=form.cleaned_data["temperature"],
+        humidity=form.cleaned_data["humidity"],
+        instrument=instrument,
+    )
+    try:
+        summary = import_instrument_file(
+            form.cleaned_data["file"], instrument.import_profile, client, parameter, request.user, environment,
+        )
+    except InstrumentImportError as exc:
+        messages.error(request, f"❌ {exc}")
+        return back
+
+    if summary["errors"]:
+        messages.error(request, "❌ Nothing was imported. Please fix these rows and upload the file again:")
+        for error in summary["errors"]:
+            messages.error(request, error)
+        return back
+
+    messages.success(request, f"✅ Imported {summary['imported']} results from {instrument.name}.")
+    if summary["qc_status"] == "pass":
+        messages.success(request, f"✅ QC PASSED for {parameter.name}")
+    elif summary["qc_status"] == "fail":
+        messages.error(request, f"❌ QC FAILED for {parameter.name}")
+
+    promote_and_notify(client, parameter, request.user)
+    return redirect("result_success_batch", client_id=client.client_id, parameter_id=parameter.id)
+
+
 @login_required
 def batch_result_success(request, client_id, parameter_id):
     client = get_object_or_404(Client, client_id=client_id)
@@ -0,0 +1,15 @@
+"""
+Celery application for background work (COA release, report dispatch).
+
+Run a worker locally with `python manage.py run_worker`.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lims_project.settings.base")
+
+app = Celery("lims_project")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
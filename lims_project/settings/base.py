@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from decouple import config
+from celery.schedules import crontab
 import os
 from dotenv import load_dotenv
 import dj_database_url
@@ -57,6 +58,75 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.User'
 COA_INTERNAL_RECIPIENTS = ["manager@jaageelab.com"]
 
+# Background jobs (Celery)
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Periodic jobs (scheduled manager reports, weekly efficiency snapshots);
+# run beat with `run_worker --beat`
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-report-schedules': {
+        'task': 'lims.tasks.dispatch_due_report_schedules',
+        'schedule': 60 * 60,
+    },
+    'weekly-efficiency-snapshots': {
+        'task': 'lims.tasks.generate_efficiency_snapshots_task',
+        'schedule': crontab(hour=5, minute=0, day_of_week='mon'),
+    },
+}
+# Absolute site root for links and images in emails sent outside a request
+SITE_URL = config('SITE_URL', default='')
+
+# COA release jobs: retries back off exponentially from the base delay (seconds)
+COA_RELEASE_MAX_RETRIES = config('COA_RELEASE_MAX_RETRIES', default=5, cast=int)
+COA_RELEASE_RETRY_BACKOFF = config('COA_RELEASE_RETRY_BACKOFF', default=30, cast=int)
+
+# Warm WeasyPrint process pool (lims.utils.pdf_pool); 0 workers renders inline
+PDF_RENDER_WORKERS = config('PDF_RENDER_WORKERS', default=2, cast=int)
+PDF_RENDER_QUEUE_SIZE = config('PDF_RENDER_QUEUE_SIZE', default=8, cast=int)
+PDF_RENDER_TIMEOUT = config('PDF_RENDER_TIMEOUT', default=120, cast=int)
+
+# COAs with more samples than this are rendered 20 samples at a time and stitched
+COA_CHUNKED_RENDER_THRESHOLD = config('COA_CHUNKED_RENDER_THRESHOLD', default=60, cast=int)
+
+# AI text generation (lims.utils.ai_providers): "gemini" or "stub" (offline).
+# Unset uses Gemini when GEMINI_API_KEY is present, the stub otherwise.
+AI_PROVIDER = config('AI_PROVIDER', default='') or None
+AI_MODEL = config('AI_MODEL', default='gemini-2.5-flash')
+
+# Manager report aggregates are reused for this long by the dashboard, PDF, Excel
+# and email views; any write that changes them bumps the data version first.
+# The version stamp and the entries live in the "reports" cache alias, which must
+# be shared by every web process and the Celery worker (database table by default).
+MANAGER_REPORT_CACHE_TTL = config('MANAGER_REPORT_CACHE_TTL', default=300, cast=int)
+REPORT_CACHE_BACKEND = config('REPORT_CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache')
+
+# Memoized COA interpretations. The Celery worker writes the memo and clears the
+# "pending" marker that the web process sets, so the backend must be shared by
+# both: the database table by default (created with `manage.py createcachetable`),
+# or django.core.cache.backends.redis.RedisCache. Entries expire after the TTL. The
+# database backend culls past MAX_ENTRIES in key order, not by recency; for true LRU
+# eviction use Redis with maxmemory-policy allkeys-lru.
+AI_SUMMARY_CACHE_BACKEND = config('AI_SUMMARY_CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': REPORT_CACHE_BACKEND,
+        'LOCATION': config('REPORT_CACHE_LOCATION', default='lims_report_cache'),
+        'OPTIONS': {} if 'redis' in REPORT_CACHE_BACKEND else {'MAX_ENTRIES': 1000},
+    },
+    'ai_summaries': {
+        'BACKEND': AI_SUMMARY_CACHE_BACKEND,
+        'LOCATION': config('AI_SUMMARY_CACHE_LOCATION', default='lims_ai_summary_cache'),
+        'TIMEOUT': config('AI_SUMMARY_CACHE_TTL', default=60 * 60 * 24 * 7, cast=int),
+        'OPTIONS': {} if 'redis' in AI_SUMMARY_CACHE_BACKEND else {'MAX_ENTRIES': 500},
+    },
+}
+
 LOGGING = {
     'version': 1,
     'handlers': {
@@ -81,6 +151,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'lims.utils.rollups.RollupBatchMiddleware',
+    'lims.utils.promotion.PromotionBatchMiddleware',
+    'lims.utils.coa_cache.CoaInvalidationBatchMiddleware',
 ]
 
 